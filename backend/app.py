@@ -1,6 +1,8 @@
+import os
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from datetime import datetime, timezone
+from utils.json_provider import FastJSONProvider
 
 # Import configuration
 from config import (
@@ -11,6 +13,8 @@ from config import (
 
 # --- INITIALIZATION ---
 app = Flask(__name__)
+# jsonify() across every blueprint encodes with orjson when it is installed
+app.json = FastJSONProvider(app)
 
 # --- PRODUCTION CORS CONFIGURATION ---
 # Define the live URL of your frontend
@@ -25,6 +29,8 @@ from utils.email_utils import _is_mail_configured, _send_password_reset_email
 from utils.auth_utils import validate_email, hash_password, verify_password
 from utils.menu_utils import get_menu_items, get_full_menu_with_categories, find_best_menu_match, find_similar_items
 from utils.cors_utils import _build_cors_preflight_response, cors_json_response
+from utils.resilience import start_deadline, clear_deadline, breaker_states
+from utils import metrics
 
 # --- BLUEPRINT IMPORTS (moved to end to avoid circular imports) ---
 from routes.recommendations import recommendation_bp
@@ -37,6 +43,8 @@ from routes.reservations import reservations_bp
 from routes.ai_features import ai_features_bp
 from routes.subscriptions import subscriptions_bp
 from routes.payments import payments_bp
+from routes.analytics import analytics_bp
+from services.analytics import sales_rollups
 
 # --- BLUEPRINT REGISTRATION ---
 app.register_blueprint(recommendation_bp, url_prefix='/recommendation')
@@ -49,6 +57,34 @@ app.register_blueprint(reservations_bp, url_prefix='/api')
 app.register_blueprint(ai_features_bp)
 app.register_blueprint(subscriptions_bp)
 app.register_blueprint(payments_bp)
+app.register_blueprint(analytics_bp)
+
+# --- REQUEST DEADLINE ---
+# Every request gets a latency budget; upstream calls shrink their timeouts to fit it
+@app.before_request
+def _start_request_deadline():
+    start_deadline()
+
+@app.teardown_request
+def _clear_request_deadline(exc=None):
+    clear_deadline()
+
+# --- BACKGROUND JOBS ---
+# Started by the first request a process serves rather than at import, so
+# the debug reloader's watcher process (which imports the app but never
+# serves it) and a gunicorn --preload master don't run their own copies.
+# ByteBot recommendations are precomputed off the request path
+BYTEBOT_PRECOMPUTE = os.getenv("BYTEBOT_PRECOMPUTE", "true").lower() in ("1", "true", "yes")
+# Sales rollups otherwise start on a worker's first analytics request; set
+# this on the one worker that should have them warm from its first request
+ANALYTICS_ROLLUPS = os.getenv("ANALYTICS_ROLLUPS", "false").lower() in ("1", "true", "yes")
+
+@app.before_request
+def _start_background_jobs():
+    if BYTEBOT_PRECOMPUTE:
+        byte_bot_service.start_scheduler()
+    if ANALYTICS_ROLLUPS:
+        sales_rollups.start()
 
 # --- MAIN ROUTES ---
 @app.route('/')
@@ -59,5 +95,10 @@ def index():
 def health_check():
     return jsonify({'status': 'healthy', 'timestamp': datetime.now(timezone.utc).isoformat()}), 200
 
+@app.route('/metrics', methods=['GET'])
+def metrics_snapshot():
+    """In-process metrics for this worker, including circuit breaker state."""
+    return jsonify({'breakers': breaker_states(), **metrics.snapshot()}), 200
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,88 @@
+import os
+import hmac
+from flask import Blueprint, request, jsonify
+from datetime import date, timedelta
+
+from services.analytics import sales_rollups, today_local
+
+analytics_bp = Blueprint('analytics', __name__)
+
+# How long the first report in a worker waits for the backfill before answering from partial rollups
+_BACKFILL_WAIT_SECONDS = float(os.getenv("ANALYTICS_BACKFILL_WAIT_SECONDS", "10"))
+
+@analytics_bp.before_request
+def _start_rollups():
+    if request.method == 'GET':
+        sales_rollups.ensure_started(_BACKFILL_WAIT_SECONDS)
+
+def _date_range():
+    """?from= and ?to= (inclusive, local dates); defaults to the last 7 days."""
+    end = date.fromisoformat(request.args['to']) if request.args.get('to') else today_local()
+    start = date.fromisoformat(request.args['from']) if request.args.get('from') else end - timedelta(days=6)
+    return start, end
+
+@analytics_bp.route('/api/analytics/summary', methods=['GET'])
+def analytics_summary():
+    """Totals and a per-day or per-hour (?granularity=hour) series for a date range."""
+    try:
+        start, end = _date_range()
+        granularity = request.args.get('granularity', 'day')
+        if granularity not in ('day', 'hour'):
+            return jsonify({"error": "granularity must be 'day' or 'hour'"}), 400
+        return jsonify({
+            **sales_rollups.summary(start, end),
+            "granularity": granularity,
+            "series": sales_rollups.series(start, end, granularity),
+            "status": sales_rollups.status(),
+        }), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@analytics_bp.route('/api/analytics/items', methods=['GET'])
+def analytics_items():
+    """Best-selling menu items for a date range, by ?sort=revenue|quantity."""
+    try:
+        start, end = _date_range()
+        limit = min(int(request.args.get('limit', 20)), 200)
+        sort = request.args.get('sort', 'revenue')
+        if sort not in ('revenue', 'quantity'):
+            return jsonify({"error": "sort must be 'revenue' or 'quantity'"}), 400
+        return jsonify({"from": start.isoformat(), "to": end.isoformat(),
+                        "items": sales_rollups.top_items(start, end, limit, sort)}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@analytics_bp.route('/api/analytics/categories', methods=['GET'])
+def analytics_categories():
+    """Sales per menu category for a date range."""
+    try:
+        start, end = _date_range()
+        return jsonify({"from": start.isoformat(), "to": end.isoformat(),
+                        "categories": sales_rollups.categories(start, end)}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@analytics_bp.route('/api/analytics/rebuild', methods=['POST'])
+def analytics_rebuild():
+    """
+    Admin-only: rebuild this worker's rollups from the full order history.
+    The rebuild runs on the rollup thread and replaces the current rollups
+    only once it has finished; returns 202 straight away. Progress shows up
+    as "rebuilding" in the summary's status.
+    """
+    expected = (os.getenv("ANALYTICS_ADMIN_SECRET") or "").strip()
+    if not expected:
+        return jsonify({"error": "Rebuild is disabled; set ANALYTICS_ADMIN_SECRET"}), 403
+    if not hmac.compare_digest(request.headers.get("X-Admin-Secret", ""), expected):
+        return jsonify({"error": "Unauthorized"}), 401
+    try:
+        sales_rollups.request_rebuild()
+        return jsonify({"message": "Analytics rebuild started", "status": sales_rollups.status()}), 202
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
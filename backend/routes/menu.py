@@ -1,82 +1,148 @@
 from flask import Blueprint, request, jsonify
+import json
 import requests
 
 # Import from config
 from config import SUPABASE_URL, headers
 # Import utilities
-from utils.menu_utils import get_menu_items, get_full_menu_with_categories
-from utils.cors_utils import _build_cors_preflight_response
+from utils.menu_utils import get_menu_items, get_full_menu_with_categories, get_menu_snapshot, invalidate_menu_snapshot
+from utils.http_cache import (
+    make_etag, normalized_args, not_modified, with_cache_headers, PUBLIC_CACHE,
+    EncodedBodyCache, encoded_not_modified, encoded_response
+)
+from utils.cors_utils import _build_cors_preflight_response, cors_json_response
+from utils.pagination import parse_content_range
+from services.menu_import import (
+    import_menu, iter_csv_rows, iter_ndjson_rows, iter_json_rows, MenuImportError
+)
+from services.menu_suggest import get_suggest_index, MAX_SUGGESTIONS
 
 menu_bp = Blueprint('menu', __name__)
 
+# Boolean query flags accepted by GET /menu: arg -> (menu_items column, required value)
+_MENU_FLAG_FILTERS = {
+    'veg_only': ('is_veg', True),
+    'is_vegan': ('is_vegan', True),
+    'is_gluten_free': ('is_gluten_free', True),
+    'nuts_free': ('contains_nuts', False),
+    'is_bestseller': ('is_bestseller', True),
+    'is_chef_spl': ('is_chef_spl', True),
+    'is_seasonal': ('is_seasonal', True),
+    'is_high_protein': ('is_high_protein', True),
+    'is_low_carb': ('is_low_carb', True),
+    'is_balanced': ('is_balanced', True),
+    'is_bulk_up': ('is_bulk_up', True),
+}
+# Exact-match query filters accepted by GET /menu: arg -> menu_items column
+_MENU_VALUE_FILTERS = {
+    'meal_time': 'meal_time',
+    'subscription_type': 'subscription_type',
+}
+
+_menu_bodies = EncodedBodyCache("menu_bodies")
+
+def build_menu(snapshot, args) -> list:
+    """The GET /menu body for `args`, filtered from the menu snapshot."""
+    flags = [(column, expected) for arg, (column, expected) in _MENU_FLAG_FILTERS.items()
+             if args.get(arg, 'false').lower() == 'true']
+    values = [(column, args[arg]) for arg, column in _MENU_VALUE_FILTERS.items() if args.get(arg)]
+    search_term = (args.get('search') or '').lower()
+
+    categories = {}
+    for item in snapshot.items:
+        # Same semantics as the PostgREST filters (eq.true / eq.false never match null)
+        if any(item.get(column) is not expected for column, expected in flags):
+            continue
+        if any(str(item.get(column)) != value for column, value in values):
+            continue
+        if search_term and search_term not in (item.get('name') or '').lower():
+            continue
+        category_id = item.get('category_id')
+        if category_id not in categories:
+            categories[category_id] = {
+                "category_id": category_id,
+                "category_name": item.get('category_name'),
+                "items": []
+            }
+        categories[category_id]["items"].append(
+            {k: v for k, v in item.items() if k != 'category_name'}
+        )
+    return list(categories.values())
+
 @menu_bp.route('/menu', methods=['GET'])
 def get_menu():
     """Fetches all menu items, with optional dynamic filters."""
     try:
-        select_query = "select=id,name,menu_items!inner(*)"
-        filters = []
-
-        # THIS IS THE FIX: Explicitly check for 'veg_only' from the frontend
-        if request.args.get('veg_only', 'false').lower() == 'true':
-            filters.append("menu_items.is_veg=eq.true")
-
-        # Handle the other dynamic filters
-        if request.args.get('is_vegan', 'false').lower() == 'true':
-            filters.append("menu_items.is_vegan=eq.true")
-        if request.args.get('is_gluten_free', 'false').lower() == 'true':
-            filters.append("menu_items.is_gluten_free=eq.true")
-        if request.args.get('nuts_free', 'false').lower() == 'true':
-             filters.append("menu_items.contains_nuts=eq.false")
-        
-        # Handle the new boolean filters
-        if request.args.get('is_bestseller', 'false').lower() == 'true':
-            filters.append("menu_items.is_bestseller=eq.true")
-        if request.args.get('is_chef_spl', 'false').lower() == 'true':
-            filters.append("menu_items.is_chef_spl=eq.true")
-        if request.args.get('is_seasonal', 'false').lower() == 'true':
-            filters.append("menu_items.is_seasonal=eq.true")
-
-        # Handle search query
-        search_term = request.args.get('search')
-        if search_term:
-            filters.append(f"menu_items.name=ilike.%{search_term}%")
-
-        # NEW: meal_time filtering (e.g., breakfast, lunch, snacks, dinner)
-        meal_time = request.args.get('meal_time')
-        if meal_time:
-            filters.append(f"menu_items.meal_time=eq.{meal_time}")
-
-        # NEW: fitness filters
-        if request.args.get('is_high_protein', 'false').lower() == 'true':
-            filters.append("menu_items.is_high_protein=eq.true")
-        if request.args.get('is_low_carb', 'false').lower() == 'true':
-            filters.append("menu_items.is_low_carb=eq.true")
-        if request.args.get('is_balanced', 'false').lower() == 'true':
-            filters.append("menu_items.is_balanced=eq.true")
-        if request.args.get('is_bulk_up', 'false').lower() == 'true':
-            filters.append("menu_items.is_bulk_up=eq.true")
-
-        # NEW: subscription/combo filter (column: subscription_type)
-        subscription_type = request.args.get('subscription_type')
-        if subscription_type:
-            filters.append(f"menu_items.subscription_type=eq.{subscription_type}")
-        
-        api_url = f"{SUPABASE_URL}/rest/v1/categories?{select_query}"
-        if filters:
-            api_url += "&" + "&".join(filters)
-            
-        response = requests.get(api_url, headers=headers)
-        response.raise_for_status()
-        data_from_supabase = response.json()
-        
-        menu_data = [
-            {"category_id": c['id'], "category_name": c['name'], "items": c['menu_items']}
-            for c in data_from_supabase if c.get('menu_items')
-        ]
-        return jsonify(menu_data)
+        snapshot = get_menu_snapshot(SUPABASE_URL, headers)
+        args_key = normalized_args()
+        etag = make_etag("menu", snapshot.version, args_key)
+        cached = encoded_not_modified(etag, PUBLIC_CACHE)
+        if cached is not None:
+            return cached
+
+        if request.args.get('search'):
+            # Free-text searches are too varied to be worth keeping encoded
+            return with_cache_headers(jsonify(build_menu(snapshot, request.args)), etag, PUBLIC_CACHE)
+
+        # Filter combinations are serialised and compressed once per menu version
+        body = _menu_bodies.get(snapshot.version, args_key, lambda: build_menu(snapshot, request.args), etag)
+        return encoded_response(body, PUBLIC_CACHE)
     except Exception as e:
         return jsonify({"error": "An internal server error occurred."}), 500
 
+@menu_bp.route('/menu/suggest', methods=['GET'])
+def suggest_menu():
+    """
+    Typeahead for menu search: ?q=<prefix>&limit=<n> returns the top dishes
+    whose name, category or tags start with the query, most popular first.
+    Answered from an in-memory index, so it is cheap enough to call per keystroke.
+    """
+    query = request.args.get('q', '')
+    try:
+        limit = int(request.args.get('limit', 8))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if not 1 <= limit <= MAX_SUGGESTIONS:
+        return jsonify({"error": f"limit must be between 1 and {MAX_SUGGESTIONS}"}), 400
+    try:
+        index = get_suggest_index(get_menu_snapshot(SUPABASE_URL, headers))
+        etag = make_etag("suggest", index.version, query, limit)
+        cached = not_modified(etag, PUBLIC_CACHE)
+        if cached is not None:
+            return cached
+        response = jsonify({"query": query, "suggestions": index.suggest(query, limit)})
+        return with_cache_headers(response, etag, PUBLIC_CACHE)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@menu_bp.route('/menu/changes', methods=['GET'])
+def get_menu_changes():
+    """
+    Delta sync for clients that keep a local copy of the menu.
+
+    ?since=<version> returns the items created or changed and the ids deleted
+    since that version, plus the new version to send next time. With no
+    usable version (first sync, or a version older than the retained log)
+    `reset` is true and `items` is the whole menu, which replaces the local copy.
+    A change may be sent again on a later sync; clients apply items and
+    deletions by id, so repeats are harmless.
+    """
+    try:
+        since = int(request.args.get('since', 0))
+    except ValueError:
+        return cors_json_response({"error": "since must be an integer version"}, 400)
+    try:
+        rpc_headers = {k: v for k, v in headers.items() if k != "Prefer"}
+        response = requests.post(
+            f"{SUPABASE_URL}/rest/v1/rpc/menu_changes_since",
+            json={"p_since": since},
+            headers=rpc_headers
+        )
+        response.raise_for_status()
+        return cors_json_response(response.json(), 200)
+    except Exception as e:
+        return cors_json_response({"error": str(e)}, 500)
+
 @menu_bp.route('/menu/<int:item_id>', methods=['DELETE'])
 def delete_menu_item(item_id):
     """Deletes a specific menu item by ID."""
@@ -86,6 +152,8 @@ def delete_menu_item(item_id):
         api_url = f"{SUPABASE_URL}/rest/v1/menu_items?id=eq.{item_id}"
         
         response = requests.delete(api_url, headers=headers)
+        if response.ok:
+            invalidate_menu_snapshot()
         
         if response.status_code == 204:  # Success, no content
             response = jsonify({"message": "Menu item deleted successfully"})
@@ -124,6 +192,8 @@ def update_menu_item_availability(item_id):
         update_payload = {"is_available": is_available}
         
         response = requests.patch(api_url, json=update_payload, headers=headers)
+        if response.ok:
+            invalidate_menu_snapshot()
         
         if response.status_code == 204:  # Success, no content
             response = jsonify({"message": "Availability updated successfully"})
@@ -184,6 +254,7 @@ def create_menu_item():
         response = requests.post(api_url, json=menu_item_data, headers=headers)
         
         if response.status_code == 201:
+            invalidate_menu_snapshot()
             created_item = response.json()[0]
             response = jsonify({
                 "message": "Menu item created successfully",
@@ -236,6 +307,8 @@ def update_menu_item(item_id):
         
         api_url = f"{SUPABASE_URL}/rest/v1/menu_items?id=eq.{item_id}"
         response = requests.patch(api_url, json=menu_item_data, headers=headers)
+        if response.ok:
+            invalidate_menu_snapshot()
         
         if response.status_code == 204:
             response = jsonify({"message": "Menu item updated successfully"})
@@ -257,13 +330,14 @@ def update_menu_item(item_id):
 def get_categories():
     """Returns all available menu categories."""
     try:
-        # Get categories from Supabase instead of hardcoded list
-        api_url = f"{SUPABASE_URL}/rest/v1/categories"
-        response = requests.get(api_url, headers=headers)
-        response.raise_for_status()
-        categories = response.json()
+        # Categories come from the menu snapshot; an unchanged menu is answered with a 304
+        snapshot = get_menu_snapshot(SUPABASE_URL, headers)
+        etag = make_etag("categories", snapshot.version)
+        cached = not_modified(etag, PUBLIC_CACHE, cors=True)
+        if cached is not None:
+            return cached
         
-        response = jsonify(categories)
+        response = with_cache_headers(jsonify(snapshot.category_rows), etag, PUBLIC_CACHE)
         response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 200
     except Exception as e:
@@ -302,6 +376,7 @@ def create_category():
         response = requests.post(api_url, json=category_data, headers=post_headers)
         
         if response.status_code == 201:
+            invalidate_menu_snapshot()
             created_category = response.json()[0]
             response = jsonify({
                 "message": "Category created successfully",
@@ -323,38 +398,24 @@ def create_category():
 def delete_category(category_id):
     """Deletes a category and all its menu items."""
     try:
-        
-        # First, delete all menu items in this category
-        menu_items_response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/menu_items?category_id=eq.{category_id}",
-            headers=headers
+        # The category and its items go in one transaction (database/menu_bulk.sql)
+        rpc_headers = {k: v for k, v in headers.items() if k != "Prefer"}
+        response = requests.post(
+            f"{SUPABASE_URL}/rest/v1/rpc/delete_category",
+            json={"p_category_id": category_id},
+            headers=rpc_headers
         )
-        menu_items_response.raise_for_status()
-        menu_items = menu_items_response.json()
-        
-        if menu_items:
-            # Delete all menu items in this category
-            for item in menu_items:
-                item_id = item['id']
-                delete_item_response = requests.delete(
-                    f"{SUPABASE_URL}/rest/v1/menu_items?id=eq.{item_id}",
-                    headers=headers
-                )
-                if delete_item_response.status_code not in [204, 200]:
-                    # Log error but continue with category deletion
-                    pass
-        
-        # Now delete the category
-        api_url = f"{SUPABASE_URL}/rest/v1/categories?id=eq.{category_id}"
-        response = requests.delete(api_url, headers=headers)
+        response.raise_for_status()
+        result = response.json()
 
-        # Supabase can return 200 or 204 for successful deletes
-        if response.status_code in [200, 204]:
-            response = jsonify({"message": "Category and all its items deleted successfully"})
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 200
-        else:
-            return jsonify({"error": "Failed to delete category"}), 500
+        if not result.get('ok'):
+            return cors_json_response({"error": "Category not found"}, 404)
+
+        invalidate_menu_snapshot()
+        return cors_json_response({
+            "message": "Category and all its items deleted successfully",
+            "items_deleted": result.get('items_deleted', 0)
+        }, 200)
             
     except Exception as e:
         import traceback
@@ -363,6 +424,114 @@ def delete_category(category_id):
         response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 500
 
+MAX_BULK_ITEMS = 1000
+
+@menu_bp.route('/menu/bulk', methods=['POST'])
+def bulk_update_menu_items():
+    """
+    Applies one change to many menu items in a single upstream request.
+
+    Body: {"action": "set_availability", "is_available": false, "ids": [1, 2]}
+          {"action": "set_price", "price": 149, "ids": [1, 2]}
+          {"action": "set_price", "prices": [{"id": 1, "price": 149}, ...]}
+          {"action": "delete", "ids": [1, 2]}
+    set_availability and delete may target "category_id" instead of "ids".
+    The response reports how many items were affected.
+    """
+    try:
+        data = request.get_json() or {}
+        action = data.get('action')
+        ids = data.get('ids')
+        category_id = data.get('category_id')
+
+        if action not in ('set_availability', 'set_price', 'delete'):
+            return cors_json_response({"error": "action must be set_availability, set_price or delete"}, 400)
+
+        if action == 'set_price' and data.get('prices') is not None:
+            prices = data['prices']
+            if not isinstance(prices, list) or not prices or len(prices) > MAX_BULK_ITEMS:
+                return cors_json_response({"error": f"prices must list 1 to {MAX_BULK_ITEMS} items"}, 400)
+            rpc_headers = {k: v for k, v in headers.items() if k != "Prefer"}
+            response = requests.post(
+                f"{SUPABASE_URL}/rest/v1/rpc/bulk_update_menu_prices",
+                json={"p_prices": prices},
+                headers=rpc_headers
+            )
+            if response.status_code == 400:
+                return cors_json_response({"error": response.json().get('message', 'Invalid prices')}, 400)
+            response.raise_for_status()
+            invalidate_menu_snapshot()
+            return cors_json_response({"action": action, "affected": response.json()}, 200)
+
+        # Every other form is one filtered PATCH/DELETE; the count comes back in Content-Range
+        if ids is not None:
+            if (not isinstance(ids, list) or not ids or len(ids) > MAX_BULK_ITEMS
+                    or not all(isinstance(i, int) for i in ids)):
+                return cors_json_response({"error": f"ids must list 1 to {MAX_BULK_ITEMS} item ids"}, 400)
+            target = f"id=in.({','.join(str(i) for i in ids)})"
+        elif category_id is not None and action != 'set_price':
+            target = f"category_id=eq.{int(category_id)}"
+        else:
+            return cors_json_response({"error": "ids (or category_id) is required"}, 400)
+
+        api_url = f"{SUPABASE_URL}/rest/v1/menu_items?{target}"
+        count_headers = {**headers, 'Prefer': 'return=minimal,count=exact'}
+        if action == 'set_availability':
+            if not isinstance(data.get('is_available'), bool):
+                return cors_json_response({"error": "is_available must be true or false"}, 400)
+            response = requests.patch(api_url, json={"is_available": data['is_available']}, headers=count_headers)
+        elif action == 'set_price':
+            price = data.get('price')
+            if not isinstance(price, (int, float)) or isinstance(price, bool) or price < 0:
+                return cors_json_response({"error": "price must be a non-negative number"}, 400)
+            response = requests.patch(api_url, json={"price": price}, headers=count_headers)
+        else:
+            response = requests.delete(api_url, headers=count_headers)
+        response.raise_for_status()
+        invalidate_menu_snapshot()
+
+        return cors_json_response({
+            "action": action,
+            "affected": parse_content_range(response.headers.get('Content-Range'))
+        }, 200)
+
+    except Exception as e:
+        return cors_json_response({"error": str(e)}, 500)
+
+@menu_bp.route('/menu/import', methods=['POST'])
+def import_menu_items():
+    """
+    Bulk-imports menu items from a CSV, NDJSON or JSON body (or a multipart
+    "file" upload), creating new items and updating existing ones by id or name.
+    ?dry_run=true only validates. Returns counts and per-row errors.
+    """
+    try:
+        dry_run = request.args.get('dry_run', 'false').lower() in ('1', 'true', 'yes')
+        upload = request.files.get('file')
+        if upload is not None:
+            filename = (upload.filename or '').lower()
+            if filename.endswith('.csv'):
+                rows = iter_csv_rows(upload.stream)
+            elif filename.endswith(('.ndjson', '.jsonl')):
+                rows = iter_ndjson_rows(upload.stream)
+            else:
+                rows = iter_json_rows(json.load(upload.stream))
+        elif request.mimetype == 'text/csv':
+            rows = iter_csv_rows(request.stream)
+        elif request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+            rows = iter_ndjson_rows(request.stream)
+        elif request.is_json:
+            rows = iter_json_rows(request.get_json())
+        else:
+            return cors_json_response({"error": "Send text/csv, application/x-ndjson or application/json"}, 415)
+
+        report = import_menu(rows, dry_run=dry_run)
+        return cors_json_response(report, 200)
+    except (MenuImportError, ValueError) as e:
+        return cors_json_response({"error": str(e)}, 400)
+    except Exception as e:
+        return cors_json_response({"error": str(e)}, 500)
+
 # OPTIONS handlers for CORS
 @menu_bp.route('/menu/<int:item_id>', methods=['OPTIONS'])
 def handle_menu_item_preflight(item_id):
@@ -372,3 +541,10 @@ def handle_menu_item_preflight(item_id):
 def handle_menu_availability_preflight(item_id):
     return _build_cors_preflight_response()
 
+@menu_bp.route('/menu/bulk', methods=['OPTIONS'])
+def handle_menu_bulk_preflight():
+    return _build_cors_preflight_response()
+
+@menu_bp.route('/menu/import', methods=['OPTIONS'])
+def handle_menu_import_preflight():
+    return _build_cors_preflight_response()
@@ -1,4 +1,5 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+import queue
 import requests
 import re
 from urllib.parse import quote
@@ -9,20 +10,38 @@ from config import (
 )
 # Import utilities
 from utils.cors_utils import cors_json_response, _build_cors_preflight_response
+from utils.idempotency import idempotent
+from utils.pagination import PageRequest, PaginationError, with_next_cursor
+from utils.http_cache import make_etag, not_modified, with_cache_headers, PRIVATE_CACHE
+from services.favorites_cache import get_favorites as get_cached_favorites, invalidate_favorites
+from services.order_events import order_event_bus, notify_order_changed, format_sse, ACTIVE_STATUSES
+from services.order_counts import order_counts, count_orders
+from services.order_export import export_orders
 from utils.menu_utils import get_menu_items, find_best_menu_match, find_similar_items
 
 orders_bp = Blueprint('orders', __name__)
 
+# Columns a client may request with ?fields= on order listings
+ORDER_FIELDS = (
+    "id", "user_id", "status", "total_amount", "delivery_address", "pickup_code",
+    "delivery_user_id", "table_session_id", "created_at",
+)
+# Columns of the favorited menu item a client may request on /users/<id>/favorites
+FAVORITE_ITEM_FIELDS = (
+    "id", "name", "description", "price", "image_url", "category_id", "is_available",
+    "is_veg", "is_vegan", "is_gluten_free", "contains_nuts", "is_bestseller", "is_chef_spl", "is_seasonal",
+)
+
 @orders_bp.route('/order', methods=['POST'])
+@idempotent
 def place_order():
     try:
         data = request.get_json()
         cart_items = data.get('items')
-        total_amount = data.get('total')
         user_id = data.get('user_id')
         delivery_address = data.get('address') # <-- Receive the address
 
-        if not all([cart_items, total_amount, user_id, delivery_address]):
+        if not all([cart_items, user_id, delivery_address]):
             return jsonify({"error": "Missing required order data including address"}), 400
 
         # Extract pickup code from delivery address for takeaway orders
@@ -32,41 +51,28 @@ def place_order():
             if code_match:
                 pickup_code = code_match.group(1)
 
-        order_payload = {
-            "total_amount": total_amount,
-            "status": "Preparing",
-            "user_id": user_id,
-            "delivery_address": delivery_address, # <-- Save the address to the database
+        # The order and its items are created in one transaction by the place_order
+        # database function (database/place_order.sql), which prices every line from
+        # menu_items. Client-side prices and totals are ignored.
+        rpc_payload = {
+            "p_user_id": user_id,
+            "p_delivery_address": delivery_address,
+            "p_pickup_code": pickup_code,
+            "p_items": [
+                {"menu_item_id": item['menu_item_id'], "quantity": item['quantity']}
+                for item in cart_items
+            ],
         }
-        
-        # Only add pickup_code if it exists (for takeaway orders)
-        if pickup_code:
-            order_payload["pickup_code"] = pickup_code
+        rpc_headers = {k: v for k, v in headers.items() if k != "Prefer"}
+        order_response = requests.post(f"{SUPABASE_URL}/rest/v1/rpc/place_order", json=rpc_payload, headers=rpc_headers)
 
-        order_response = requests.post(f"{SUPABASE_URL}/rest/v1/orders", json=order_payload, headers=headers)
+        if order_response.status_code != 200:
+            # PostgREST reports the function's validation errors as 400
+            status_code = 400 if order_response.status_code == 400 else 500
+            return jsonify({"error": f"Failed to create order: {order_response.text}"}), status_code
 
-        if order_response.status_code != 201:
-            return jsonify({"error": f"Failed to create order: {order_response.text}"}), 500
-            
-        order_response.raise_for_status()
-        new_order = order_response.json()[0]
-        order_id = new_order['id']
-
-        order_items_payload = [
-            {
-                "order_id": order_id, 
-                "menu_item_id": item['menu_item_id'],  # Use 'menu_item_id' from Flutter
-                "quantity": item['quantity'], 
-                "price_at_order": item['price_at_order'] # Use 'price_at_order' from Flutter and for the column name
-            } for item in cart_items
-        ]
-
-        items_response = requests.post(f"{SUPABASE_URL}/rest/v1/order_items", json=order_items_payload, headers=headers)
-        
-        if items_response.status_code != 201:
-            return jsonify({"error": f"Failed to create order items: {items_response.text}"}), 500
-            
-        items_response.raise_for_status()
+        order_id = order_response.json()
+        notify_order_changed(order_id, created=True)
 
         return jsonify({"message": "Order placed successfully!", "order_id": order_id}), 201
     except Exception as e:
@@ -75,16 +81,23 @@ def place_order():
     
 @orders_bp.route('/users/<string:user_id>/orders', methods=['GET'])
 def get_order_history(user_id):
-    """Fetches all past orders for a specific user."""
+    """
+    Fetches past orders for a specific user, most recent first.
+
+    Supports ?limit=&cursor= paging (next cursor in X-Next-Cursor), ?fields=
+    projection and ?status=, ?from=, ?to= (exclusive) filters.
+    """
+    try:
+        page = PageRequest(request.args, ORDER_FIELDS)
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 400
     try:
-        # Query the 'orders' table and filter by the user_id
-        # Order by creation date to show the most recent first
-        api_url = f"{SUPABASE_URL}/rest/v1/orders?user_id=eq.{user_id}&select=*&order=created_at.desc"
+        api_url = f"{SUPABASE_URL}/rest/v1/orders?user_id=eq.{user_id}&select={page.select()}{page.query()}"
         response = requests.get(api_url, headers=headers)
         response.raise_for_status()
         
-        orders = response.json()
-        return jsonify(orders)
+        orders, next_cursor = page.split(response.json())
+        return with_next_cursor(jsonify(orders), next_cursor)
     except Exception as e:
         return jsonify({"error": "An internal server error occurred."}), 500
     
@@ -105,12 +118,35 @@ def get_order_status(order_id):
 
 @orders_bp.route('/orders/count', methods=['GET'])
 def get_orders_count():
+    """
+    Number of orders. Unfiltered, it is served from the in-memory counters.
+    With ?status=, ?from=, ?to= (exclusive) or ?mode=exact|planned it is
+    counted by PostgREST with a HEAD request.
+    """
+    statuses = [s.strip() for s in request.args.get('status', '').split(',') if s.strip()]
+    date_from = request.args.get('from')
+    date_to = request.args.get('to')
+    mode = request.args.get('mode')
     try:
-        api_url = f"{SUPABASE_URL}/rest/v1/orders?select=id"
-        response = requests.get(api_url, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-        return jsonify({"count": len(data)}), 200
+        if statuses or date_from or date_to or mode:
+            count = count_orders(statuses, date_from, date_to, mode or "exact")
+        else:
+            count = order_counts.total()
+        return jsonify({"count": count}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@orders_bp.route('/orders/counts', methods=['GET'])
+def get_orders_counts():
+    """Dashboard counters: total, per status and per day for the last ?days= days (UTC, max 90)."""
+    try:
+        days = int(request.args.get('days', 7))
+    except ValueError:
+        return jsonify({"error": "days must be an integer"}), 400
+    try:
+        return jsonify(order_counts.snapshot(days)), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -228,6 +264,46 @@ def api_delivery_orders():
         traceback.print_exc()
         return cors_json_response({"error": str(e)}, 500)
 
+@orders_bp.route('/api/orders/stream', methods=['GET'])
+def api_orders_stream():
+    """
+    Server-sent events feed for the kitchen and delivery dashboards.
+
+    Sends a `snapshot` event with the current orders, then `order` events when an
+    order is added or changes and `removed` events when it leaves the requested
+    statuses. Filter with ?statuses=Preparing or ?statuses=Ready,Out for delivery
+    (default: all active statuses).
+    """
+    statuses = [s.strip() for s in request.args.get('statuses', '').split(',') if s.strip()]
+    unknown = [s for s in statuses if s not in ACTIVE_STATUSES]
+    if unknown:
+        return cors_json_response({"error": f"Unknown statuses: {', '.join(unknown)}"}, 400)
+    try:
+        subscriber, snapshot = order_event_bus.subscribe(statuses or None)
+    except Exception as e:
+        return cors_json_response({"error": str(e)}, 500)
+
+    def generate():
+        try:
+            yield format_sse("snapshot", snapshot)
+            while True:
+                if subscriber.overflowed:
+                    yield format_sse("snapshot", order_event_bus.resnapshot(subscriber))
+                try:
+                    event, payload = subscriber.queue.get(timeout=15)
+                except queue.Empty:
+                    # Keeps proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(event, payload)
+        finally:
+            order_event_bus.unsubscribe(subscriber)
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response
+
 @orders_bp.route('/api/delivery/orders/<int:order_id>/accept', methods=['POST'])
 def api_delivery_accept(order_id: int):
     """Delivery user accepts an order → mark as Out for delivery and assign delivery_user_id."""
@@ -272,6 +348,7 @@ def api_delivery_accept(order_id: int):
             )
 
         resp.raise_for_status()
+        notify_order_changed(order_id, previous_status=current_status)
         return cors_json_response({"message": "Order accepted for delivery"}, 200)
     except Exception as e:
         import traceback
@@ -375,6 +452,7 @@ def api_delivery_delivered(order_id: int):
         )
 
         resp.raise_for_status()
+        notify_order_changed(order_id, previous_status=current_status)
         return cors_json_response({"message": "Order marked as delivered successfully"}, 200)
     except Exception as e:
         import traceback
@@ -383,14 +461,52 @@ def api_delivery_delivered(order_id: int):
 
 @orders_bp.route('/orders', methods=['GET'])
 def get_all_orders():
+    """
+    Lists orders, most recent first.
+
+    Supports ?limit=&cursor= paging (next cursor in X-Next-Cursor), ?fields=
+    projection and ?status=, ?from=, ?to= (exclusive) filters. Without limit or
+    cursor every matching order is returned, as before.
+    """
+    try:
+        page = PageRequest(request.args, ORDER_FIELDS)
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 400
     try:
-        api_url = f"{SUPABASE_URL}/rest/v1/orders?select=*&order=created_at.desc"
+        api_url = f"{SUPABASE_URL}/rest/v1/orders?select={page.select()}{page.query()}"
         response = requests.get(api_url, headers=headers)
         response.raise_for_status()
-        return jsonify(response.json()), 200
+        orders, next_cursor = page.split(response.json())
+        return with_next_cursor(jsonify(orders), next_cursor), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@orders_bp.route('/orders/export', methods=['GET'])
+def export_orders_stream():
+    """
+    Streams orders as CSV or NDJSON (?format=csv|ndjson), one row per order or
+    per order item (?rows=orders|items). Accepts ?status=, ?from=, ?to=
+    (exclusive), and ?gzip=true for a gzip-encoded stream.
+    """
+    try:
+        page = PageRequest(request.args, ORDER_FIELDS)
+        fmt = request.args.get('format', 'csv')
+        rows = request.args.get('rows', 'orders')
+        use_gzip = request.args.get('gzip', 'false').lower() in ('1', 'true', 'yes')
+        chunks = export_orders(fmt, rows, page.statuses, page.date_from, page.date_to, gzip=use_gzip)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    extension = 'csv' if fmt == 'csv' else 'ndjson'
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    response = Response(chunks, mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="orders-{rows}.{extension}"'
+    response.headers['X-Accel-Buffering'] = 'no'
+    if use_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response
+
 @orders_bp.route('/orders/<int:order_id>/items', methods=['GET'])
 def get_order_items(order_id):
     """Returns all items for a specific order with menu item details."""
@@ -438,6 +554,7 @@ def update_order_status(order_id):
         
         response = requests.patch(api_url, json=update_data, headers=headers)
         response.raise_for_status()
+        notify_order_changed(order_id)
         
         response_data = jsonify({"message": "Order status updated successfully"})
         response_data.headers.add('Access-Control-Allow-Origin', '*')
@@ -449,13 +566,34 @@ def update_order_status(order_id):
     
 @orders_bp.route('/users/<string:user_id>/favorites', methods=['GET'])
 def get_favorites(user_id):
-    """Gets a user's favorite items using the Supabase REST API."""
+    """
+    Gets a user's favorite items, most recently favorited first.
+
+    Supports ?limit=&cursor= paging (next cursor in X-Next-Cursor) and ?fields=
+    projection of the menu item columns. The plain list is cached and carries
+    an ETag, so an unchanged list is revalidated with a 304.
+    """
+    try:
+        page = PageRequest(request.args, FAVORITE_ITEM_FIELDS, filterable=False)
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 400
     try:
-        api_url = f"{SUPABASE_URL}/rest/v1/favorites?user_id=eq.{user_id}&select=menu_items(*)"
+        if not page.paginated and not page.fields:
+            entry = get_cached_favorites(user_id)
+            etag = make_etag("favorites", user_id, entry.version)
+            cached = not_modified(etag, PRIVATE_CACHE)
+            if cached is not None:
+                return cached
+            return with_cache_headers(jsonify(entry.items), etag, PRIVATE_CACHE)
+
+        item_fields = ",".join(page.fields) if page.fields else "*"
+        api_url = f"{SUPABASE_URL}/rest/v1/favorites?user_id=eq.{user_id}&select=id,created_at,menu_items({item_fields}){page.query()}"
         response = requests.get(api_url, headers=headers)
         response.raise_for_status()
-        favorite_items = [item['menu_items'] for item in response.json() if item.get('menu_items')]
-        return jsonify(favorite_items)
+        # The cursor is taken from the favorites rows, not the menu items
+        favorites, next_cursor = page.split(response.json())
+        favorite_items = [item['menu_items'] for item in favorites if item.get('menu_items')]
+        return with_next_cursor(jsonify(favorite_items), next_cursor)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -466,6 +604,7 @@ def add_favorite():
         data = request.get_json()
         payload = {"user_id": data['user_id'], "menu_item_id": data['menu_item_id']}
         response = requests.post(f"{SUPABASE_URL}/rest/v1/favorites", json=payload, headers=headers)
+        invalidate_favorites(data['user_id'])
         response.raise_for_status()
         return jsonify(response.json()), 201
     except Exception as e:
@@ -482,6 +621,7 @@ def remove_favorite():
         menu_item_id = data['menu_item_id']
         api_url = f"{SUPABASE_URL}/rest/v1/favorites?user_id=eq.{user_id}&menu_item_id=eq.{menu_item_id}"
         response = requests.delete(api_url, headers=headers)
+        invalidate_favorites(user_id)
         response.raise_for_status()
         return jsonify({"message": "Favorite removed successfully."}), 200
     except Exception as e:
@@ -535,6 +675,7 @@ def add_items_to_order():
             })
 
         supabase.table('order_items').insert(items_to_insert).execute()
+        notify_order_changed(order_id)
 
         return jsonify({"message": "Items added to order successfully", "order_id": order_id}), 200
 
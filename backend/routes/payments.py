@@ -3,10 +3,12 @@ import razorpay
 
 # Import from config
 from config import razorpay_client as client
+from utils.idempotency import idempotent
 
 payments_bp = Blueprint('payments', __name__)
 
 @payments_bp.route('/create-razorpay-order', methods=['POST'])
+@idempotent
 def create_razorpay_order():
     try:
         data = request.get_json()
@@ -1,9 +1,14 @@
 from flask import Blueprint, request, jsonify
 import requests
-from datetime import datetime, timedelta
 
 # Import from config
 from config import SUPABASE_URL, SUPABASE_KEY
+from utils.idempotency import idempotent
+from utils.http_cache import make_etag, not_modified, with_cache_headers, PUBLIC_CACHE
+from services.subscription_cache import (
+    get_plans_snapshot, get_plan, get_entitlement, remember_subscription,
+    update_remaining_credits, invalidate_entitlement
+)
 
 subscriptions_bp = Blueprint('subscriptions', __name__)
 
@@ -11,17 +16,12 @@ subscriptions_bp = Blueprint('subscriptions', __name__)
 def get_subscription_plans():
     """Fetch all available subscription plans."""
     try:
-        headers = {
-            'apikey': SUPABASE_KEY,
-            'Authorization': f'Bearer {SUPABASE_KEY}',
-            'Content-Type': 'application/json'
-        }
-        
-        response = requests.get(f"{SUPABASE_URL}/rest/v1/subscription_plans?select=*&is_active=eq.true", headers=headers)
-        response.raise_for_status()
-        
-        plans = response.json()
-        return jsonify(plans), 200
+        snapshot = get_plans_snapshot()
+        etag = make_etag("plans", snapshot.version)
+        cached = not_modified(etag, PUBLIC_CACHE)
+        if cached is not None:
+            return cached
+        return with_cache_headers(jsonify(snapshot.active), etag, PUBLIC_CACHE), 200
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -30,20 +30,16 @@ def get_subscription_plans():
 def get_subscription_plan(plan_id):
     """Fetch a specific subscription plan by ID."""
     try:
-        headers = {
-            'apikey': SUPABASE_KEY,
-            'Authorization': f'Bearer {SUPABASE_KEY}',
-            'Content-Type': 'application/json'
-        }
-        
-        response = requests.get(f"{SUPABASE_URL}/rest/v1/subscription_plans?select=*&id=eq.{plan_id}", headers=headers)
-        response.raise_for_status()
-        
-        plans = response.json()
-        if not plans:
+        snapshot = get_plans_snapshot()
+        plan = snapshot.by_id.get(plan_id)
+        if not plan:
             return jsonify({"error": "Subscription plan not found"}), 404
-            
-        return jsonify(plans[0]), 200
+
+        etag = make_etag("plan", plan_id, snapshot.version)
+        cached = not_modified(etag, PUBLIC_CACHE)
+        if cached is not None:
+            return cached
+        return with_cache_headers(jsonify(plan), etag, PUBLIC_CACHE), 200
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -97,6 +93,7 @@ def get_subscription_history(user_id):
         return jsonify({"error": str(e)}), 500
 
 @subscriptions_bp.route('/subscriptions', methods=['POST'])
+@idempotent
 def create_subscription():
     """Create a new subscription for a user."""
     try:
@@ -108,90 +105,43 @@ def create_subscription():
         
         if not all([user_id, plan_id, payment_id, payment_order_id]):
             return jsonify({"error": "Missing required fields"}), 400
+        try:
+            plan_id = int(plan_id)
+        except (TypeError, ValueError):
+            return jsonify({"error": "plan_id must be an integer"}), 400
+        
+        # Plan details come from the in-process plans cache
+        plan = get_plan(plan_id)
+        if not plan:
+            return jsonify({"error": "Subscription plan not found"}), 404
         
         headers = {
             'apikey': SUPABASE_KEY,
             'Authorization': f'Bearer {SUPABASE_KEY}',
             'Content-Type': 'application/json',
-            'Prefer': 'return=minimal'
-        }
-        
-        # First, get the plan details
-        plan_response = requests.get(f"{SUPABASE_URL}/rest/v1/subscription_plans?select=*&id=eq.{plan_id}", headers=headers)
-        plan_response.raise_for_status()
-        plans = plan_response.json()
-        
-        if not plans:
-            return jsonify({"error": "Subscription plan not found"}), 404
-            
-        plan = plans[0]
-        
-        # Calculate subscription dates
-        start_date = datetime.now().date()
-        end_date = start_date + timedelta(days=plan['duration_days'])
-        
-        # Create subscription
-        subscription_data = {
-            'user_id': user_id,
-            'plan_id': plan_id,
-            'start_date': start_date.isoformat(),
-            'end_date': end_date.isoformat(),
-            'status': 'active',
-            'remaining_credits': plan['credits'],
-            'total_credits': plan['credits'],
-            'auto_renew': True
+            'Prefer': 'return=representation'
         }
         
+        # The subscription, its payment record and the initial credit transaction are
+        # inserted together by the create_subscription database function
+        # (database/create_subscription.sql), which returns the new row.
         subscription_response = requests.post(
-            f"{SUPABASE_URL}/rest/v1/user_subscriptions",
-            json=subscription_data,
+            f"{SUPABASE_URL}/rest/v1/rpc/create_subscription",
+            json={
+                'p_user_id': user_id,
+                'p_plan_id': plan_id,
+                'p_payment_id': payment_id,
+                'p_payment_order_id': payment_order_id
+            },
             headers=headers
         )
         subscription_response.raise_for_status()
-        
-        # Get the created subscription ID
-        subscription_id_response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/user_subscriptions?select=id&user_id=eq.{user_id}&order=created_at.desc&limit=1",
-            headers=headers
-        )
-        subscription_id_response.raise_for_status()
-        subscription_id = subscription_id_response.json()[0]['id']
-        
-        # Create payment record
-        payment_data = {
-            'subscription_id': subscription_id,
-            'amount': plan['price'],
-            'payment_method': 'razorpay',
-            'payment_status': 'completed',
-            'razorpay_payment_id': payment_id,
-            'razorpay_order_id': payment_order_id
-        }
-
-        payment_response = requests.post(
-            f"{SUPABASE_URL}/rest/v1/subscription_payments",
-            json=payment_data,
-            headers=headers
-        )
-        payment_response.raise_for_status()
-        
-        # Create initial credit transaction
-        credit_transaction_data = {
-            'subscription_id': subscription_id,
-            'credits_used': 0,  # 0 because it's a purchase, not usage
-            'transaction_type': 'purchased',
-            'description': f'Subscription purchase: {plan["name"]}'
-        }
-        
-        credit_response = requests.post(
-            f"{SUPABASE_URL}/rest/v1/credit_transactions",
-            json=credit_transaction_data,
-            headers=headers
-        )
-        credit_response.raise_for_status()
+        subscription = subscription_response.json()[0]
+        remember_subscription(subscription)
         
         return jsonify({
             "message": "Subscription created successfully",
-            "subscription_id": subscription_id,
+            "subscription_id": subscription['id'],
             "plan": plan
         }), 201
         
@@ -220,6 +170,7 @@ def cancel_subscription(subscription_id):
             headers=headers
         )
         response.raise_for_status()
+        invalidate_entitlement(subscription_id)
         
         return jsonify({"message": "Subscription cancelled successfully"}), 200
         
@@ -262,58 +213,38 @@ def use_credits(subscription_id):
         headers = {
             'apikey': SUPABASE_KEY,
             'Authorization': f'Bearer {SUPABASE_KEY}',
-            'Content-Type': 'application/json',
-            'Prefer': 'return=minimal'
+            'Content-Type': 'application/json'
         }
         
-        # Get current subscription
-        subscription_response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/user_subscriptions?select=*&id=eq.{subscription_id}",
+        # Check, decrement and ledger insert happen in one transaction inside the
+        # use_credits database function (database/use_credits.sql). The decrement is a
+        # conditional UPDATE, so concurrent orders can't both pass the balance check.
+        rpc_response = requests.post(
+            f"{SUPABASE_URL}/rest/v1/rpc/use_credits",
+            json={
+                'p_subscription_id': subscription_id,
+                'p_order_id': order_id,
+                'p_credits': credits_to_use
+            },
             headers=headers
         )
-        subscription_response.raise_for_status()
-        subscriptions = subscription_response.json()
-        
-        if not subscriptions:
-            return jsonify({"error": "Subscription not found"}), 404
-            
-        subscription = subscriptions[0]
-        
-        if subscription['remaining_credits'] < credits_to_use:
+        if rpc_response.status_code == 400:
+            return jsonify({"error": rpc_response.json().get('message', 'Invalid request')}), 400
+        rpc_response.raise_for_status()
+        result = rpc_response.json()
+        
+        if not result.get('ok'):
+            if result.get('error') == 'not_found':
+                invalidate_entitlement(subscription_id)
+                return jsonify({"error": "Subscription not found"}), 404
+            update_remaining_credits(subscription_id, result['remaining_credits'])
             return jsonify({"error": "Insufficient credits"}), 400
         
-        # Update remaining credits
-        new_remaining = subscription['remaining_credits'] - credits_to_use
-        update_data = {
-            'remaining_credits': new_remaining
-        }
-        
-        update_response = requests.patch(
-            f"{SUPABASE_URL}/rest/v1/user_subscriptions?id=eq.{subscription_id}",
-            json=update_data,
-            headers=headers
-        )
-        update_response.raise_for_status()
-        
-        # Create credit transaction record
-        transaction_data = {
-            'subscription_id': subscription_id,
-            'order_id': order_id,
-            'credits_used': credits_to_use,
-            'transaction_type': 'used',
-            'description': f'Used {credits_to_use} credits for order #{order_id}'
-        }
-        
-        transaction_response = requests.post(
-            f"{SUPABASE_URL}/rest/v1/credit_transactions",
-            json=transaction_data,
-            headers=headers
-        )
-        transaction_response.raise_for_status()
+        update_remaining_credits(subscription_id, result['remaining_credits'])
         
         return jsonify({
             "message": "Credits used successfully",
-            "remaining_credits": new_remaining
+            "remaining_credits": result['remaining_credits']
         }), 200
         
     except Exception as e:
@@ -329,35 +260,22 @@ def check_credits(subscription_id):
         if not order_amount:
             return jsonify({"error": "Missing order_amount"}), 400
         
-        headers = {
-            'apikey': SUPABASE_KEY,
-            'Authorization': f'Bearer {SUPABASE_KEY}',
-            'Content-Type': 'application/json'
-        }
-        
-        # Get subscription with plan details
-        response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/user_subscriptions?select=*,subscription_plans(*)&id=eq.{subscription_id}",
-            headers=headers
-        )
-        response.raise_for_status()
-        subscriptions = response.json()
-        
-        if not subscriptions:
+        # Served from the entitlement cache; only a cold entry costs a round-trip
+        entitlement = get_entitlement(subscription_id)
+        if entitlement is None:
             return jsonify({"error": "Subscription not found"}), 404
-            
-        subscription = subscriptions[0]
-        plan = subscription['subscription_plans']
         
-        # Calculate credits needed (1 credit per ₹1, up to max meal price)
-        credits_needed = min(int(order_amount), plan['max_meal_price'])
-        has_enough_credits = subscription['remaining_credits'] >= credits_needed
+        # Calculate credits needed (1 credit per ₹1, up to max meal price when the plan sets one)
+        credits_needed = int(order_amount)
+        if entitlement.max_meal_price is not None:
+            credits_needed = min(credits_needed, entitlement.max_meal_price)
+        has_enough_credits = entitlement.remaining_credits >= credits_needed
         
         return jsonify({
             "has_enough_credits": has_enough_credits,
             "credits_needed": credits_needed,
-            "remaining_credits": subscription['remaining_credits'],
-            "max_meal_price": plan['max_meal_price']
+            "remaining_credits": entitlement.remaining_credits,
+            "max_meal_price": entitlement.max_meal_price
         }), 200
         
     except Exception as e:
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark JSON encoding of representative API payloads.
+
+Compares Flask's default provider (stdlib json) with the app's
+FastJSONProvider (orjson when installed) on synthetic payloads shaped like
+the menu, the order listing, the kitchen feed and a voice-assistant cart.
+
+Usage:
+    python scripts/bench_json.py
+    python scripts/bench_json.py --repeat 200 --scale 2
+"""
+
+import os
+import sys
+import time
+import uuid
+import random
+import argparse
+import decimal
+from datetime import datetime, timedelta, timezone
+
+# Add the backend directory to the Python path to import utils
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from utils.json_provider import FastJSONProvider, orjson
+
+_WORDS = "paneer tikka masala butter garlic naan dal makhani biryani mango lassi crispy spicy smoky".split()
+
+def _text(rng, words):
+    return " ".join(rng.choice(_WORDS) for _ in range(words))
+
+def menu_payload(rng, scale):
+    categories = []
+    item_id = 1
+    for category_id in range(1, 10):
+        items = []
+        for _ in range(35 * scale):
+            items.append({
+                "id": item_id, "name": _text(rng, 3).title(), "description": _text(rng, 18),
+                "price": round(rng.uniform(80, 650), 2), "image_url": f"https://cdn.example.com/menu/{item_id}.jpg",
+                "category_id": category_id, "is_available": rng.random() > 0.1, "is_veg": rng.random() > 0.4,
+                "is_vegan": rng.random() > 0.8, "is_gluten_free": rng.random() > 0.8,
+                "is_bestseller": rng.random() > 0.85, "is_chef_spl": rng.random() > 0.9,
+                "is_seasonal": rng.random() > 0.9, "contains_nuts": rng.random() > 0.7,
+                "meal_time": rng.choice(["breakfast", "lunch", "snacks", "dinner"]),
+                "tags": [rng.choice(_WORDS) for _ in range(4)],
+            })
+            item_id += 1
+        categories.append({"category_id": category_id, "category_name": _text(rng, 2).title(), "items": items})
+    return categories
+
+def orders_payload(rng, scale):
+    now = datetime.now(timezone.utc)
+    return [{
+        "id": order_id, "user_id": str(uuid.uuid4()), "status": rng.choice(["Preparing", "Ready", "Delivered"]),
+        "total_amount": decimal.Decimal(f"{rng.uniform(150, 3000):.2f}"),
+        "delivery_address": _text(rng, 8), "pickup_code": None,
+        "created_at": (now - timedelta(minutes=order_id)).isoformat(),
+    } for order_id in range(1000 * scale)]
+
+def kitchen_payload(rng, scale):
+    now = datetime.now(timezone.utc)
+    return [{
+        "order_id": order_id, "status": "Preparing", "customer_name": _text(rng, 2).title(),
+        "table_info": f"Table {rng.randint(1, 30)}", "created_at": now - timedelta(minutes=order_id),
+        "items": [{"name": _text(rng, 3).title(), "quantity": rng.randint(1, 4),
+                   "price": round(rng.uniform(80, 650), 2)} for _ in range(rng.randint(1, 6))],
+    } for order_id in range(150 * scale)]
+
+def cart_payload(rng, scale):
+    return {
+        "response": _text(rng, 40), "intent": "add_to_cart",
+        "new_context": {"booking_flow_step": None, "guest_count": 2, "last_mentioned_item": _text(rng, 2)},
+        "cart": [{"menu_item_id": i, "name": _text(rng, 3).title(), "quantity": rng.randint(1, 3),
+                  "price": round(rng.uniform(80, 650), 2)} for i in range(12 * scale)],
+    }
+
+def bench(provider, payload, repeat):
+    provider.dumps(payload)  # warm-up
+    started = time.perf_counter()
+    for _ in range(repeat):
+        provider.dumps(payload)
+    return (time.perf_counter() - started) / repeat * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSON encoding of API payloads.")
+    parser.add_argument('--repeat', type=int, default=100)
+    parser.add_argument('--scale', type=int, default=1, help='Multiply payload sizes')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    app = Flask(__name__)
+    stdlib = DefaultJSONProvider(app)
+    fast = FastJSONProvider(app)
+    payloads = {
+        "menu": menu_payload(rng, args.scale),
+        "orders": orders_payload(rng, args.scale),
+        "kitchen feed": kitchen_payload(rng, args.scale),
+        "voice cart": cart_payload(rng, args.scale),
+    }
+
+    print(f"encoder: {'orjson ' + orjson.__version__ if orjson else 'stdlib (orjson not installed)'}")
+    print(f"{'payload':<14}{'bytes':>10}{'stdlib ms':>12}{'fast ms':>10}{'speed-up':>10}")
+    for name, payload in payloads.items():
+        size = len(stdlib.dumps(payload).encode("utf-8"))
+        stdlib_ms = bench(stdlib, payload, args.repeat)
+        fast_ms = bench(fast, payload, args.repeat)
+        print(f"{name:<14}{size:>10}{stdlib_ms:>12.3f}{fast_ms:>10.3f}{stdlib_ms / fast_ms:>9.1f}x")
+
+if __name__ == "__main__":
+    main()
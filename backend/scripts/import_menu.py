@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Bulk-import menu items from a CSV, NDJSON or JSON file.
+
+Usage:
+    python scripts/import_menu.py menu.csv
+    python scripts/import_menu.py menu.json --dry-run
+    python scripts/import_menu.py menu.ndjson --no-embed
+
+Existing items (matched by id, or by name) are updated; the rest are created.
+See services/menu_import.py for the recognised columns.
+"""
+
+import os
+import sys
+import json
+import argparse
+
+# Add the backend directory to the Python path to import services
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.menu_import import import_menu, iter_csv_rows, iter_ndjson_rows, iter_json_rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-import menu items.")
+    parser.add_argument('path', help='CSV, NDJSON (.ndjson/.jsonl) or JSON file')
+    parser.add_argument('--dry-run', action='store_true', help='Validate only; write nothing')
+    parser.add_argument('--no-embed', action='store_true', help='Skip re-embedding the imported items')
+    args = parser.parse_args()
+
+    path = args.path.lower()
+    with open(args.path, 'rb') as f:
+        if path.endswith('.csv'):
+            rows = iter_csv_rows(f)
+        elif path.endswith(('.ndjson', '.jsonl')):
+            rows = iter_ndjson_rows(f)
+        else:
+            rows = iter_json_rows(json.load(f))
+        report = import_menu(rows, dry_run=args.dry_run, reembed=not args.no_embed, wait_for_embeddings=True)
+
+    for error in report['errors']:
+        print(f"row {error['row']}: {error['error']}")
+    print(f"{report['received']} rows: {report['inserted']} inserted, {report['updated']} updated, "
+          f"{report['failed']} failed{' (dry run)' if report['dry_run'] else ''}")
+    sys.exit(1 if report['failed'] else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Renew or expire due subscriptions in bulk. Meant to run from cron once a day.
+
+Usage:
+    python scripts/process_subscription_renewals.py
+    python scripts/process_subscription_renewals.py --as-of 2025-01-31 --workers 16 --checkpoint /tmp/renewals.json
+    python scripts/process_subscription_renewals.py --dry-run
+
+Requires the index and function in database/subscription_renewals.sql.
+"""
+
+import os
+import sys
+import argparse
+from datetime import date
+
+# Add the backend directory to the Python path to import services
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.subscription_renewals import (
+    process_due_subscriptions, DEFAULT_PAGE_SIZE, DEFAULT_CHUNK_SIZE, DEFAULT_WORKERS
+)
+
+def main():
+    parser = argparse.ArgumentParser(description="Renew or expire due subscriptions in bulk.")
+    parser.add_argument('--as-of', type=date.fromisoformat, default=date.today(),
+                        help='Process subscriptions that ended before this date (default: today)')
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--checkpoint', default=os.getenv('SUBSCRIPTION_RENEWALS_CHECKPOINT'),
+                        help='Resume file; an interrupted run continues from here '
+                             '(default: $SUBSCRIPTION_RENEWALS_CHECKPOINT, otherwise none)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Only count what would change (renewals are counted as if paid)')
+    args = parser.parse_args()
+
+    stats = process_due_subscriptions(
+        as_of=args.as_of,
+        page_size=args.page_size,
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+        checkpoint_path=args.checkpoint,
+        dry_run=args.dry_run,
+    )
+    print(f"Done: {stats['scanned']} due subscriptions ({stats['renewed']} renewed, "
+          f"{stats['pending_payment']} awaiting payment, {stats['expired']} expired, "
+          f"{stats['applied']} applied) in {stats['elapsed_seconds']}s, {stats['per_second']} subscriptions/s")
+
+if __name__ == "__main__":
+    main()
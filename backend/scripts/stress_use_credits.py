@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Concurrency check for POST /subscriptions/<id>/use-credits.
+
+Fires N parallel use-credits calls at a running backend and verifies that the
+subscription was never overspent: the final balance must equal the starting
+balance minus the credits of the calls that succeeded, never go below zero,
+and every successful call must have exactly one ledger row.
+
+Usage:
+    python scripts/stress_use_credits.py --subscription-id 42 --order-id 1001
+    python scripts/stress_use_credits.py --subscription-id 42 --order-id 1001 --calls 100 --credits 5 --base-url http://localhost:5000
+
+Run it against a test subscription: it really spends the credits.
+"""
+
+import os
+import sys
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# Add the backend directory to the Python path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import SUPABASE_URL, SUPABASE_KEY
+
+headers = {
+    'apikey': SUPABASE_KEY,
+    'Authorization': f'Bearer {SUPABASE_KEY}',
+    'Content-Type': 'application/json'
+}
+
+def get_remaining_credits(subscription_id):
+    response = requests.get(
+        f"{SUPABASE_URL}/rest/v1/user_subscriptions?select=remaining_credits&id=eq.{subscription_id}",
+        headers=headers
+    )
+    response.raise_for_status()
+    rows = response.json()
+    if not rows:
+        sys.exit(f"Subscription {subscription_id} not found")
+    return rows[0]['remaining_credits']
+
+def count_ledger_rows(subscription_id, order_id):
+    response = requests.head(
+        f"{SUPABASE_URL}/rest/v1/credit_transactions?subscription_id=eq.{subscription_id}&order_id=eq.{order_id}&transaction_type=eq.used",
+        headers={**headers, 'Prefer': 'count=exact'}
+    )
+    response.raise_for_status()
+    return int(response.headers['Content-Range'].split('/')[-1])
+
+def use_credits(base_url, subscription_id, order_id, credits):
+    response = requests.post(
+        f"{base_url}/subscriptions/{subscription_id}/use-credits",
+        json={'order_id': order_id, 'credits_used': credits},
+        timeout=30
+    )
+    return response.status_code
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://localhost:5000')
+    parser.add_argument('--subscription-id', type=int, required=True)
+    parser.add_argument('--order-id', type=int, required=True, help='Order id recorded on the ledger rows')
+    parser.add_argument('--calls', type=int, default=100)
+    parser.add_argument('--credits', type=int, default=1, help='Credits spent per call')
+    args = parser.parse_args()
+
+    start_balance = get_remaining_credits(args.subscription_id)
+    start_ledger = count_ledger_rows(args.subscription_id, args.order_id)
+    print(f"Starting balance: {start_balance} credits; firing {args.calls} parallel calls of {args.credits}")
+
+    with ThreadPoolExecutor(max_workers=args.calls) as pool:
+        statuses = list(pool.map(
+            lambda _: use_credits(args.base_url, args.subscription_id, args.order_id, args.credits),
+            range(args.calls)
+        ))
+
+    succeeded = statuses.count(200)
+    rejected = statuses.count(400)
+    errors = len(statuses) - succeeded - rejected
+    end_balance = get_remaining_credits(args.subscription_id)
+    new_ledger_rows = count_ledger_rows(args.subscription_id, args.order_id) - start_ledger
+
+    print(f"Succeeded: {succeeded}, rejected (insufficient credits): {rejected}, errors: {errors}")
+    print(f"Final balance: {end_balance}; new ledger rows: {new_ledger_rows}")
+
+    expected_successes = min(args.calls, start_balance // args.credits)
+    failures = []
+    if end_balance < 0:
+        failures.append("balance went negative")
+    if end_balance != start_balance - succeeded * args.credits:
+        failures.append("balance does not match the successful calls")
+    if new_ledger_rows != succeeded:
+        failures.append("ledger rows do not match the successful calls")
+    if errors == 0 and succeeded != expected_successes:
+        failures.append(f"expected {expected_successes} successful calls")
+
+    if failures:
+        print("FAILED: " + "; ".join(failures))
+        sys.exit(1)
+    print("OK: no overspend")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,487 @@
+"""
+Incremental sales rollups.
+
+Orders and order_items are folded into in-memory rollups as they arrive, and
+the reports are answered from those rollups without touching raw orders:
+
+- per hour and per day: orders, revenue, item quantity
+- per day and menu item / category: quantity, revenue
+
+Rows are read with keyset paging on their ids, ascending. The same routine
+serves the initial backfill, which streams the whole history a page at a
+time, and the incremental catch-up, which reads only the rows past the
+watermarks. Ids are handed out at insert time but become visible at
+commit, so a row can appear after a higher id was already ingested. Ids
+skipped near the head are therefore remembered and re-fetched on later
+catch-ups until they show up or age out (rolled-back inserts never will).
+The catch-up runs whenever the order event bus reports a change and on a
+timer, which picks up orders written by other workers.
+
+Buckets use the restaurant's local time (IST). Rollups start on the first
+analytics request in a worker, or on its first request of any kind when
+ANALYTICS_ROLLUPS is set, so workers that never serve reports never scan the order history.
+
+Revenue is sales as ordered (quantity x price_at_order), counting only
+orders in SALE_STATUSES: carts still at 'active' and cancelled orders are
+left out. Each order's share is kept, so a status change moves it in or out
+of the rollups. This worker's changes apply at once. Orders not yet in a
+final status are re-read on each catch-up to pick up changes made
+elsewhere. Items added to an open table order count toward the hour the
+order was opened.
+"""
+import os
+import time
+import threading
+from datetime import date, datetime, timedelta, timezone
+
+from config import SUPABASE_URL, SUPABASE_KEY
+from utils import metrics
+from utils.resilience import get_breaker, guarded_request, clear_deadline
+from services.order_events import order_event_bus
+
+REPORTING_TZ = timezone(timedelta(hours=5, minutes=30))
+PAGE_SIZE = 1000  # PostgREST's default max_rows
+CATCHUP_INTERVAL_SECONDS = int(os.getenv("ANALYTICS_CATCHUP_SECONDS", "60"))
+# Ids missing below the newest one seen may belong to transactions that
+# haven't committed yet: they are re-fetched on every catch-up while within
+# GAP_WINDOW_IDS of the newest id and younger than GAP_RECHECK_SECONDS
+GAP_WINDOW_IDS = int(os.getenv("ANALYTICS_GAP_WINDOW_IDS", "1000"))
+GAP_RECHECK_SECONDS = int(os.getenv("ANALYTICS_GAP_RECHECK_SECONDS", "900"))
+GAP_FETCH_BATCH = 200
+# Orders count as sales only in these statuses (compared case-insensitively):
+# carts still being filled ('active') and cancelled orders are left out
+SALE_STATUSES = frozenset(
+    status.strip().lower()
+    for status in os.getenv("ANALYTICS_SALE_STATUSES", "Preparing,Ready,Out for delivery,Delivered,Completed,Paid").split(",")
+    if status.strip()
+)
+# Orders in any other status can still change; other workers' changes are
+# picked up by re-reading them on each catch-up for this many days
+FINAL_STATUSES = frozenset(("delivered", "completed", "cancelled", "canceled", "deleted"))
+STATUS_RECHECK_DAYS = int(os.getenv("ANALYTICS_STATUS_RECHECK_DAYS", "7"))
+MAX_RANGE_DAYS = 366
+
+_supabase_breaker = get_breaker("supabase")
+
+def _headers():
+    return {
+        'apikey': SUPABASE_KEY,
+        'Authorization': f'Bearer {SUPABASE_KEY}',
+        'Content-Type': 'application/json'
+    }
+
+def _local_hour(created_at) -> datetime:
+    moment = datetime.fromisoformat(str(created_at).replace("Z", "+00:00"))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(REPORTING_TZ).replace(minute=0, second=0, microsecond=0)
+
+def _is_sale(status) -> bool:
+    return (status or "").strip().lower() in SALE_STATUSES
+
+def _is_final(status) -> bool:
+    return (status or "").strip().lower() in FINAL_STATUSES
+
+def today_local() -> date:
+    return datetime.now(REPORTING_TZ).date()
+
+def _fetch_page(table: str, select: str, after_id: int) -> list:
+    response = guarded_request(
+        _supabase_breaker, "GET",
+        f"{SUPABASE_URL}/rest/v1/{table}?select={select}&id=gt.{after_id}&order=id.asc&limit={PAGE_SIZE}",
+        headers=_headers(), timeout=30
+    )
+    response.raise_for_status()
+    return response.json()
+
+def _fetch_ids(table: str, select: str, ids: list) -> list:
+    response = guarded_request(
+        _supabase_breaker, "GET",
+        f"{SUPABASE_URL}/rest/v1/{table}?select={select}&id=in.({','.join(str(i) for i in ids)})&order=id.asc",
+        headers=_headers(), timeout=30
+    )
+    response.raise_for_status()
+    return response.json()
+
+_ORDER_SELECT = "id,created_at,status"
+_ITEM_SELECT = "id,order_id,quantity,price_at_order,menu_item_id,orders(created_at,status),menu_items(name,categories(name))"
+
+class _OrderSales:
+    """One order's share of the rollups, kept so it can be moved when the order's status changes."""
+    __slots__ = ("hour", "status", "counted", "revenue", "quantity", "items", "categories")
+
+    def __init__(self, hour: datetime):
+        self.hour = hour
+        self.status = None
+        self.counted = False
+        self.revenue = 0.0
+        self.quantity = 0
+        # key -> [quantity, revenue]
+        self.items = {}
+        self.categories = {}
+
+class _RollupState:
+    """One complete set of rollups and the watermarks it was built up to."""
+
+    def __init__(self):
+        # bucket -> [orders, revenue, quantity]
+        self.hourly = {}
+        self.daily = {}
+        # day -> {key: [quantity, revenue]}
+        self.items_daily = {}
+        self.categories_daily = {}
+        self.item_names = {}
+        # order id -> _OrderSales, and the ids whose status may still change
+        self.orders = {}
+        self.open_orders = set()
+        self.last_order_id = 0
+        self.last_item_id = 0
+        # kind -> {missing id: monotonic time first noticed}
+        self.gaps = {'orders': {}, 'items': {}}
+        self.backfilled = False
+        self.last_ingest_at = None
+
+    def _add_totals(self, hour: datetime, orders: int, revenue: float, quantity: int,
+                    items: dict, categories: dict, sign: int = 1):
+        day = hour.date().isoformat()
+        for table, key in ((self.hourly, hour.isoformat()), (self.daily, day)):
+            totals = table.setdefault(key, [0, 0.0, 0])
+            totals[0] += sign * orders
+            totals[1] += sign * revenue
+            totals[2] += sign * quantity
+            if not totals[0] and not totals[2]:
+                del table[key]
+        for table, lines in ((self.items_daily, items), (self.categories_daily, categories)):
+            bucket = table.setdefault(day, {})
+            for key, (line_quantity, line_revenue) in lines.items():
+                totals = bucket.setdefault(key, [0, 0.0])
+                totals[0] += sign * line_quantity
+                totals[1] += sign * line_revenue
+                if not totals[0]:
+                    del bucket[key]
+
+    def _order(self, order_id, created_at):
+        sales = self.orders.get(order_id)
+        if sales is None and created_at:
+            sales = self.orders[order_id] = _OrderSales(_local_hour(created_at))
+        return sales
+
+    def set_status(self, order_id, status):
+        """Record an order's status, moving its sales in or out of the rollups."""
+        sales = self.orders.get(order_id)
+        if sales is None or sales.status == status:
+            return
+        sales.status = status
+        counted = _is_sale(status)
+        if counted != sales.counted:
+            sales.counted = counted
+            self._add_totals(sales.hour, 1, sales.revenue, sales.quantity,
+                             sales.items, sales.categories, 1 if counted else -1)
+        if _is_final(status):
+            self.open_orders.discard(order_id)
+        else:
+            self.open_orders.add(order_id)
+
+    def add_order(self, order: dict):
+        if self._order(order['id'], order.get('created_at')) is not None:
+            self.set_status(order['id'], order.get('status'))
+
+    def add_item(self, item: dict):
+        order = item.get('orders') or {}
+        order_id = item.get('order_id')
+        sales = self._order(order_id, order.get('created_at'))
+        if sales is None:
+            return
+        if sales.status is None:
+            # The order row itself hasn't been ingested yet
+            self.set_status(order_id, order.get('status'))
+        quantity = item.get('quantity') or 0
+        revenue = quantity * float(item.get('price_at_order') or 0)
+        menu_item = item.get('menu_items') or {}
+        item_id = item.get('menu_item_id')
+        if menu_item.get('name'):
+            self.item_names[item_id] = menu_item['name']
+        category = (menu_item.get('categories') or {}).get('name') or 'Uncategorized'
+
+        sales.revenue += revenue
+        sales.quantity += quantity
+        for lines, key in ((sales.items, item_id), (sales.categories, category)):
+            totals = lines.setdefault(key, [0, 0.0])
+            totals[0] += quantity
+            totals[1] += revenue
+        if sales.counted:
+            self._add_totals(sales.hour, 0, revenue, quantity,
+                             {item_id: (quantity, revenue)}, {category: (quantity, revenue)})
+
+    def stale_open_orders(self) -> list:
+        """Open orders old enough that their status is no longer re-checked."""
+        cutoff = datetime.now(REPORTING_TZ) - timedelta(days=STATUS_RECHECK_DAYS)
+        return [order_id for order_id in self.open_orders if self.orders[order_id].hour < cutoff]
+
+    def ingest(self, kind: str, rows: list):
+        for row in rows:
+            if kind == 'orders':
+                self.add_order(row)
+            else:
+                self.add_item(row)
+
+    def note_gaps(self, kind: str, previous_id: int, page: list):
+        """Remember ids skipped between consecutive rows near the head."""
+        gaps = self.gaps[kind]
+        now = time.monotonic()
+        newest = page[-1]['id']
+        floor = newest - GAP_WINDOW_IDS
+        for row in page:
+            for missing in range(max(previous_id + 1, floor), row['id']):
+                gaps.setdefault(missing, now)
+            previous_id = row['id']
+        for missing in [i for i in gaps if i < floor]:
+            del gaps[missing]
+
+class SalesRollups:
+    """Serves reports from the current rollups and keeps them caught up."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ingest_lock = threading.RLock()
+        self._wake = threading.Event()
+        self._ready = threading.Event()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._rebuild_requested = False
+        self._rebuilding = False
+        self._state = _RollupState()
+
+    # --- Ingestion ---
+
+    def _recheck_gaps(self, state: _RollupState, kind: str, table: str, select: str) -> int:
+        """Fold in rows that committed after later ids were already ingested."""
+        with self._lock:
+            gaps = state.gaps[kind]
+            now = time.monotonic()
+            for missing in [i for i, noticed in gaps.items() if now - noticed > GAP_RECHECK_SECONDS]:
+                del gaps[missing]
+            pending = sorted(gaps)
+        found = 0
+        for start in range(0, len(pending), GAP_FETCH_BATCH):
+            rows = _fetch_ids(table, select, pending[start:start + GAP_FETCH_BATCH])
+            with self._lock:
+                # Ingest only ids still outstanding, never the same row twice
+                rows = [row for row in rows if state.gaps[kind].pop(row['id'], None) is not None]
+                state.ingest(kind, rows)
+            found += len(rows)
+        if found:
+            metrics.incr(f"analytics.late_{kind}", found)
+        return found
+
+    def _recheck_statuses(self, state: _RollupState) -> int:
+        """Re-read open orders so status changes made by other workers move their sales."""
+        with self._lock:
+            for order_id in state.stale_open_orders():
+                state.open_orders.discard(order_id)
+            pending = sorted(state.open_orders)
+        changed = 0
+        for start in range(0, len(pending), GAP_FETCH_BATCH):
+            batch = pending[start:start + GAP_FETCH_BATCH]
+            statuses = {row['id']: row.get('status') for row in _fetch_ids("orders", "id,status", batch)}
+            with self._lock:
+                for order_id in batch:
+                    # A deleted order no longer counts
+                    status = statuses.get(order_id, 'Deleted')
+                    if state.orders[order_id].status != status:
+                        state.set_status(order_id, status)
+                        changed += 1
+        if changed:
+            metrics.incr("analytics.status_changes", changed)
+        return changed
+
+    def catch_up(self, log=None, state: _RollupState = None) -> dict:
+        """
+        Fold every order and order item past the watermarks into the rollups,
+        one page at a time, then any rows that filled an earlier id gap. From
+        empty rollups this is the full backfill. `state` defaults to the
+        rollups being served.
+        """
+        with self._ingest_lock:
+            state = state or self._state
+            started = time.perf_counter()
+            stats = {'orders': 0, 'items': 0, 'status_changes': 0}
+            for table, select, kind in (("orders", _ORDER_SELECT, 'orders'),
+                                        ("order_items", _ITEM_SELECT, 'items')):
+                while True:
+                    after_id = state.last_order_id if kind == 'orders' else state.last_item_id
+                    page = _fetch_page(table, select, after_id)
+                    if not page:
+                        break
+                    with self._lock:
+                        state.ingest(kind, page)
+                        state.note_gaps(kind, after_id, page)
+                        if kind == 'orders':
+                            state.last_order_id = page[-1]['id']
+                        else:
+                            state.last_item_id = page[-1]['id']
+                    stats[kind] += len(page)
+                    if log:
+                        log(f"analytics: {stats['orders']} orders, {stats['items']} items ingested")
+                    if len(page) < PAGE_SIZE:
+                        break
+                stats[kind] += self._recheck_gaps(state, kind, table, select)
+            stats['status_changes'] = self._recheck_statuses(state)
+            with self._lock:
+                state.backfilled = True
+                state.last_ingest_at = datetime.now(timezone.utc).isoformat()
+                if state is self._state:
+                    self._ready.set()
+            metrics.incr("analytics.orders_ingested", stats['orders'])
+            metrics.incr("analytics.items_ingested", stats['items'])
+            metrics.observe("analytics.catch_up_ms", (time.perf_counter() - started) * 1000)
+            return stats
+
+    def rebuild(self, log=None) -> dict:
+        """
+        Backfill fresh rollups from the full history, then swap them in. The
+        current rollups keep serving reports until the rebuild has finished,
+        and stay in place if it fails. Takes as long as the history is big, so
+        run it off the request path (see request_rebuild).
+        """
+        with self._ingest_lock:
+            state = _RollupState()
+            stats = self.catch_up(log, state)
+            with self._lock:
+                self._state = state
+                self._ready.set()
+            return stats
+
+    def request_rebuild(self):
+        """Rebuild on the rollup thread, starting it if needed. Returns immediately."""
+        with self._lock:
+            self._rebuild_requested = True
+        self.start()
+        self._wake.set()
+
+    def on_order_event(self, order, previous_status, created):
+        with self._lock:
+            # Known orders move at once; new ones arrive with the catch-up
+            self._state.set_status(order['order_id'], order['status'])
+        self._wake.set()
+
+    def start(self):
+        """Backfill in the background, then keep catching up on events and on a timer."""
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="sales-rollups", daemon=True)
+            self._thread.start()
+
+    def ensure_started(self, wait_seconds: float = 0) -> bool:
+        """Start on first use; wait up to `wait_seconds` for the backfill. True once backfilled."""
+        self.start()
+        return self._ready.wait(wait_seconds)
+
+    def _run(self):
+        # Backfills take as long as they take; no request deadline applies here
+        clear_deadline()
+        while True:
+            with self._lock:
+                rebuild, self._rebuild_requested = self._rebuild_requested, False
+                self._rebuilding = rebuild
+            try:
+                if rebuild:
+                    stats = self.rebuild()
+                    print(f"Analytics rebuilt: {stats['orders']} orders, {stats['items']} items")
+                else:
+                    self.catch_up()
+            except Exception as e:
+                print(f"Analytics {'rebuild' if rebuild else 'catch-up'} failed: {e}")
+            finally:
+                with self._lock:
+                    self._rebuilding = False
+            if self._rebuild_requested:
+                continue
+            self._wake.wait(CATCHUP_INTERVAL_SECONDS)
+            self._wake.clear()
+
+    # --- Queries ---
+
+    def status(self) -> dict:
+        with self._lock:
+            state = self._state
+            return {
+                'backfilled': state.backfilled,
+                'rebuilding': self._rebuilding or self._rebuild_requested,
+                'last_order_id': state.last_order_id,
+                'last_item_id': state.last_item_id,
+                'last_ingest_at': state.last_ingest_at,
+                'pending_gaps': {kind: len(gaps) for kind, gaps in state.gaps.items()},
+            }
+
+    @staticmethod
+    def _days(start: date, end: date) -> list:
+        if end < start:
+            raise ValueError("'to' must not be before 'from'")
+        if (end - start).days >= MAX_RANGE_DAYS:
+            raise ValueError(f"Date range is limited to {MAX_RANGE_DAYS} days")
+        return [(start + timedelta(days=n)).isoformat() for n in range((end - start).days + 1)]
+
+    def series(self, start: date, end: date, granularity: str = "day") -> list:
+        """Orders, revenue and item quantity per day or hour in [start, end]."""
+        days = self._days(start, end)
+        series = []
+        with self._lock:
+            for day in days:
+                if granularity == "hour":
+                    for hour in range(24):
+                        key = f"{day}T{hour:02d}:00:00+05:30"
+                        totals = self._state.hourly.get(key)
+                        if totals:
+                            series.append({'bucket': key, 'orders': totals[0],
+                                           'revenue': round(totals[1], 2), 'quantity': totals[2]})
+                else:
+                    totals = self._state.daily.get(day, [0, 0.0, 0])
+                    series.append({'bucket': day, 'orders': totals[0],
+                                   'revenue': round(totals[1], 2), 'quantity': totals[2]})
+        return series
+
+    def summary(self, start: date, end: date) -> dict:
+        orders = revenue = quantity = 0
+        with self._lock:
+            for day in self._days(start, end):
+                totals = self._state.daily.get(day)
+                if totals:
+                    orders += totals[0]
+                    revenue += totals[1]
+                    quantity += totals[2]
+        return {'from': start.isoformat(), 'to': end.isoformat(), 'orders': orders,
+                'revenue': round(revenue, 2), 'quantity': quantity,
+                'average_order_value': round(revenue / orders, 2) if orders else 0.0}
+
+    def _breakdown(self, table: str, start: date, end: date) -> dict:
+        merged = {}
+        with self._lock:
+            table = getattr(self._state, table)
+            for day in self._days(start, end):
+                for key, (quantity, revenue) in table.get(day, {}).items():
+                    totals = merged.setdefault(key, [0, 0.0])
+                    totals[0] += quantity
+                    totals[1] += revenue
+        return merged
+
+    def top_items(self, start: date, end: date, limit: int = 20, sort: str = "revenue") -> list:
+        merged = self._breakdown('items_daily', start, end)
+        item_names = self._state.item_names
+        index = 1 if sort == "revenue" else 0
+        ranked = sorted(merged.items(), key=lambda kv: kv[1][index], reverse=True)[:limit]
+        return [{'menu_item_id': item_id, 'name': item_names.get(item_id),
+                 'quantity': quantity, 'revenue': round(revenue, 2)}
+                for item_id, (quantity, revenue) in ranked]
+
+    def categories(self, start: date, end: date) -> list:
+        merged = self._breakdown('categories_daily', start, end)
+        ranked = sorted(merged.items(), key=lambda kv: kv[1][1], reverse=True)
+        return [{'category': name, 'quantity': quantity, 'revenue': round(revenue, 2)}
+                for name, (quantity, revenue) in ranked]
+
+sales_rollups = SalesRollups()
+order_event_bus.add_listener(sales_rollups.on_order_event)
@@ -1,12 +1,45 @@
 import os
 import json
-import requests
+import hashlib
+import threading
+import itertools
 from datetime import datetime, timezone, timedelta
 from groq import Groq
+from utils import metrics
+from utils.resilience import get_breaker, guarded_request
+from utils.singleflight import SingleFlight
+
+# Recommendations are precomputed per (weekday, 30-minute bucket, menu version)
+BUCKET_MINUTES = 30
+POOL_SIZE = int(os.getenv("BYTEBOT_POOL_SIZE", "3"))
+REFRESH_INTERVAL_SECONDS = int(os.getenv("BYTEBOT_REFRESH_SECONDS", "60"))
+# How many buckets (current + upcoming) the scheduler keeps warm
+BUCKETS_AHEAD = 2
+MAX_CACHED_BUCKETS = 16
+
+PLACEHOLDER_RECOMMENDATION = {
+    "dish": {
+        "name": "Chef's Special",
+        "description": "A delightful seasonal pick while ByteBot warms up.",
+        "image_url": "https://via.placeholder.com/600x400.png?text=Chef%27s%20Special",
+        "tags": ["popular", "seasonal"]
+    },
+    "reason": "Temporary recommendation shown while AI initializes."
+}
+
+def _ist_now():
+    # Using IST for Bengaluru
+    return datetime.now(timezone.utc) + timedelta(hours=5, minutes=30)
+
+def _bucket_start(moment: datetime) -> datetime:
+    return moment.replace(minute=(moment.minute // BUCKET_MINUTES) * BUCKET_MINUTES, second=0, microsecond=0)
 
 class ByteBot:
     """
     A class to encapsulate the AI recommendation logic for the ByteEat app.
+
+    Groq is only ever called from a background scheduler that precomputes a small
+    pool of recommendations per time bucket; `get_recommendation` just reads it.
     """
     def __init__(self, supabase_url: str, supabase_headers: dict):
         """
@@ -18,7 +51,20 @@ class ByteBot:
         """
         self.supabase_url = supabase_url
         self.supabase_headers = supabase_headers
+        self.groq_breaker = get_breaker("groq")
+        self.supabase_breaker = get_breaker("supabase")
         self.model = self._configure_model()
+        # Concurrent precompute triggers for the same bucket share one Groq call
+        self._flight = SingleFlight("bytebot_recommendation")
+
+        self._lock = threading.Lock()
+        self._pools = {}  # (weekday, bucket_index, menu_version) -> [recommendation, ...]
+        self._rotation = itertools.count()
+        self._menu_items = []
+        self._menu_version = None
+        self._wakeup = threading.Event()
+        self._scheduler = None
+        self._start_lock = threading.Lock()
 
     def _configure_model(self):
         """Configures and returns the Groq AI model client."""
@@ -29,71 +75,142 @@ class ByteBot:
 
                 return None
             # CHANGE: Initialize the Groq client
-            client = Groq(api_key=api_key)
+            # Retries are left to the circuit breaker so a degraded Groq can't stall a worker
+            client = Groq(api_key=api_key, max_retries=0)
 
             return client
         except Exception as e:
 
             return None
 
+    # --- Request path (never calls Groq or Supabase) ---
+
     def get_recommendation(self):
         """
-        Generates a dish recommendation by querying the Gemini AI model.
+        Returns the precomputed recommendation for the current time bucket,
+        rotating through the bucket's pool. Falls back to a deterministic pick
+        from the last known menu until the scheduler has filled the bucket.
 
         Returns:
-            A dictionary containing the recommended dish and the reason,
-            or an error dictionary.
+            A (dictionary, status_code) tuple with the recommended dish and the reason.
         """
-        if not self.model:
-            # Graceful fallback: return a simple deterministic recommendation
+        now = _ist_now()
+        with self._lock:
+            pool = self._pools.get(self._bucket_key(now, self._menu_version))
+            menu_items = self._menu_items
+
+        if pool:
+            metrics.incr("bytebot.precomputed_hit")
+            return pool[next(self._rotation) % len(pool)], 200
+
+        metrics.incr("bytebot.precomputed_miss")
+        self._wakeup.set()
+        return self._fallback_recommendation(menu_items, now), 200
+
+    def _fallback_recommendation(self, menu_items: list, moment: datetime):
+        if not menu_items:
+            return PLACEHOLDER_RECOMMENDATION
+        # Deterministic per bucket so the homepage doesn't flicker between requests
+        index = self._bucket_index(moment) % len(menu_items)
+        return {
+            "dish": menu_items[index],
+            "reason": "Showing a recommendation while AI initializes."
+        }
+
+    # --- Background precomputation ---
+
+    def start_scheduler(self):
+        """Starts the daemon thread that keeps the current and upcoming buckets warm; idempotent."""
+        if self._scheduler is not None:
+            return
+        with self._start_lock:
+            if self._scheduler is None:
+                self._scheduler = threading.Thread(target=self._run_scheduler, name="bytebot-precompute", daemon=True)
+                self._scheduler.start()
+
+    def _run_scheduler(self):
+        while True:
             try:
-                menu_response = requests.get(
-                    f"{self.supabase_url}/rest/v1/menu_items?select=name,description,tags,image_url",
-                    headers=self.supabase_headers
-                )
-                menu_response.raise_for_status()
-                menu_items = menu_response.json()
-                if not menu_items:
-                    return {"error": "Menu is empty."}, 503
-                fallback_dish = menu_items[0]
-                return {
-                    "dish": fallback_dish,
-                    "reason": "Showing a recommendation while AI initializes."
-                }, 200
+                self.refresh()
             except Exception as e:
-                # Last-resort placeholder so the UI can render
-                return {
-                    "dish": {
-                        "name": "Chef's Special",
-                        "description": "A delightful seasonal pick while ByteBot warms up.",
-                        "image_url": "https://via.placeholder.com/600x400.png?text=Chef%27s%20Special",
-                        "tags": ["popular", "seasonal"]
-                    },
-                    "reason": "Temporary recommendation shown while AI initializes."
-                }, 200
-
+                print(f"ByteBot precompute failed: {e}")
+            self._wakeup.wait(REFRESH_INTERVAL_SECONDS)
+            self._wakeup.clear()
+
+    def refresh(self):
+        """Reloads the menu and precomputes any missing pools for the next few buckets."""
+        menu_items = self._fetch_menu()
+        if menu_items:
+            version = hashlib.sha1(json.dumps(menu_items, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+            with self._lock:
+                self._menu_items = menu_items
+                self._menu_version = version
+        with self._lock:
+            menu_items, version = self._menu_items, self._menu_version
+        if not menu_items:
+            return
+
+        start = _bucket_start(_ist_now())
+        for offset in range(BUCKETS_AHEAD):
+            moment = start + timedelta(minutes=BUCKET_MINUTES * offset)
+            key = self._bucket_key(moment, version)
+            with self._lock:
+                if key in self._pools:
+                    continue
+            pool = self._flight.do(key, self._compute_pool, menu_items, moment)
+            if pool:
+                self._store_pool(key, pool)
+
+    def _store_pool(self, key, pool):
+        with self._lock:
+            self._pools[key] = pool
+            # Drop the oldest buckets (dicts keep insertion order)
+            while len(self._pools) > MAX_CACHED_BUCKETS:
+                self._pools.pop(next(iter(self._pools)))
+        metrics.set_gauge("bytebot.precomputed_buckets", len(self._pools))
+
+    def _bucket_index(self, moment: datetime) -> int:
+        return (moment.hour * 60 + moment.minute) // BUCKET_MINUTES
+
+    def _bucket_key(self, moment: datetime, menu_version):
+        return (moment.weekday(), self._bucket_index(moment), menu_version)
+
+    def _fetch_menu(self):
         try:
-            # 1. Fetch the entire menu from Supabase to give the AI context
-            menu_response = requests.get(
+            menu_response = guarded_request(
+                self.supabase_breaker, "GET",
                 f"{self.supabase_url}/rest/v1/menu_items?select=name,description,tags,image_url",
                 headers=self.supabase_headers
             )
             menu_response.raise_for_status()
-            menu_items = menu_response.json()
+            return menu_response.json()
+        except Exception as e:
+            print(f"ByteBot menu fetch failed: {e}")
+            return []
 
+    def _compute_pool(self, menu_items: list, moment: datetime):
+        """
+        Asks the Groq model for a small pool of distinct recommendations for the
+        given time bucket.
+
+        Returns:
+            A list of {"dish": ..., "reason": ...} dictionaries (empty on failure).
+        """
+        if not self.model or self.groq_breaker.is_open():
+            return []
+
+        try:
             # Format the menu for the AI prompt
             menu_for_prompt = ", ".join([f"'{item['name']}'" for item in menu_items])
 
-            # 2. Engineer the prompt with real-time context
-            # Using IST for Bengaluru
-            current_time = datetime.now(timezone.utc) + timedelta(hours=5, minutes=30)
+            # Engineer the prompt with the bucket's context
             prompt = f"""
             You are ByteBot, the intelligent culinary curator for a restaurant named "ByteEat" in Bengaluru, India.
-            Your goal is to provide a single, perfect dish recommendation based on the current context.
+            Your goal is to provide dish recommendations based on the current context.
 
             **Current Context:**
-            - Time: {current_time.strftime('%I:%M %p')}
-            - Day: {current_time.strftime('%A')}
+            - Time: {moment.strftime('%I:%M %p')}
+            - Day: {moment.strftime('%A')}
             - Location: Bengaluru, India
 
             **Available Menu Items:**
@@ -101,40 +218,37 @@ class ByteBot:
 
             **Your Task:**
             1. Analyze the context (e.g., a weekday morning is for a light breakfast, a Friday night is for a celebratory meal).
-            2. Select the ONE most suitable dish from the provided menu list.
-            3. Generate a compelling, one-sentence reason for your choice, mentioning the context.
+            2. Select the {POOL_SIZE} most suitable, distinct dishes from the provided menu list.
+            3. Generate a compelling, one-sentence reason for each choice, mentioning the context.
             4. Return your response ONLY in the following JSON format, with no other text or markdown:
             {{
-              "dishName": "Name of the Chosen Dish",
-              "reason": "Your generated reason."
+              "recommendations": [
+                {{"dishName": "Name of the Chosen Dish", "reason": "Your generated reason."}}
+              ]
             }}
             """
 
-            # 3. Call the Groq API
-            chat_completion = self.model.chat.completions.create(
+            chat_completion = self.groq_breaker.call(
+                self.model.chat.completions.create,
                 messages=[{"role": "user", "content": prompt}],
                 model="llama-3.1-8b-instant", # Using a fast model from Groq
                 temperature=0.7,
                 response_format={"type": "json_object"},
+                timeout=20,
             )
-            
-            # Get the JSON response directly from the new response format
-            response_content = chat_completion.choices[0].message.content
-            ai_data = json.loads(response_content)
-            
-            # 4. Find the full dish details from the menu
-            recommended_dish_name = ai_data.get("dishName")
-            full_dish_details = next((item for item in menu_items if item['name'] == recommended_dish_name), None)
-
-            if not full_dish_details:
-                return {"error": "AI recommended a dish not found in the menu."}, 500
-
-            # 5. Return the complete recommendation
-            return {
-                "dish": full_dish_details,
-                "reason": ai_data.get("reason")
-            }, 200
+            metrics.incr("bytebot.groq_calls")
 
-        except Exception as e:
+            ai_data = json.loads(chat_completion.choices[0].message.content)
+
+            # Keep only dishes that actually exist on the menu
+            by_name = {item['name']: item for item in menu_items}
+            pool = []
+            for rec in ai_data.get("recommendations") or []:
+                dish = by_name.get(rec.get("dishName"))
+                if dish and all(p["dish"] is not dish for p in pool):
+                    pool.append({"dish": dish, "reason": rec.get("reason")})
+            return pool[:POOL_SIZE]
 
-            return {"error": str(e)}, 500
+        except Exception as e:
+            print(f"ByteBot recommendation failed: {e}")
+            return []
@@ -0,0 +1,121 @@
+"""
+Server-side conversation state for the voice assistant.
+
+Clients identify a conversation with an `X-Session-Id` header (or `session_id`
+in the body) instead of posting the whole context back on every turn. Each
+session holds a small slotted record; sessions expire after a TTL and the
+least recently used ones are evicted once the store is full.
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+
+SESSION_TTL_SECONDS = int(os.getenv("VOICE_SESSION_TTL_SECONDS", "1800"))
+MAX_SESSIONS = int(os.getenv("VOICE_MAX_SESSIONS", "5000"))
+
+# Slots the LLM needs to resolve follow-ups ("yes", "make it 4 people", "how much is it?")
+PROMPT_SLOTS = (
+    "booking_flow_step", "guest_count", "date", "meal_period", "time",
+    "special_occasion", "previous_intent", "last_mentioned_item",
+)
+# Kept for the scripted booking flow and the cart, but never sent to the LLM
+SESSION_ONLY_SLOTS = ("available_slots", "cart_version")
+
+class ConversationState:
+    """Compact per-session record of where the conversation is."""
+    __slots__ = PROMPT_SLOTS + SESSION_ONLY_SLOTS + ("updated_at",)
+
+    def __init__(self, context: dict = None):
+        for slot in PROMPT_SLOTS + SESSION_ONLY_SLOTS:
+            setattr(self, slot, None)
+        self.cart_version = 0
+        self.updated_at = time.monotonic()
+        if context:
+            self._set_booking_slots(context)
+            self.last_mentioned_item = context.get("last_mentioned_item")
+
+    def _set_booking_slots(self, context: dict):
+        for slot in PROMPT_SLOTS + SESSION_ONLY_SLOTS:
+            if slot in ("last_mentioned_item", "cart_version"):
+                continue
+            setattr(self, slot, context.get(slot))
+
+    def apply_turn(self, new_context: dict, mentioned_item: str = None, cart_changed: bool = False):
+        """Advance the state after a turn.
+
+        Booking slots are replaced by the turn's `new_context`, the same way the
+        client used to overwrite its context; the last mentioned dish and the
+        cart version carry over between turns.
+        """
+        self._set_booking_slots(new_context or {})
+        if mentioned_item:
+            self.last_mentioned_item = mentioned_item
+        if cart_changed:
+            self.cart_version += 1
+        self.updated_at = time.monotonic()
+
+    def to_context(self) -> dict:
+        """All populated slots, for the route's booking and cart logic."""
+        context = {}
+        for slot in PROMPT_SLOTS + SESSION_ONLY_SLOTS:
+            value = getattr(self, slot)
+            if value is not None:
+                context[slot] = value
+        return context
+
+def compact_context(context: dict) -> dict:
+    """Drop everything but the known slots from a client-supplied context."""
+    if not context:
+        return {}
+    return {k: context[k] for k in PROMPT_SLOTS + SESSION_ONLY_SLOTS if context.get(k) is not None}
+
+def prompt_context(context: dict) -> dict:
+    """The minimal slots worth serialising into an LLM prompt."""
+    if not context:
+        return {}
+    return {k: context[k] for k in PROMPT_SLOTS if context.get(k) is not None}
+
+class ConversationStore:
+    """Thread-safe TTL + LRU store of ConversationState keyed by session id."""
+
+    def __init__(self, ttl_seconds: int = SESSION_TTL_SECONDS, max_sessions: int = MAX_SESSIONS):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+
+    def get(self, session_id: str):
+        """Return the live state for a session, or None if unknown or expired."""
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is None:
+                return None
+            if time.monotonic() - state.updated_at > self.ttl_seconds:
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+            return state
+
+    def save(self, session_id: str, state: ConversationState):
+        with self._lock:
+            state.updated_at = time.monotonic()
+            self._sessions[session_id] = state
+            self._sessions.move_to_end(session_id)
+            self._evict()
+
+    def _evict(self):
+        # Oldest entries sit at the front, so expired sessions are cleared from there
+        now = time.monotonic()
+        while self._sessions:
+            oldest_id, oldest = next(iter(self._sessions.items()))
+            if len(self._sessions) > self.max_sessions or now - oldest.updated_at > self.ttl_seconds:
+                del self._sessions[oldest_id]
+            else:
+                break
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+conversation_store = ConversationStore()
@@ -0,0 +1,65 @@
+"""
+Short-lived per-user cache of favorite menu items.
+
+Each entry carries a content version, which GET /users/<id>/favorites
+uses as its ETag. A client revalidating an unchanged list gets a 304 with no
+upstream call. Favorite writes in this worker invalidate the user's entry.
+Writes through other workers are picked up once the TTL expires.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+import requests
+
+from config import SUPABASE_URL, SUPABASE_HEADERS
+from utils import metrics
+from utils.singleflight import SingleFlight
+
+_FAVORITES_TTL_SECONDS = int(os.getenv("FAVORITES_CACHE_TTL_SECONDS", "30"))
+_MAX_USERS = int(os.getenv("FAVORITES_CACHE_MAX_USERS", "5000"))
+
+class FavoritesEntry:
+    __slots__ = ("items", "version", "loaded_at")
+
+    def __init__(self, items: list):
+        self.items = items
+        payload = json.dumps(items, sort_keys=True, default=str).encode("utf-8")
+        self.version = hashlib.sha1(payload).hexdigest()[:16]
+        self.loaded_at = time.monotonic()
+
+_lock = threading.Lock()
+_entries = OrderedDict()
+_flight = SingleFlight("favorites")
+
+def get_favorites(user_id: str) -> FavoritesEntry:
+    """A user's favorite menu items (most recently favorited first) with their version."""
+    with _lock:
+        entry = _entries.get(user_id)
+        if entry is not None and time.monotonic() - entry.loaded_at < _FAVORITES_TTL_SECONDS:
+            _entries.move_to_end(user_id)
+            metrics.incr("favorites_cache.hit")
+            return entry
+    metrics.incr("favorites_cache.miss")
+    return _flight.do(user_id, _load, user_id)
+
+def _load(user_id: str) -> FavoritesEntry:
+    response = requests.get(
+        f"{SUPABASE_URL}/rest/v1/favorites?user_id=eq.{user_id}&select=menu_items(*)&order=created_at.desc,id.desc",
+        headers=SUPABASE_HEADERS
+    )
+    response.raise_for_status()
+    entry = FavoritesEntry([row['menu_items'] for row in response.json() if row.get('menu_items')])
+    with _lock:
+        _entries[user_id] = entry
+        _entries.move_to_end(user_id)
+        while len(_entries) > _MAX_USERS:
+            _entries.popitem(last=False)
+    return entry
+
+def invalidate_favorites(user_id: str):
+    with _lock:
+        _entries.pop(str(user_id), None)
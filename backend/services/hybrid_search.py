@@ -4,6 +4,8 @@ import requests
 import json
 from pinecone import Pinecone
 from services.query_parser import parse_craving_with_groq
+from utils.resilience import get_breaker, guarded_request, budget_timeout, is_retryable_status, CircuitOpenError
+from utils.singleflight import SingleFlight
 
 _pc = None
 _index = None
@@ -13,6 +15,14 @@ _cache = {
 
 _CACHE_TTL_SECONDS = 600  # 10 minutes
 
+_embeddings_breaker = get_breaker("groq_embeddings")
+_pinecone_breaker = get_breaker("pinecone")
+_supabase_breaker = get_breaker("supabase")
+
+# Identical concurrent embedding/hydration requests share one upstream call
+_embedding_flight = SingleFlight("embedding")
+_hydrate_flight = SingleFlight("hydrate")
+
 def _get_pinecone_index():
     """Lazily initialize Pinecone to avoid startup failures when offline.
 
@@ -36,25 +46,38 @@ def _get_pinecone_index():
 
 def get_embedding(text):
     """Call Groq embedding API (OpenAI-compatible)."""
-    url = "https://api.groq.com/openai/v1/embeddings"
     model = os.getenv("EMBEDDING_MODEL", "nomic-embed-text-v1.5")  # 768 dims
+    return _embedding_flight.do((model, text), _fetch_embedding, text, model)
+
+def _fetch_embedding(text, model):
+    url = "https://api.groq.com/openai/v1/embeddings"
     headers = {
         "Authorization": f"Bearer {os.getenv('GROQ_API_KEY')}",
         "Content-Type": "application/json",
     }
     payload = {"input": text, "model": model}
-    # Simple retry loop for transient SSL issues
+    # Retry transient SSL issues, but only while the breaker and request budget allow
     last_err = None
     for _ in range(3):
+        timeout = budget_timeout(12)
+        if not _embeddings_breaker.allow_request():
+            raise CircuitOpenError("Groq embeddings circuit is open")
         try:
-            resp = requests.post(url, headers=headers, json=payload, timeout=12)
+            resp = requests.post(url, headers=headers, json=payload, timeout=timeout)
             if resp.ok:
                 data = resp.json()
                 # OpenAI-compatible shape: { data: [ { embedding: [...] } ] }
                 if isinstance(data, dict) and data.get("data"):
+                    _embeddings_breaker.record_success()
                     return data["data"][0]["embedding"]
             last_err = resp.text
+            if not is_retryable_status(resp.status_code):
+                # The dependency answered; the request itself is bad, so retrying won't help
+                _embeddings_breaker.record_success()
+                break
+            _embeddings_breaker.record_failure()
         except Exception as e:
+            _embeddings_breaker.record_failure()
             last_err = str(e)
     raise RuntimeError(f"Groq embeddings failed: {last_err}")
 
@@ -400,8 +423,8 @@ def _vector_search_and_rerank(user_query: str, parsed: dict):
     Returns top 6 items in the same shape as fallback functions: list of dicts with 'metadata'.
     """
     index = _get_pinecone_index()
-    if index is None:
-        # Pinecone not available, fall back
+    if index is None or _pinecone_breaker.is_open() or _embeddings_breaker.is_open():
+        # Pinecone/embeddings not available, fall back to local search immediately
         return _db_search_with_hints(user_query, parsed)
 
     query_text = (parsed.get("normalized_query") or user_query or "").strip()
@@ -424,16 +447,16 @@ def _vector_search_and_rerank(user_query: str, parsed: dict):
     expansion_suffix = (" " + " ".join(expanded_terms)) if expanded_terms else ""
     embed_text = f"{query_text}{expansion_suffix}".strip()
 
-    # Create embedding
-    vector = get_embedding(embed_text)
-
-    # Query Pinecone
+    # Create embedding and query Pinecone
     try:
-        res = index.query(
+        vector = get_embedding(embed_text)
+        res = _pinecone_breaker.call(
+            index.query,
             vector=vector,
             top_k=20,
             include_values=False,
             include_metadata=True,
+            _request_timeout=budget_timeout(5),
         )
         matches = res.get("matches", [])
     except Exception as e:
@@ -573,11 +596,9 @@ def _hydrate_from_supabase(matches: list):
             "Content-Type": "application/json",
         }
         # Build "in" filter: id=in.(1,2,3)
-        in_clause = ",".join(ids)
+        in_clause = ",".join(sorted(ids))
         url = f"{supabase_url}/rest/v1/menu_items?id=in.({in_clause})"
-        resp = requests.get(url, headers=headers)
-        resp.raise_for_status()
-        rows = resp.json()
+        rows = _hydrate_flight.do(in_clause, _fetch_menu_rows, url, headers)
         by_id = {str(r.get("id")): r for r in rows}
 
         merged = []
@@ -609,4 +630,10 @@ def _hydrate_from_supabase(matches: list):
         return merged
     except Exception as e:
 
-        return matches
\ No newline at end of file
+        return matches
+
+def _fetch_menu_rows(url: str, headers: dict):
+    """Fetch menu_items rows for hydration (shared by concurrent identical lookups)."""
+    resp = guarded_request(_supabase_breaker, "GET", url, timeout=5, headers=headers)
+    resp.raise_for_status()
+    return resp.json()
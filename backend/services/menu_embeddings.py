@@ -6,6 +6,7 @@ import time
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils.resilience import get_breaker, is_retryable_status
 
 # Load .env when running as a standalone module
 load_dotenv()
@@ -30,6 +31,15 @@ def _build_http_session():
 
 _SESSION = _build_http_session()
 
+_embeddings_breaker = get_breaker("groq_embeddings")
+
+def _record_embedding_response(resp):
+    """Feed an embeddings response into the breaker (429/5xx count as failures)."""
+    if is_retryable_status(resp.status_code):
+        _embeddings_breaker.record_failure()
+    else:
+        _embeddings_breaker.record_success()
+
 def get_embedding(text):
     """Function to generate embedding (Groq) with retries; returns None on failure."""
     api_key = os.getenv('GROQ_API_KEY')
@@ -41,6 +51,9 @@ def get_embedding(text):
     for model in models_to_try:
         last_err = None
         for _ in range(3):
+            # Stop retrying (and sleeping) as soon as the embeddings breaker opens
+            if not _embeddings_breaker.allow_request():
+                return None
             try:
                 resp = session.post(
                     "https://api.groq.com/openai/v1/embeddings",
@@ -48,6 +61,7 @@ def get_embedding(text):
                     json={"input": text, "model": model},
                     timeout=20,
                 )
+                _record_embedding_response(resp)
                 if resp.ok:
                     data = resp.json()
                     if isinstance(data, dict) and data.get("data"):
@@ -56,11 +70,15 @@ def get_embedding(text):
                 else:
                     last_err = resp.text
             except Exception as e:
+                _embeddings_breaker.record_failure()
                 last_err = str(e)
-                time.sleep(1.5)
+                if not _embeddings_breaker.is_open():
+                    time.sleep(1.5)
         # move to next model if current failed after retries
 
     # Fallback to legacy endpoint with short timeout
+    if _embeddings_breaker.is_open():
+        return None
     try:
         resp = session.post(
             "https://api.groq.ai/embeddings",
@@ -84,6 +102,8 @@ def _trim_text(t: str, max_chars: int = 512) -> str:
 def _embed_chunk(chunk, headers, model, timeout=18):
     session = _SESSION
     for _ in range(2):
+        if not _embeddings_breaker.allow_request():
+            return [None] * len(chunk)
         try:
             resp = session.post(
                 "https://api.groq.com/openai/v1/embeddings",
@@ -91,6 +111,7 @@ def _embed_chunk(chunk, headers, model, timeout=18):
                 json={"input": chunk, "model": model},
                 timeout=timeout,
             )
+            _record_embedding_response(resp)
             if resp.ok:
                 data = resp.json()
                 if isinstance(data, dict) and data.get("data"):
@@ -100,10 +121,11 @@ def _embed_chunk(chunk, headers, model, timeout=18):
                         if idx is not None and 0 <= idx < len(chunk):
                             out[idx] = item.get("embedding")
                     return out
-            time.sleep(0.8)
         except Exception:
+            _embeddings_breaker.record_failure()
+        if not _embeddings_breaker.is_open():
             time.sleep(0.8)
-    # fallback per item
+    # fallback per item (returns None immediately while the breaker is open)
     return [get_embedding(text) for text in chunk]
 
 def get_embeddings_batch(texts, batch_size=32):
@@ -130,10 +152,17 @@ def get_embeddings_batch(texts, batch_size=32):
                 results[start + i] = vec
     return results
 
-def precompute_menu_embeddings():
-    """Precompute menu embeddings and upload to Pinecone"""
+def precompute_menu_embeddings(item_ids=None):
+    """Precompute menu embeddings and upload to Pinecone.
+
+    With `item_ids`, only those items are (re-)embedded, even if they already
+    have vectors; use this after items were created or edited.
+    """
     # Fetch menu from Supabase
     menu_items = fetch_menu_items()
+    if item_ids is not None:
+        wanted = {str(item_id) for item_id in item_ids}
+        menu_items = [it for it in menu_items if str(it["id"]) in wanted]
 
     # Function to generate embedding (Groq or OpenAI)
     def get_embedding(text):
@@ -144,7 +173,7 @@ def precompute_menu_embeddings():
     pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
     index = pc.Index("menu-items")
 
-    all_ids = [str(it["id"]) for it in menu_items]
+    all_ids = [str(it["id"]) for it in menu_items] if item_ids is None else []
     existing: set[str] = set()
     # fetch in chunks to avoid large requests
     for start in range(0, len(all_ids), 100):
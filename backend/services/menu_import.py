@@ -0,0 +1,325 @@
+"""
+Bulk menu import from CSV, NDJSON or a JSON array.
+
+Rows are parsed as a stream and validated against the categories and item
+names fetched once at the start of the import. Valid rows are written in
+chunks of CHUNK_SIZE. Rows that match an existing item (by id, or by name
+when no id is given) update only the columns they supply, so a price-only
+file leaves descriptions, images and flags as they were. Each chunk's
+updates go through one bulk_update_menu_items call (database/menu_bulk.sql)
+and its new rows through one insert request. When the import is done, the menu cache is invalidated once and
+new items, and items whose name, description or category changed, are
+re-embedded in one incremental pass. Invalid rows and failed writes are
+reported per row. They never stop the rest of the import.
+
+Recognised columns: id, name, description, price, image_url, category_id or
+category (name), is_available, is_veg, is_bestseller, is_chef_spl,
+is_seasonal.
+"""
+import io
+import csv
+import json
+import threading
+
+import requests
+
+from config import SUPABASE_URL, SUPABASE_HEADERS
+from utils import metrics
+from utils.menu_utils import invalidate_menu_snapshot
+
+CHUNK_SIZE = 250
+MAX_REPORTED_ERRORS = 500
+_BOOLEAN_FIELDS = {
+    'is_available': True, 'is_veg': True, 'is_bestseller': False,
+    'is_chef_spl': False, 'is_seasonal': False,
+}
+# Columns that feed an item's embedding; updates touching only others skip re-embedding
+_EMBEDDED_FIELDS = {'name', 'description', 'category_id'}
+_TRUE = ('1', 'true', 'yes', 'y', 't')
+_FALSE = ('0', 'false', 'no', 'n', 'f', '')
+
+class MenuImportError(ValueError):
+    """A row that can't be imported."""
+
+class _RawLine(str):
+    """An NDJSON line that hasn't been decoded yet."""
+
+# --- Parsing ---
+
+def iter_csv_rows(stream):
+    """Rows from a CSV byte or text stream, read incrementally."""
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    for row in csv.DictReader(stream):
+        yield {(k or '').strip(): v for k, v in row.items()}
+
+def iter_ndjson_rows(stream):
+    """
+    Rows from newline-delimited JSON, one object per line. Lines are yielded
+    undecoded, so import_menu can report a malformed line as a failed row and
+    carry on with the next one.
+    """
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding='utf-8')
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield _RawLine(line)
+
+def iter_json_rows(payload):
+    """
+    Rows from a JSON array (or {"items": [...]}). The shape is checked
+    straight away, so a payload that isn't a list fails the whole request.
+    """
+    if isinstance(payload, dict):
+        payload = payload.get('items')
+    if not isinstance(payload, list):
+        raise MenuImportError("Expected a JSON array of menu items")
+    return iter(payload)
+
+# --- Validation ---
+
+def _parse_bool(value, default: bool) -> bool:
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in _TRUE:
+        return True
+    if text in _FALSE:
+        return default if text == '' else False
+    raise MenuImportError(f"Invalid boolean: {value!r}")
+
+class _Lookups:
+    """Categories and existing item names, fetched once per import."""
+
+    def __init__(self):
+        response = requests.get(f"{SUPABASE_URL}/rest/v1/categories?select=id,name", headers=SUPABASE_HEADERS)
+        response.raise_for_status()
+        categories = response.json()
+        self.category_ids = {c['id'] for c in categories}
+        self.category_by_name = {c['name'].strip().lower(): c['id'] for c in categories if c.get('name')}
+
+        response = requests.get(f"{SUPABASE_URL}/rest/v1/menu_items?select=id,name", headers=SUPABASE_HEADERS)
+        response.raise_for_status()
+        self.item_by_name = {}
+        for item in response.json():
+            if item.get('name'):
+                self.item_by_name[item['name'].strip().lower()] = item['id']
+        self.item_ids = set(self.item_by_name.values())
+        self.item_name_by_id = {item_id: name for name, item_id in self.item_by_name.items()}
+
+def _parse_price(value) -> float:
+    try:
+        price = float(value)
+    except (TypeError, ValueError):
+        raise MenuImportError("price must be a number")
+    if price < 0:
+        raise MenuImportError("price must not be negative")
+    return round(price, 2)
+
+def _parse_category(row: dict, lookups: _Lookups) -> int:
+    category_id = row.get('category_id')
+    if category_id not in (None, ''):
+        try:
+            category_id = int(category_id)
+        except (TypeError, ValueError):
+            raise MenuImportError("category_id must be an integer")
+        if category_id not in lookups.category_ids:
+            raise MenuImportError(f"Unknown category_id {category_id}")
+        return category_id
+    category_name = (row.get('category') or '').strip()
+    category_id = lookups.category_by_name.get(category_name.lower())
+    if category_id is None:
+        raise MenuImportError(f"Unknown category {category_name!r}" if category_name else "category is required")
+    return category_id
+
+def _decode_row(row):
+    """The row itself, or the decoded object for an NDJSON line."""
+    if not isinstance(row, _RawLine):
+        return row
+    try:
+        return json.loads(row)
+    except json.JSONDecodeError as e:
+        raise MenuImportError(f"Invalid JSON: {e}")
+
+def _supplied(row: dict, field: str) -> bool:
+    """Whether the row sets `field`; empty CSV cells leave the stored value alone."""
+    return field in row and row[field] is not None and str(row[field]).strip() != ''
+
+def validate_row(row: dict, lookups: _Lookups) -> dict:
+    """
+    Normalize one input row into a menu_items record, or raise MenuImportError.
+
+    Rows for existing items (matched by id, or by name) become partial
+    updates holding only the columns the row supplies. New items need name,
+    price and category, and get defaults for everything else.
+    """
+    if not isinstance(row, dict):
+        raise MenuImportError("Row is not an object")
+    name = (row.get('name') or '').strip()
+
+    item_id = row.get('id')
+    if item_id not in (None, ''):
+        try:
+            item_id = int(item_id)
+        except (TypeError, ValueError):
+            raise MenuImportError("id must be an integer")
+        if item_id not in lookups.item_ids:
+            raise MenuImportError(f"Unknown menu item id {item_id}")
+    elif name:
+        item_id = lookups.item_by_name.get(name.lower())
+    else:
+        raise MenuImportError("name is required")
+
+    if item_id is None:
+        record = {
+            'name': name,
+            'description': (row.get('description') or '').strip(),
+            'price': _parse_price(row.get('price')),
+            'image_url': (row.get('image_url') or '').strip(),
+            'category_id': _parse_category(row, lookups),
+        }
+        for field, default in _BOOLEAN_FIELDS.items():
+            record[field] = _parse_bool(row.get(field), default)
+        return record
+
+    record = {'id': item_id}
+    if name and name.lower() != lookups.item_name_by_id.get(item_id):
+        # Only an id-matched row can rename an item
+        record['name'] = name
+    if _supplied(row, 'price'):
+        record['price'] = _parse_price(row['price'])
+    if _supplied(row, 'category_id') or _supplied(row, 'category'):
+        record['category_id'] = _parse_category(row, lookups)
+    for field in ('description', 'image_url'):
+        if _supplied(row, field):
+            record[field] = str(row[field]).strip()
+    for field in _BOOLEAN_FIELDS:
+        if _supplied(row, field):
+            record[field] = _parse_bool(row[field], False)
+    return record
+
+# --- Writing ---
+
+def _write_updates(session, updates: list) -> dict:
+    """
+    Apply partial updates (row_number, record) in one bulk_update_menu_items
+    call. Returns {row_number: error} for rows that weren't written.
+    """
+    changed = [(row_number, record) for row_number, record in updates if len(record) > 1]
+    if not changed:
+        return {}
+    try:
+        response = session.post(
+            f"{SUPABASE_URL}/rest/v1/rpc/bulk_update_menu_items",
+            json={'p_items': [record for _, record in changed]},
+            headers=SUPABASE_HEADERS,
+            timeout=30
+        )
+        response.raise_for_status()
+        written = set(response.json() or [])
+    except Exception as e:
+        return {row_number: f"Write failed: {e}" for row_number, _ in changed}
+    # Deleted since the import started
+    return {row_number: f"Menu item {record['id']} no longer exists"
+            for row_number, record in changed if record['id'] not in written}
+
+def _insert_rows(session, inserts: list) -> list:
+    """Insert new items (row_number, record) in one request; returns their ids."""
+    response = session.post(
+        f"{SUPABASE_URL}/rest/v1/menu_items?select=id",
+        json=[record for _, record in inserts],
+        headers={**SUPABASE_HEADERS, 'Prefer': 'return=representation'},
+        timeout=30
+    )
+    response.raise_for_status()
+    return [row['id'] for row in response.json()]
+
+def _reembed_async(item_ids: list):
+    def run():
+        try:
+            from services.menu_embeddings import precompute_menu_embeddings
+            precompute_menu_embeddings(item_ids=item_ids)
+        except Exception as e:
+            print(f"Re-embedding imported menu items failed: {e}")
+    threading.Thread(target=run, name="menu-import-reembed", daemon=True).start()
+
+def import_menu(rows, dry_run: bool = False, reembed: bool = True, wait_for_embeddings: bool = False) -> dict:
+    """
+    Validate and write `rows` (any iterable of dicts) in chunks.
+
+    Returns a report with counts and per-row errors (row numbers start at 1).
+    Re-embedding runs in the background unless `wait_for_embeddings` is set.
+    """
+    lookups = _Lookups()
+    report = {'received': 0, 'inserted': 0, 'updated': 0, 'failed': 0, 'dry_run': dry_run, 'errors': []}
+    reembed_ids = []
+    pending = []
+    seen_rows = {}
+    session = requests.Session()
+
+    def fail(row_number, error):
+        report['failed'] += 1
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append({'row': row_number, 'error': error})
+
+    def flush():
+        if not pending:
+            return
+        updates = [(n, record) for n, record in pending if 'id' in record]
+        inserts = [(n, record) for n, record in pending if 'id' not in record]
+        pending.clear()
+        if dry_run:
+            report['updated'] += len(updates)
+            report['inserted'] += len(inserts)
+            return
+        if updates:
+            failures = _write_updates(session, updates)
+            for row_number, error in failures.items():
+                fail(row_number, error)
+            reembed_ids.extend(record['id'] for n, record in updates
+                               if n not in failures and _EMBEDDED_FIELDS.intersection(record))
+            report['updated'] += len(updates) - len(failures)
+        if inserts:
+            try:
+                reembed_ids.extend(_insert_rows(session, inserts))
+                report['inserted'] += len(inserts)
+            except Exception as e:
+                for row_number, _ in inserts:
+                    fail(row_number, f"Write failed: {e}")
+
+    try:
+        for row_number, row in enumerate(rows, start=1):
+            report['received'] += 1
+            try:
+                record = validate_row(_decode_row(row), lookups)
+            except MenuImportError as e:
+                fail(row_number, str(e))
+                continue
+            key = record['id'] if 'id' in record else record['name'].lower()
+            if key in seen_rows:
+                fail(row_number, f"Duplicate of row {seen_rows[key]}")
+                continue
+            seen_rows[key] = row_number
+            pending.append((row_number, record))
+            if len(pending) >= CHUNK_SIZE:
+                flush()
+    except (ValueError, csv.Error) as e:
+        # Malformed input past this point; keep what was already imported
+        fail(report['received'] + 1, f"Could not parse input: {e}")
+    flush()
+
+    if not dry_run and (report['updated'] or report['inserted']):
+        invalidate_menu_snapshot()
+    if reembed_ids and reembed:
+        if wait_for_embeddings:
+            from services.menu_embeddings import precompute_menu_embeddings
+            precompute_menu_embeddings(item_ids=reembed_ids)
+        else:
+            _reembed_async(reembed_ids)
+    report['reembedding'] = bool(reembed_ids and reembed)
+    metrics.incr("menu_import.rows", report['received'])
+    metrics.incr("menu_import.failed", report['failed'])
+    return report
@@ -0,0 +1,120 @@
+"""
+Typeahead over the menu, served from memory.
+
+The index is a sorted array of (key, item) pairs. The keys are every
+word-start suffix of an item's normalised name, so "tik" and "tikka ma" both
+reach "Paneer Tikka Masala". Its category name and any tags are keys too.
+A query is a bisect to the first key with the query as prefix, then a walk
+while keys still match. No upstream call happens per keystroke.
+
+Results rank name matches above category and tag matches, then by
+popularity: quantity sold over the last POPULARITY_DAYS days (from the sales
+rollups, when they are running), then the bestseller and chef-special flags.
+The index is rebuilt when the menu snapshot version changes, and popularity
+is refreshed every POPULARITY_REFRESH_SECONDS.
+"""
+import os
+import time
+import bisect
+import threading
+from datetime import timedelta
+
+from utils import metrics
+from utils.http_cache import make_etag
+from utils.menu_matcher import normalize_text
+from services.analytics import sales_rollups, today_local
+
+POPULARITY_DAYS = int(os.getenv("MENU_SUGGEST_POPULARITY_DAYS", "30"))
+POPULARITY_REFRESH_SECONDS = int(os.getenv("MENU_SUGGEST_POPULARITY_REFRESH_SECONDS", "600"))
+MAX_SUGGESTIONS = 20
+
+# Match kinds, best first
+_NAME_START, _NAME_WORD, _CATEGORY, _TAG = range(4)
+_MATCH_LABELS = {_NAME_START: "name", _NAME_WORD: "name", _CATEGORY: "category", _TAG: "tag"}
+_SUGGESTION_FIELDS = ('id', 'name', 'price', 'image_url', 'category_id', 'category_name', 'is_veg', 'is_available')
+
+def _item_tags(item: dict) -> list:
+    tags = item.get('tags') or []
+    if isinstance(tags, str):
+        tags = tags.split(',')
+    return [normalize_text(tag) for tag in tags if normalize_text(tag)]
+
+def _popularity() -> dict:
+    """menu_item_id -> quantity sold in the popularity window; empty without rollups."""
+    if not sales_rollups.status()['backfilled']:
+        return {}
+    end = today_local()
+    start = end - timedelta(days=POPULARITY_DAYS - 1)
+    top = sales_rollups.top_items(start, end, limit=10 ** 6, sort="quantity")
+    return {row['menu_item_id']: row['quantity'] for row in top}
+
+class SuggestIndex:
+    """Prefix index over one menu snapshot. Read-only once built."""
+
+    def __init__(self, items: list, menu_version: str, popularity: dict):
+        self.menu_version = menu_version
+        self.built_at = time.monotonic()
+        self.items = items
+        self.rank = []
+        entries = []
+        for idx, item in enumerate(items):
+            words = normalize_text(item.get('name', '')).split()
+            for position in range(len(words)):
+                entries.append((" ".join(words[position:]), _NAME_START if position == 0 else _NAME_WORD, idx))
+            category = normalize_text(item.get('category_name', ''))
+            if category:
+                entries.append((category, _CATEGORY, idx))
+            for tag in _item_tags(item):
+                entries.append((tag, _TAG, idx))
+            sold = popularity.get(item.get('id'), 0)
+            flagged = bool(item.get('is_bestseller')) + bool(item.get('is_chef_spl'))
+            self.rank.append((-sold, -flagged))
+        entries.sort()
+        self.keys = [key for key, _, _ in entries]
+        self.entries = entries
+        # Same menu and sales give the same version in every worker
+        self.version = make_etag(menu_version, self.rank)
+
+    def suggest(self, query: str, limit: int = 8) -> list:
+        q_norm = normalize_text(query)
+        if not q_norm:
+            return []
+        best_kind = {}
+        start = bisect.bisect_left(self.keys, q_norm)
+        for position in range(start, len(self.entries)):
+            key, kind, idx = self.entries[position]
+            if not key.startswith(q_norm):
+                break
+            if kind < best_kind.get(idx, len(_MATCH_LABELS)):
+                best_kind[idx] = kind
+        def order(idx):
+            kind = best_kind[idx]
+            return (kind >= _CATEGORY, self.rank[idx], kind, len(self.items[idx].get('name') or ''), idx)
+        ranked = sorted(best_kind, key=order)[:limit]
+        suggestions = []
+        for idx in ranked:
+            item = self.items[idx]
+            suggestion = {field: item.get(field) for field in _SUGGESTION_FIELDS}
+            suggestion['match'] = _MATCH_LABELS[best_kind[idx]]
+            suggestions.append(suggestion)
+        return suggestions
+
+_lock = threading.Lock()
+_index = None
+
+def get_suggest_index(snapshot) -> SuggestIndex:
+    """The index for `snapshot`, rebuilt on a new menu version or stale popularity."""
+    global _index
+    index = _index
+    if (index is not None and index.menu_version == snapshot.version
+            and time.monotonic() - index.built_at < POPULARITY_REFRESH_SECONDS):
+        return index
+    with _lock:
+        index = _index
+        if (index is None or index.menu_version != snapshot.version
+                or time.monotonic() - index.built_at >= POPULARITY_REFRESH_SECONDS):
+            started = time.perf_counter()
+            index = SuggestIndex(snapshot.items, snapshot.version, _popularity())
+            metrics.observe("menu_suggest.build_ms", (time.perf_counter() - started) * 1000)
+            _index = index
+    return index
@@ -0,0 +1,192 @@
+"""
+Order counts without downloading order rows.
+
+`count_orders()` asks PostgREST for a count with a HEAD request and
+`Prefer: count=exact` (or `planned`, the planner's estimate), reading the
+total from the Content-Range header.
+
+`order_counts` holds the dashboard counters in memory: total, per status and
+per day for the last MAX_DAYS days. They are seeded with the grouped count
+functions in database/order_counts.sql and kept current from order events.
+A new order or a status transition is applied as a delta. The previous
+status comes from the event, or else from the counters' own record of the
+last MAX_TRACKED_ORDERS orders they saw. That holds whether or not a
+dashboard has the order board loaded. Only a change to an order seen
+nowhere marks the counters dirty, which triggers a reload. A TTL reload
+also picks up writes made by other workers, so every read is served from
+memory.
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote
+
+from config import SUPABASE_URL, SUPABASE_KEY
+from utils import metrics
+from utils.pagination import parse_content_range
+from utils.resilience import get_breaker, guarded_request
+from utils.singleflight import SingleFlight
+from services.order_events import order_event_bus
+
+COUNTS_TTL_SECONDS = int(os.getenv("ORDER_COUNTS_TTL_SECONDS", "300"))
+MAX_DAYS = 90
+MAX_TRACKED_ORDERS = int(os.getenv("ORDER_COUNTS_TRACKED_ORDERS", "10000"))
+COUNT_MODES = ("exact", "planned", "estimated")
+
+_supabase_breaker = get_breaker("supabase")
+
+def _headers():
+    return {
+        'apikey': SUPABASE_KEY,
+        'Authorization': f'Bearer {SUPABASE_KEY}',
+        'Content-Type': 'application/json'
+    }
+
+def count_orders(statuses=None, date_from: str = None, date_to: str = None, mode: str = "exact") -> int:
+    """Count matching orders with a HEAD request; nothing but headers comes back."""
+    if mode not in COUNT_MODES:
+        raise ValueError(f"mode must be one of {', '.join(COUNT_MODES)}")
+    filters = []
+    if statuses:
+        filters.append("status=in.(" + ",".join(quote(f'"{s}"') for s in statuses) + ")")
+    if date_from:
+        filters.append(f"created_at=gte.{quote(date_from)}")
+    if date_to:
+        filters.append(f"created_at=lt.{quote(date_to)}")
+    url = f"{SUPABASE_URL}/rest/v1/orders?select=id"
+    if filters:
+        url += "&" + "&".join(filters)
+    response = guarded_request(
+        _supabase_breaker, "HEAD", url,
+        headers={**_headers(), 'Prefer': f'count={mode}'}
+    )
+    response.raise_for_status()
+    return parse_content_range(response.headers.get("Content-Range"))
+
+def _utc_day(created_at) -> str:
+    if not created_at:
+        return datetime.now(timezone.utc).date().isoformat()
+    moment = datetime.fromisoformat(str(created_at).replace("Z", "+00:00"))
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc)
+    return moment.date().isoformat()
+
+class OrderCounts:
+    """In-memory order counters, reloaded after a TTL or when they go dirty."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flight = SingleFlight("order_counts")
+        self._by_status = None
+        self._by_day = {}
+        self._loaded_at = 0.0
+        self._generation = 0
+        # order id -> (status, created day), most recently seen last
+        self._orders = OrderedDict()
+
+    # --- Reads ---
+
+    def snapshot(self, days: int = 7) -> dict:
+        """Total, per-status and per-day (last `days` days, UTC) counts."""
+        days = max(1, min(int(days), MAX_DAYS))
+        self._ensure_fresh()
+        today = datetime.now(timezone.utc).date()
+        with self._lock:
+            by_day = {}
+            for offset in range(days - 1, -1, -1):
+                day = (today - timedelta(days=offset)).isoformat()
+                by_day[day] = self._by_day.get(day, 0)
+            return {
+                "total": sum(self._by_status.values()),
+                "by_status": dict(self._by_status),
+                "by_day": by_day,
+                "as_of": datetime.fromtimestamp(self._loaded_at, timezone.utc).isoformat(),
+            }
+
+    def total(self) -> int:
+        self._ensure_fresh()
+        with self._lock:
+            return sum(self._by_status.values())
+
+    # --- Loading ---
+
+    def _ensure_fresh(self):
+        if self._by_status is not None and time.time() - self._loaded_at < COUNTS_TTL_SECONDS:
+            metrics.incr("order_counts.hit")
+            return
+        metrics.incr("order_counts.reload")
+        self._flight.do("counts", self._load)
+
+    def _load(self):
+        generation = self._generation
+        by_status_response = guarded_request(
+            _supabase_breaker, "POST", f"{SUPABASE_URL}/rest/v1/rpc/order_status_counts",
+            json={}, headers=_headers()
+        )
+        by_status_response.raise_for_status()
+        today = datetime.now(timezone.utc).date()
+        by_day_response = guarded_request(
+            _supabase_breaker, "POST", f"{SUPABASE_URL}/rest/v1/rpc/order_daily_counts",
+            json={"p_from": (today - timedelta(days=MAX_DAYS - 1)).isoformat(), "p_to": today.isoformat()},
+            headers=_headers()
+        )
+        by_day_response.raise_for_status()
+
+        by_status = {row['status']: row['order_count'] for row in by_status_response.json()}
+        by_day = {str(row['day']): row['order_count'] for row in by_day_response.json()}
+        with self._lock:
+            self._by_status = by_status
+            self._by_day = by_day
+            # Changes that arrived mid-load may or may not be in these numbers
+            self._loaded_at = time.time() if generation == self._generation else 0.0
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._loaded_at = 0.0
+
+    # --- Order events ---
+
+    def _remember(self, order_id, status, day):
+        # Caller holds self._lock
+        self._orders[order_id] = (status, day)
+        self._orders.move_to_end(order_id)
+        while len(self._orders) > MAX_TRACKED_ORDERS:
+            self._orders.popitem(last=False)
+
+    def on_order_event(self, order: dict, previous_status, created: bool):
+        """Order event listener: apply the change as a delta, or mark the counters dirty if it can't be."""
+        order_id = order.get('order_id')
+        status = order.get('status')
+        with self._lock:
+            known_status, day = self._orders.get(order_id, (None, None))
+            if order.get('created_at'):
+                day = _utc_day(order['created_at'])
+            if status == 'Deleted':
+                self._orders.pop(order_id, None)
+            else:
+                self._remember(order_id, status, day or _utc_day(None))
+            if self._by_status is None:
+                return
+            if created:
+                self._by_status[status] = self._by_status.get(status, 0) + 1
+                day = day or _utc_day(None)
+                self._by_day[day] = self._by_day.get(day, 0) + 1
+                metrics.incr("order_counts.delta")
+                return
+            previous_status = previous_status or known_status
+            if previous_status is not None and (status != 'Deleted' or day):
+                self._by_status[previous_status] = max(self._by_status.get(previous_status, 0) - 1, 0)
+                if status == 'Deleted':
+                    if day in self._by_day:
+                        self._by_day[day] = max(self._by_day[day] - 1, 0)
+                else:
+                    self._by_status[status] = self._by_status.get(status, 0) + 1
+                metrics.incr("order_counts.delta")
+                return
+        self.invalidate()
+
+order_counts = OrderCounts()
+order_event_bus.add_listener(order_counts.on_order_event)
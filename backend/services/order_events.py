@@ -0,0 +1,261 @@
+"""
+In-process order event bus for the kitchen and delivery dashboards.
+
+The bus keeps a board of every order a dashboard cares about (Preparing,
+Ready, Out for delivery) in the same shape the polling feeds return.
+Order writes call `notify_order_changed(order_id)`. A dispatcher thread
+then re-reads that one order (a single embedded query) and pushes the delta
+to every subscriber. The board is also re-synced periodically, which picks
+up writes made by other workers or outside this app. Upstream load depends
+on order writes and the resync interval, never on how many screens are open.
+"""
+import os
+import json
+import queue
+import threading
+import time
+from urllib.parse import quote
+
+import requests
+
+from config import SUPABASE_URL, SUPABASE_HEADERS
+from utils import metrics
+
+ACTIVE_STATUSES = ("Preparing", "Ready", "Out for delivery")
+RESYNC_INTERVAL_SECONDS = int(os.getenv("ORDER_EVENTS_RESYNC_SECONDS", "30"))
+SUBSCRIBER_QUEUE_SIZE = 256
+
+# One query returns an order with its customer and items, replacing the N+1 fan-out
+_ORDER_SELECT = "*,users(name),order_items(quantity,price_at_order,menu_items(name,description,image_url))"
+
+def _board_order(order: dict) -> dict:
+    """Dashboard view of an order: the union of the kitchen and delivery feed fields."""
+    user = order.get('users') or {}
+    items = []
+    for it in order.get('order_items') or []:
+        mi = it.get('menu_items') or {}
+        items.append({
+            'name': mi.get('name'),
+            'description': mi.get('description'),
+            'image_url': mi.get('image_url'),
+            'quantity': it.get('quantity', 1),
+            'price': it.get('price_at_order', 0),
+        })
+    return {
+        'order_id': order.get('id'),
+        'status': order.get('status'),
+        'customer_name': user.get('name') or 'User',
+        'waiter_name': user.get('name') or 'User',
+        'table_info': order.get('delivery_address') or 'Delivery order',
+        'delivery_address': order.get('delivery_address'),
+        'delivery_user_id': order.get('delivery_user_id'),
+        'total_amount': order.get('total_amount') or order.get('total') or 0,
+        'created_at': order.get('created_at'),
+        'items': items,
+    }
+
+class _Subscriber:
+    __slots__ = ("queue", "statuses", "overflowed")
+
+    def __init__(self, statuses):
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.statuses = statuses
+        self.overflowed = False
+
+class OrderEventBus:
+    """Board of active orders plus fan-out of changes to SSE subscribers."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._board = {}  # order_id -> board order
+        self._seq = 0
+        self._loaded = False
+        self._subscribers = set()
+        self._pending = queue.Queue()
+        self._dispatcher = None
+        self._listeners = []
+
+    # --- Publishing ---
+
+    def notify_order_changed(self, order_id, created=False, previous_status=None):
+        """
+        Queue an order for re-read and broadcast. Never blocks the caller's write.
+        Pass `previous_status` when the caller knows the status it just replaced,
+        so listeners get it even for orders that aren't on the board.
+        """
+        self._ensure_dispatcher()
+        self._pending.put((order_id, created, previous_status))
+
+    def add_listener(self, fn):
+        """
+        Call `fn(order, previous_status, created)` after every order change this
+        worker sees. `previous_status` is None when it isn't known (the order was
+        not on the board and the writer didn't pass it), unless `created` is set.
+        """
+        self._listeners.append(fn)
+
+    def publish_order(self, order: dict, created: bool = False, previous_status=None):
+        """
+        Apply a freshly read order row to the board and broadcast the delta, if any.
+        `previous_status` is used when the order wasn't on the board.
+        """
+        board_order = _board_order(order)
+        order_id = board_order['order_id']
+        with self._lock:
+            previous = self._board.get(order_id)
+            if board_order['status'] in ACTIVE_STATUSES:
+                if previous == board_order and not created:
+                    return
+                self._board[order_id] = board_order
+                self._broadcast("order", {"order": board_order}, previous)
+            elif previous is not None:
+                del self._board[order_id]
+                self._broadcast("removed", {"order_id": order_id, "status": board_order['status']}, previous)
+        if previous is not None:
+            previous_status = previous['status']
+        if previous_status != board_order['status'] or created:
+            for listener in self._listeners:
+                try:
+                    listener(board_order, previous_status, created)
+                except Exception as e:
+                    print(f"Order event listener failed: {e}")
+
+    def _broadcast(self, event: str, payload: dict, previous: dict):
+        # Caller holds self._lock
+        self._seq += 1
+        payload = {"seq": self._seq, **payload}
+        status = payload["order"]["status"] if event == "order" else payload["status"]
+        order_id = payload["order"]["order_id"] if event == "order" else payload["order_id"]
+        metrics.incr("order_events.published")
+        for sub in list(self._subscribers):
+            was_visible = previous is not None and self._visible(sub, previous['status'])
+            if event == "order" and self._visible(sub, status):
+                message = (event, payload)
+            elif was_visible:
+                # Moved out of this screen's statuses (e.g. Preparing -> Ready for the kitchen)
+                message = ("removed", {"seq": self._seq, "order_id": order_id, "status": status})
+            else:
+                continue
+            try:
+                sub.queue.put_nowait(message)
+            except queue.Full:
+                # A stalled client gets a fresh snapshot instead of an unbounded backlog
+                sub.overflowed = True
+
+    @staticmethod
+    def _visible(sub: _Subscriber, status: str) -> bool:
+        return sub.statuses is None or status in sub.statuses
+
+    # --- Subscribing ---
+
+    def subscribe(self, statuses=None):
+        """Register a subscriber and return (subscriber, snapshot event payload)."""
+        self._ensure_loaded()
+        self._ensure_dispatcher()
+        sub = _Subscriber(frozenset(statuses) if statuses else None)
+        with self._lock:
+            self._subscribers.add(sub)
+            metrics.set_gauge("order_events.subscribers", len(self._subscribers))
+            return sub, self._snapshot_for(sub)
+
+    def unsubscribe(self, sub: _Subscriber):
+        with self._lock:
+            self._subscribers.discard(sub)
+            metrics.set_gauge("order_events.subscribers", len(self._subscribers))
+
+    def resnapshot(self, sub: _Subscriber) -> dict:
+        """Fresh snapshot for a subscriber whose queue overflowed."""
+        with self._lock:
+            while not sub.queue.empty():
+                sub.queue.get_nowait()
+            sub.overflowed = False
+            return self._snapshot_for(sub)
+
+    def _snapshot_for(self, sub: _Subscriber) -> dict:
+        # Caller holds self._lock
+        orders = [o for o in self._board.values() if self._visible(sub, o['status'])]
+        orders.sort(key=lambda o: o.get('created_at') or '', reverse=True)
+        return {"seq": self._seq, "orders": orders}
+
+    # --- Loading ---
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.resync()
+
+    def resync(self):
+        """Reload all active orders in one query and broadcast whatever changed."""
+        statuses = ",".join(quote(f'"{s}"') for s in ACTIVE_STATUSES)
+        response = requests.get(
+            f"{SUPABASE_URL}/rest/v1/orders?select={_ORDER_SELECT}&status=in.({statuses})&order=created_at.desc",
+            headers=SUPABASE_HEADERS,
+            timeout=15,
+        )
+        response.raise_for_status()
+        rows = response.json() or []
+        seen = set()
+        for row in rows:
+            seen.add(row.get('id'))
+            self.publish_order(row)
+        with self._lock:
+            gone = [order_id for order_id in self._board if order_id not in seen]
+        for order_id in gone:
+            # Left the active statuses without passing through this worker
+            self._refresh_order(order_id)
+        self._loaded = True
+        metrics.incr("order_events.resyncs")
+
+    def _refresh_order(self, order_id, created=False, previous_status=None):
+        response = requests.get(
+            f"{SUPABASE_URL}/rest/v1/orders?select={_ORDER_SELECT}&id=eq.{order_id}",
+            headers=SUPABASE_HEADERS,
+            timeout=10,
+        )
+        response.raise_for_status()
+        rows = response.json() or []
+        if rows:
+            self.publish_order(rows[0], created, previous_status)
+        else:
+            self.publish_order({'id': order_id, 'status': 'Deleted'}, previous_status=previous_status)
+
+    def _ensure_dispatcher(self):
+        if self._dispatcher is not None:
+            return
+        with self._lock:
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._run_dispatcher, name="order-events", daemon=True)
+                self._dispatcher.start()
+
+    def _run_dispatcher(self):
+        last_resync = time.monotonic()
+        while True:
+            # Wait no longer than the next resync is due, so a steady stream of
+            # local writes can't hold off the resync that catches everyone else's
+            wait = max(0.0, last_resync + RESYNC_INTERVAL_SECONDS - time.monotonic())
+            try:
+                order_id, created, previous_status = self._pending.get(timeout=wait)
+                self._refresh_order(order_id, created, previous_status)
+            except queue.Empty:
+                pass
+            except Exception as e:
+                print(f"Order event dispatch failed: {e}")
+
+            if time.monotonic() - last_resync < RESYNC_INTERVAL_SECONDS:
+                continue
+            last_resync = time.monotonic()
+            try:
+                # Only worth resyncing while someone is watching
+                if self._subscribers:
+                    self.resync()
+                else:
+                    self._loaded = False
+            except Exception as e:
+                print(f"Order event resync failed: {e}")
+
+order_event_bus = OrderEventBus()
+
+def notify_order_changed(order_id, created=False, previous_status=None):
+    order_event_bus.notify_order_changed(order_id, created, previous_status)
+
+def format_sse(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, default=str)}\n\n"
@@ -1,7 +1,9 @@
-import requests
 import json
 import re
 import os
+from utils.resilience import get_breaker, guarded_request
+
+_groq_breaker = get_breaker("groq")
 
 def parse_craving_with_groq(user_query):
     """Parse user craving query using Groq LLM into structured JSON"""
@@ -45,8 +47,12 @@ Examples:
 """
     
     try:
-        response = requests.post(
+        # Parsing is best-effort: while Groq is unhealthy this returns {} at once
+        response = guarded_request(
+            _groq_breaker,
+            "POST",
             "https://api.groq.com/openai/v1/chat/completions",
+            timeout=15,
             headers={
                 "Authorization": f"Bearer {os.getenv('GROQ_API_KEY')}",
                 "Content-Type": "application/json",
@@ -55,7 +61,6 @@ Examples:
                 "model": "llama-3.1-8b-instant",
                 "messages": [{"role": "user", "content": prompt}]
             },
-            timeout=15,
         )
         
         if response.status_code == 200:
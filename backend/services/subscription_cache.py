@@ -0,0 +1,179 @@
+"""
+In-process caches for subscription data.
+
+Plans: `subscription_plans` is a tiny table that almost never changes, so the
+whole table is held as a versioned snapshot and reloaded after a TTL or an
+explicit invalidation. Reloads are single-flighted and a failed reload keeps
+serving the previous snapshot.
+
+Entitlements: a bounded TTL cache of what each subscription may spend (plan,
+status, remaining credits, max_meal_price) so the checkout credit check needs
+no upstream call. Writes that change a balance update it write-through. The
+cache is per worker and advisory: `use_credits` in the database remains the
+authority on whether credits can actually be spent.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from config import SUPABASE_URL, SUPABASE_KEY
+from utils import metrics
+from utils.resilience import get_breaker, guarded_request
+from utils.singleflight import SingleFlight
+
+_PLANS_CACHE_TTL_SECONDS = int(os.getenv("PLANS_CACHE_TTL_SECONDS", "300"))
+# A lookup for a plan the snapshot doesn't have reloads it at most this often
+_PLANS_MISS_RELOAD_SECONDS = int(os.getenv("PLANS_MISS_RELOAD_SECONDS", "10"))
+_ENTITLEMENT_TTL_SECONDS = int(os.getenv("ENTITLEMENT_TTL_SECONDS", "300"))
+_MAX_ENTITLEMENTS = int(os.getenv("MAX_ENTITLEMENTS", "10000"))
+
+_supabase_breaker = get_breaker("supabase")
+
+def _headers():
+    return {
+        'apikey': SUPABASE_KEY,
+        'Authorization': f'Bearer {SUPABASE_KEY}',
+        'Content-Type': 'application/json'
+    }
+
+# --- Plans ---
+
+class PlansSnapshot:
+    """Read-only view of subscription_plans with a content version."""
+    __slots__ = ("by_id", "active", "version", "loaded_at")
+
+    def __init__(self, plans: list):
+        plans = sorted(plans, key=lambda plan: plan['id'])
+        self.by_id = {plan['id']: plan for plan in plans}
+        self.active = [plan for plan in plans if plan.get('is_active')]
+        payload = json.dumps(plans, sort_keys=True, default=str).encode("utf-8")
+        self.version = hashlib.sha1(payload).hexdigest()[:16]
+        self.loaded_at = time.time()
+
+_plans_flight = SingleFlight("subscription_plans")
+_plans_lock = threading.Lock()
+_plans_snapshot = None
+_plans_generation = 0
+
+def get_plans_snapshot() -> PlansSnapshot:
+    """The cached plans snapshot, reloaded once it is older than the TTL."""
+    snapshot = _plans_snapshot
+    if snapshot is not None and time.time() - snapshot.loaded_at < _PLANS_CACHE_TTL_SECONDS:
+        return snapshot
+    return _plans_flight.do("plans", _load_plans)
+
+def get_plan(plan_id):
+    """
+    A single plan by id (active or not), or None if it doesn't exist. A miss
+    reloads the snapshot first, since the plan may have been created after it
+    was loaded (by another worker or in the dashboard).
+    """
+    plan_id = int(plan_id)
+    snapshot = get_plans_snapshot()
+    plan = snapshot.by_id.get(plan_id)
+    if plan is None and time.time() - snapshot.loaded_at >= _PLANS_MISS_RELOAD_SECONDS:
+        metrics.incr("subscription_plans.miss_reload")
+        invalidate_plans()
+        plan = get_plans_snapshot().by_id.get(plan_id)
+    return plan
+
+def _load_plans() -> PlansSnapshot:
+    global _plans_snapshot
+    generation = _plans_generation
+    try:
+        response = guarded_request(
+            _supabase_breaker, "GET",
+            f"{SUPABASE_URL}/rest/v1/subscription_plans?select=*",
+            headers=_headers()
+        )
+        response.raise_for_status()
+        snapshot = PlansSnapshot(response.json())
+    except Exception:
+        if _plans_snapshot is not None:
+            # Keep serving the last good copy while Supabase is unavailable
+            return _plans_snapshot
+        raise
+    with _plans_lock:
+        # Don't cache data that was fetched before an invalidation landed
+        if generation == _plans_generation:
+            if _plans_snapshot is None or _plans_snapshot.version != snapshot.version:
+                metrics.incr("subscription_plans.version_changed")
+            _plans_snapshot = snapshot
+    return snapshot
+
+def invalidate_plans():
+    """Force the next lookup to reload plans. Call after any plan write."""
+    global _plans_generation
+    with _plans_lock:
+        _plans_generation += 1
+        if _plans_snapshot is not None:
+            _plans_snapshot.loaded_at = 0
+
+# --- Entitlements ---
+
+class Entitlement:
+    """What a subscription may currently spend."""
+    __slots__ = ("subscription_id", "user_id", "plan_id", "status", "remaining_credits",
+                 "max_meal_price", "end_date", "loaded_at")
+
+    def __init__(self, subscription: dict, plan: dict):
+        self.subscription_id = subscription['id']
+        self.user_id = subscription.get('user_id')
+        self.plan_id = subscription.get('plan_id')
+        self.status = subscription.get('status')
+        self.remaining_credits = subscription.get('remaining_credits') or 0
+        self.max_meal_price = (plan or {}).get('max_meal_price')
+        self.end_date = subscription.get('end_date')
+        self.loaded_at = time.monotonic()
+
+_entitlements_lock = threading.Lock()
+_entitlements = OrderedDict()
+_entitlement_flight = SingleFlight("entitlements")
+
+def get_entitlement(subscription_id: int):
+    """The entitlement for a subscription, or None if the subscription doesn't exist."""
+    with _entitlements_lock:
+        entitlement = _entitlements.get(subscription_id)
+        if entitlement is not None and time.monotonic() - entitlement.loaded_at < _ENTITLEMENT_TTL_SECONDS:
+            _entitlements.move_to_end(subscription_id)
+            metrics.incr("entitlements.hit")
+            return entitlement
+    metrics.incr("entitlements.miss")
+    return _entitlement_flight.do(subscription_id, _load_entitlement, subscription_id)
+
+def _load_entitlement(subscription_id: int):
+    response = guarded_request(
+        _supabase_breaker, "GET",
+        f"{SUPABASE_URL}/rest/v1/user_subscriptions?select=id,user_id,plan_id,status,remaining_credits,end_date&id=eq.{subscription_id}",
+        headers=_headers()
+    )
+    response.raise_for_status()
+    rows = response.json()
+    if not rows:
+        return None
+    return remember_subscription(rows[0])
+
+def remember_subscription(subscription: dict) -> Entitlement:
+    """Cache the entitlement for a freshly read or written user_subscriptions row."""
+    entitlement = Entitlement(subscription, get_plan(subscription['plan_id']) if subscription.get('plan_id') else None)
+    with _entitlements_lock:
+        _entitlements[entitlement.subscription_id] = entitlement
+        _entitlements.move_to_end(entitlement.subscription_id)
+        while len(_entitlements) > _MAX_ENTITLEMENTS:
+            _entitlements.popitem(last=False)
+    return entitlement
+
+def update_remaining_credits(subscription_id: int, remaining_credits: int):
+    """Write-through after the database reported a subscription's new balance."""
+    with _entitlements_lock:
+        entitlement = _entitlements.get(subscription_id)
+        if entitlement is not None:
+            entitlement.remaining_credits = remaining_credits
+            entitlement.loaded_at = time.monotonic()
+
+def invalidate_entitlement(subscription_id: int):
+    with _entitlements_lock:
+        _entitlements.pop(subscription_id, None)
@@ -0,0 +1,214 @@
+"""
+Batch renewal and expiry processing for user_subscriptions.
+
+Due subscriptions (active or pending_payment, end_date before the as-of
+date) are read with a keyset-paged range query backed by the (status,
+end_date, id) index. Each
+page is split into chunks that are applied in parallel through the
+apply_subscription_renewals database function, which updates the rows and
+writes their credit_transactions in one transaction per chunk
+(database/subscription_renewals.sql).
+
+- auto_renew on an active plan, with a completed renewal payment in
+  subscription_payments that hasn't been applied yet: a new period starts,
+  credits are topped up to the plan's allowance ('renewed' ledger row) and
+  the payment is marked applied.
+- auto_renew without such a payment: the subscription waits as
+  'pending_payment' and is retried on later runs. Once RENEWAL_GRACE_DAYS
+  have passed since end_date, it expires instead.
+- otherwise: the subscription is marked expired ('expired' ledger row).
+
+The database decides whether a payment exists, in the same transaction that
+applies it, so a payment can only ever pay for one period. Nothing here
+takes payment; renewals wait for one recorded by the payments flow.
+
+Progress is checkpointed after every page, so an interrupted run resumes
+where it stopped. Re-applying a chunk is harmless because the database only
+touches rows that still have the status and end_date the processor saw.
+"""
+import os
+import json
+import time
+from datetime import date, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from config import SUPABASE_URL, SUPABASE_KEY
+from utils import metrics
+from services.subscription_cache import get_plans_snapshot, invalidate_entitlement
+
+DEFAULT_PAGE_SIZE = 5000
+DEFAULT_CHUNK_SIZE = 500
+DEFAULT_WORKERS = 8
+RENEWAL_GRACE_DAYS = int(os.getenv("RENEWAL_GRACE_DAYS", "3"))
+_MAX_ATTEMPTS = 3
+
+def _headers():
+    return {
+        'apikey': SUPABASE_KEY,
+        'Authorization': f'Bearer {SUPABASE_KEY}',
+        'Content-Type': 'application/json'
+    }
+
+def fetch_due_page(as_of: date, page_size: int, cursor=None) -> list:
+    """One page of due subscriptions ordered by (end_date, id), after `cursor`."""
+    url = (
+        f"{SUPABASE_URL}/rest/v1/user_subscriptions"
+        f"?select=id,plan_id,status,start_date,end_date,auto_renew,remaining_credits,total_credits"
+        f"&status=in.(active,pending_payment)&end_date=lt.{as_of.isoformat()}"
+        f"&order=end_date.asc,id.asc&limit={page_size}"
+    )
+    if cursor:
+        last_end_date, last_id = cursor
+        url += f"&or=(end_date.gt.{last_end_date},and(end_date.eq.{last_end_date},id.gt.{last_id}))"
+    response = requests.get(url, headers=_headers(), timeout=30)
+    response.raise_for_status()
+    return response.json()
+
+def build_change(subscription: dict, plan: dict, as_of: date) -> dict:
+    """The renewal or expiry to apply to one due subscription."""
+    remaining = subscription.get('remaining_credits') or 0
+    change = {
+        'id': subscription['id'],
+        'expected_status': subscription.get('status') or 'active',
+        'expected_end_date': subscription['end_date'],
+        'credits_used': 0,
+    }
+    if subscription.get('auto_renew') and plan and plan.get('is_active'):
+        duration = timedelta(days=plan['duration_days'])
+        start = date.fromisoformat(subscription['end_date'])
+        # Applied only if a renewal payment exists; see apply_subscription_renewals
+        change['expire_if_unpaid'] = start + timedelta(days=RENEWAL_GRACE_DAYS) < as_of
+        # A long-overdue subscription restarts today rather than in the past
+        if start + duration <= as_of:
+            start = as_of
+        change.update({
+            'status': 'active',
+            'start_date': start.isoformat(),
+            'end_date': (start + duration).isoformat(),
+            'remaining_credits': plan['credits'],
+            'total_credits': plan['credits'],
+            'transaction_type': 'renewed',
+            'description': f"Subscription renewed: {plan['name']} (+{max(plan['credits'] - remaining, 0)} credits)",
+        })
+    else:
+        change.update({
+            'status': 'expired',
+            'start_date': subscription.get('start_date'),
+            'end_date': subscription['end_date'],
+            'remaining_credits': remaining,
+            'total_credits': subscription.get('total_credits') or 0,
+            'transaction_type': 'expired',
+            'description': f"Subscription expired with {remaining} unused credits",
+        })
+    return change
+
+def apply_chunk(changes: list) -> dict:
+    """Apply one chunk in a single round-trip; returns {"applied", "renewed", "pending_payment", "expired"}."""
+    for attempt in range(1, _MAX_ATTEMPTS + 1):
+        try:
+            response = requests.post(
+                f"{SUPABASE_URL}/rest/v1/rpc/apply_subscription_renewals",
+                json={'p_changes': changes},
+                headers=_headers(),
+                timeout=60
+            )
+            response.raise_for_status()
+            return response.json()
+        except Exception:
+            if attempt == _MAX_ATTEMPTS:
+                raise
+            time.sleep(2 ** attempt)
+
+def _load_checkpoint(path: str, as_of: date):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        checkpoint = json.load(f)
+    # A checkpoint from another as-of date belongs to a different run
+    if checkpoint.get('as_of') != as_of.isoformat():
+        return None
+    return checkpoint
+
+def _save_checkpoint(path: str, as_of: date, cursor, stats: dict):
+    if not path:
+        return
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'as_of': as_of.isoformat(), 'cursor': cursor, 'stats': stats}, f)
+    os.replace(tmp_path, path)
+
+def process_due_subscriptions(as_of: date = None, page_size: int = DEFAULT_PAGE_SIZE,
+                              chunk_size: int = DEFAULT_CHUNK_SIZE, workers: int = DEFAULT_WORKERS,
+                              checkpoint_path: str = None, dry_run: bool = False, log=print) -> dict:
+    """
+    Renew or expire every subscription due before `as_of` (default: today).
+
+    Returns run statistics including throughput. With `checkpoint_path`, the
+    cursor is saved after each page and a later run with the same as-of date
+    resumes from it.
+    """
+    as_of = as_of or date.today()
+    plans = get_plans_snapshot().by_id
+
+    checkpoint = _load_checkpoint(checkpoint_path, as_of)
+    cursor = checkpoint['cursor'] if checkpoint else None
+    stats = checkpoint['stats'] if checkpoint else {
+        'scanned': 0, 'renewed': 0, 'pending_payment': 0, 'expired': 0, 'applied': 0
+    }
+    if checkpoint:
+        log(f"Resuming {as_of} run after subscription {cursor[1]} ({stats['scanned']} already scanned)")
+
+    started = time.perf_counter()
+    scanned_this_run = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            page = fetch_due_page(as_of, page_size, cursor)
+            if not page:
+                break
+
+            changes = [build_change(sub, plans.get(sub['plan_id']), as_of) for sub in page]
+
+            if dry_run:
+                # Whether a renewal is paid is only known when it is applied
+                renewals = sum(1 for change in changes if change['transaction_type'] == 'renewed')
+                stats['renewed'] += renewals
+                stats['expired'] += len(page) - renewals
+            else:
+                chunks = [changes[i:i + chunk_size] for i in range(0, len(changes), chunk_size)]
+                # Any failed chunk raises here, before the checkpoint moves past this page
+                for result in pool.map(apply_chunk, chunks):
+                    for key in ('applied', 'renewed', 'pending_payment', 'expired'):
+                        stats[key] += result.get(key) or 0
+                for change in changes:
+                    invalidate_entitlement(change['id'])
+
+            stats['scanned'] += len(page)
+            scanned_this_run += len(page)
+
+            last = page[-1]
+            cursor = [last['end_date'], last['id']]
+            if not dry_run:
+                _save_checkpoint(checkpoint_path, as_of, cursor, stats)
+
+            elapsed = time.perf_counter() - started
+            log(f"{stats['scanned']} scanned ({stats['renewed']} renewed, {stats['pending_payment']} awaiting payment, "
+                f"{stats['expired']} expired), "
+                f"{scanned_this_run / elapsed:.0f} subscriptions/s")
+
+            if len(page) < page_size:
+                break
+
+    # A finished run needs no resume point
+    if checkpoint_path and not dry_run and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    elapsed = time.perf_counter() - started
+    stats['elapsed_seconds'] = round(elapsed, 2)
+    stats['per_second'] = round(scanned_this_run / elapsed, 1) if elapsed else 0.0
+    metrics.incr("subscription_renewals.renewed", stats['renewed'])
+    metrics.incr("subscription_renewals.pending_payment", stats['pending_payment'])
+    metrics.incr("subscription_renewals.expired", stats['expired'])
+    metrics.observe("subscription_renewals.run_ms", elapsed * 1000)
+    return stats
@@ -3,19 +3,99 @@ import json
 import requests
 from groq import Groq
 import re
+from utils.resilience import get_breaker, budget_timeout
+from services.conversation_store import SESSION_ONLY_SLOTS
+
+_JSON_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+class _MessageStreamDecoder:
+    """Pulls the `confirmation_message` string out of a JSON reply while it is still streaming."""
+    _KEY = '"confirmation_message"'
+
+    def __init__(self):
+        self.buffer = ""
+        self._emitted = 0
+
+    def feed(self, chunk: str) -> str:
+        """Adds a streamed chunk and returns any newly decoded message text."""
+        self.buffer += chunk
+        text = self._partial_message()
+        if not text or len(text) <= self._emitted:
+            return ""
+        delta = text[self._emitted:]
+        self._emitted = len(text)
+        return delta
+
+    def _partial_message(self):
+        key = self.buffer.find(self._KEY)
+        if key < 0:
+            return None
+        colon = self.buffer.find(":", key + len(self._KEY))
+        start = self.buffer.find('"', colon + 1) if colon >= 0 else -1
+        if start < 0:
+            return None
+        out = []
+        i = start + 1
+        while i < len(self.buffer):
+            ch = self.buffer[i]
+            if ch == '"':
+                break
+            if ch != "\\":
+                out.append(ch)
+                i += 1
+                continue
+            # Stop at an escape sequence that hasn't fully arrived yet
+            if i + 1 >= len(self.buffer):
+                break
+            esc = self.buffer[i + 1]
+            if esc == "u":
+                if i + 6 > len(self.buffer):
+                    break
+                try:
+                    out.append(chr(int(self.buffer[i + 2:i + 6], 16)))
+                except ValueError:
+                    pass
+                i += 6
+            else:
+                out.append(_JSON_ESCAPES.get(esc, esc))
+                i += 2
+        return "".join(out)
+
+    def result(self) -> dict:
+        """
+        The full reply once the stream has ended, shaped like formulate_response's. When
+        no message could be recovered it has an "error" key instead, so the caller can
+        fall back to its own reply for the intent.
+        """
+        reply = None
+        start, end = self.buffer.find("{"), self.buffer.rfind("}")
+        if start >= 0 and end > start:
+            try:
+                reply = json.loads(self.buffer[start:end + 1])
+            except json.JSONDecodeError:
+                pass
+        if isinstance(reply, dict) and reply.get("confirmation_message"):
+            return reply
+        message = self._partial_message()
+        if message:
+            return {"confirmation_message": message, "new_context": {}}
+        new_context = reply.get("new_context") if isinstance(reply, dict) else None
+        return {"error": "No confirmation_message in the streamed reply", "new_context": new_context or {}}
 
 class VoiceAssistant:
     def __init__(self, supabase_url: str, supabase_headers: dict, supabase_client=None):
         self.supabase_url = supabase_url
         self.supabase_headers = supabase_headers
         self.supabase = supabase_client
+        self.groq_breaker = get_breaker("groq")
         self.model = self._configure_model()
 
     def _configure_model(self):
         try:
             api_key = os.environ.get("GROQ_API_KEY")
             if not api_key: raise ValueError("GROQ_API_KEY environment variable not set.")
-            client = Groq(api_key=api_key)
+            # Retries are left to the circuit breaker so a degraded Groq can't stall a worker
+            client = Groq(api_key=api_key, max_retries=0)
 
             return client
         except Exception as e:
@@ -526,11 +606,12 @@ class VoiceAssistant:
             if price_match and ("under" in user_text or "less than" in user_text or "for" in user_text):
                  return {"intent": "list_by_price_under", "price_limit": int(price_match.group(1))}
 
-            chat_completion = self.model.chat.completions.create(
+            chat_completion = self.groq_breaker.call(
+                self.model.chat.completions.create,
                 messages=[{"role": "user", "content": prompt}],
                 model="llama-3.1-8b-instant",
                 response_format={"type": "json_object"},
-                timeout=5  # 5 second timeout
+                timeout=budget_timeout(5)  # at most 5 seconds, less if the request budget is low
             )
             
             response_content = chat_completion.choices[0].message.content
@@ -552,6 +633,94 @@ class VoiceAssistant:
         AI Pass 2: Takes verified facts from our database and system and turns them into a
         natural, human-friendly sentence.
         """
+        scripted = self._scripted_response(user_text, intent, context_data)
+        if scripted is not None:
+            return scripted
+        prompt = self._response_prompt(user_text, intent, context_data)
+
+        # While Groq is unhealthy, answer from the verified facts without waiting on it
+        if self.groq_breaker.is_open():
+            return self._template_response(intent, context_data)
+
+        try:
+
+            chat_completion = self.groq_breaker.call(
+                self.model.chat.completions.create,
+                messages=[{"role": "user", "content": prompt}],
+                model="llama-3.1-8b-instant",
+                temperature=0.6,
+                response_format={"type": "json_object"},
+                timeout=budget_timeout(5)  # at most 5 seconds, less if the request budget is low
+            )
+            
+            response_content = chat_completion.choices[0].message.content
+
+            if not response_content:
+
+                return {"confirmation_message": "I'm sorry, I had a little trouble with that request. Please try again.", "new_context": {}}
+                
+            return json.loads(response_content)
+        except json.JSONDecodeError as e:
+
+            return {"confirmation_message": "I'm sorry, I had a little trouble with that request. Please try again.", "new_context": {}}
+        except Exception as e:
+
+            return {"confirmation_message": "I'm sorry, I had a little trouble with that request. Please try again.", "new_context": {}}
+
+    def stream_response(self, user_text: str, intent: str, context_data: dict):
+        """
+        Streaming variant of formulate_response. Yields ("token", text) pieces of the
+        confirmation message as Groq produces them, then a final ("done", response_dict)
+        shaped like formulate_response's return value. If the stream fails or the reply
+        has no message, response_dict has an "error" key and nothing may have been streamed.
+        """
+        scripted = self._scripted_response(user_text, intent, context_data)
+        if scripted is not None:
+            if scripted.get("confirmation_message"):
+                yield "token", scripted["confirmation_message"]
+            yield "done", scripted
+            return
+
+        if self.groq_breaker.is_open():
+            response = self._template_response(intent, context_data)
+            if response.get("confirmation_message"):
+                yield "token", response["confirmation_message"]
+            yield "done", response
+            return
+
+        decoder = _MessageStreamDecoder()
+        connected = False
+        try:
+            # JSON mode isn't available with streaming; the prompt already asks for JSON
+            stream = self.groq_breaker.call(
+                self.model.chat.completions.create,
+                messages=[{"role": "user", "content": self._response_prompt(user_text, intent, context_data)}],
+                model="llama-3.1-8b-instant",
+                temperature=0.6,
+                stream=True,
+                timeout=budget_timeout(5)
+            )
+            connected = True
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    text = decoder.feed(delta)
+                    if text:
+                        yield "token", text
+        except Exception as e:
+            # Errors after the connection is up aren't seen by breaker.call
+            if connected:
+                self.groq_breaker.record_failure()
+            print(f"Groq stream failed: {e}")
+
+        yield "done", decoder.result()
+
+    def _scripted_response(self, user_text: str, intent: str, context_data: dict):
+        """
+        Replies that don't need the LLM: booking flow steps, or everything when no model is
+        configured. Returns None when the LLM should formulate the response.
+        """
+
         if not self.model: 
             # Even if AI model is not available, handle basic booking flow
             user_text_lower = user_text.lower().strip()
@@ -1008,7 +1177,12 @@ class VoiceAssistant:
             # This will be handled by the main AI response generation
             pass
 
-        facts_for_prompt = json.dumps(context_data, indent=2)
+        return None
+
+    def _response_prompt(self, user_text: str, intent: str, context_data: dict):
+        """Builds the AI pass 2 prompt from the verified facts."""
+        facts = {k: v for k, v in (context_data or {}).items() if k not in SESSION_ONLY_SLOTS}
+        facts_for_prompt = json.dumps(facts, indent=2)
 
         prompt = f"""
         You are ByteBot, a friendly restaurant voice assistant. Create a conversational response based on verified facts.
@@ -1105,6 +1279,7 @@ class VoiceAssistant:
         - Say "I couldn't find exactly what you're looking for, but here are some similar items: [list similar items]"
         - This applies to all query types (ask_price, ask_about_dish, list_by_specific_type, etc.)
         - Use the `similar_items` list from facts to suggest alternatives
+        - If facts also contain `did_you_mean`, the name was probably misspelled: ask "Did you mean [first did_you_mean item]?" before listing alternatives
 
         **If intent is `clear_cart`:**
         - If `"cart_cleared": true`, simply say "Okay, I've cleared your cart."
@@ -1170,26 +1345,50 @@ class VoiceAssistant:
         - Provide a friendly, welcoming response.
             - Example: "Good evening! How can I help you today?"
         """
-        try:
+        return prompt
 
-            chat_completion = self.model.chat.completions.create(
-                messages=[{"role": "user", "content": prompt}],
-                model="llama-3.1-8b-instant",
-                temperature=0.6,
-                response_format={"type": "json_object"},
-                timeout=5  # 5 second timeout
-            )
-            
-            response_content = chat_completion.choices[0].message.content
-
-            if not response_content:
-
-                return {"confirmation_message": "I'm sorry, I had a little trouble with that request. Please try again.", "new_context": {}}
-                
-            return json.loads(response_content)
-        except json.JSONDecodeError as e:
-
-            return {"confirmation_message": "I'm sorry, I had a little trouble with that request. Please try again.", "new_context": {}}
-        except Exception as e:
-
-            return {"confirmation_message": "I'm sorry, I had a little trouble with that request. Please try again.", "new_context": {}}
\ No newline at end of file
+    def _template_response(self, intent: str, context_data: dict):
+        """
+        Template answers built only from verified facts, used while the LLM is unavailable.
+        Returns an error dict when no template fits so the route can use its own fallback.
+        """
+        facts = context_data or {}
+
+        def _names(items, limit=8):
+            return ", ".join(items[:limit])
+
+        if facts.get("login_required"):
+            message = "Please log in or sign up first, then I can help you with that."
+        elif facts.get("item_added"):
+            message = f"Okay, I've added {facts.get('name', facts['item_added'])} to your cart. Your new total is ₹{facts.get('total_cart_price', 0)}."
+        elif facts.get("item_found"):
+            message = f"{facts.get('item_name')} is ₹{facts.get('item_price')}. {facts.get('item_description', '')}".strip()
+        elif facts.get("ingredients_info") and facts.get("item_name"):
+            message = f"The {facts['item_name']} contains: {facts['ingredients_info']}"
+        elif facts.get("spice_level") and facts.get("item_name"):
+            message = f"The {facts['item_name']} has a {facts['spice_level']} spice level."
+        elif facts.get("matching_items"):
+            message = f"Here's what we have: {_names(facts['matching_items'])}."
+        elif facts.get("did_you_mean"):
+            message = f"I couldn't find '{facts.get('query_item')}'. Did you mean {facts['did_you_mean'][0]}?"
+        elif facts.get("similar_items"):
+            message = f"I couldn't find an exact match, but you might like: {_names(facts['similar_items'])}."
+        elif facts.get("popular_items"):
+            message = f"Our most popular dishes are: {_names(facts['popular_items'])}."
+        elif facts.get("special_items"):
+            message = f"Today's specials include: {_names(facts['special_items'])}."
+        elif facts.get("drink_items"):
+            message = f"For drinks we have: {_names(facts['drink_items'])}."
+        elif facts.get("healthy_items"):
+            message = f"Some healthy options are: {_names(facts['healthy_items'])}."
+        elif facts.get("dietary_items"):
+            message = f"Our {facts.get('dietary_type', 'dietary')} options are: {_names(facts['dietary_items'])}."
+        elif facts.get("menu_by_category"):
+            message = f"We have {facts.get('total_items', 0)} dishes across {', '.join(facts['menu_by_category'].keys())}. What would you like to explore?"
+        elif facts.get("cart_cleared"):
+            message = "Your cart is now empty."
+        elif facts.get("price_range"):
+            message = f"Our prices range from {facts['price_range']}. The average price is around {facts.get('average_price')}."
+        else:
+            return {"error": "AI service unavailable", "new_context": {}}
+        return {"confirmation_message": message, "new_context": {}}
@@ -7,7 +7,7 @@ def _build_cors_preflight_response():
     """Build a CORS preflight response."""
     response = jsonify({'message': 'CORS preflight successful'})
     response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,Idempotency-Key')
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS,PATCH')
     return response, 200
 
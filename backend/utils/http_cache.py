@@ -0,0 +1,133 @@
+"""
+Conditional GET helpers: strong ETags from cached data versions.
+
+Callers derive the ETag from the version of the data they would serve (a
+snapshot version plus whatever request arguments shape the body). If it
+matches the request's If-None-Match, a 304 goes back before anything is
+fetched or serialised.
+"""
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import Response, current_app, request
+
+from utils import metrics
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip and identity still work without it
+    brotli = None
+
+# Shared data: CDNs and browsers may reuse it briefly, then revalidate with the ETag
+PUBLIC_CACHE = "public, max-age=60, stale-while-revalidate=300"
+# Per-user data: browsers only, and always revalidated (cheap with a 304)
+PRIVATE_CACHE = "private, no-cache"
+
+def make_etag(*parts) -> str:
+    """A strong ETag value (unquoted) for the given version parts."""
+    raw = "|".join(str(part) for part in parts).encode("utf-8")
+    return hashlib.sha1(raw).hexdigest()[:20]
+
+def normalized_args(exclude=()) -> str:
+    """Query arguments in a canonical order, for folding into an ETag or cache key."""
+    return "&".join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True)) if k not in exclude)
+
+def not_modified(etag: str, cache_control: str, cors: bool = False):
+    """A 304 response if the client already holds `etag`, otherwise None."""
+    if not request.if_none_match.contains(etag):
+        return None
+    metrics.incr("http_cache.not_modified")
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    if cors:
+        response.headers.add('Access-Control-Allow-Origin', '*')
+    return response
+
+def with_cache_headers(response, etag: str, cache_control: str):
+    """Attach the ETag and Cache-Control to a full response."""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+# --- Pre-encoded response bodies ---
+
+class EncodedBody:
+    """A JSON body serialised once, with its compressed variants."""
+    __slots__ = ("identity", "gzip", "br", "etag")
+
+    def __init__(self, payload, etag: str):
+        self.identity = current_app.json.dumps(payload).encode("utf-8")
+        self.gzip = gzip.compress(self.identity, compresslevel=9)
+        self.br = brotli.compress(self.identity, quality=11) if brotli is not None else None
+        self.etag = etag
+
+def choose_encoding(body: EncodedBody) -> str:
+    """The best content-coding the client accepts: br, gzip or identity."""
+    accepted = request.accept_encodings
+    if body.br is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return "identity"
+
+def _variant_etag(etag: str, encoding: str) -> str:
+    # Strong ETags must differ between content-codings of the same resource
+    return etag if encoding == "identity" else f"{etag}-{encoding}"
+
+def encoded_not_modified(etag: str, cache_control: str, cors: bool = False):
+    """Like `not_modified`, for responses served through `encoded_response`."""
+    for encoding in ("identity", "gzip", "br"):
+        response = not_modified(_variant_etag(etag, encoding), cache_control, cors)
+        if response is not None:
+            response.headers['Vary'] = 'Accept-Encoding'
+            return response
+    return None
+
+def encoded_response(body: EncodedBody, cache_control: str, status: int = 200):
+    """Serve the pre-encoded variant matching Accept-Encoding; no serialisation or compression."""
+    encoding = choose_encoding(body)
+    data = body.identity if encoding == "identity" else getattr(body, encoding)
+    response = Response(data, status=status, mimetype="application/json")
+    if encoding != "identity":
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.set_etag(_variant_etag(body.etag, encoding))
+    response.headers['Cache-Control'] = cache_control
+    metrics.incr(f"http_cache.encoded.{encoding}")
+    return response
+
+class EncodedBodyCache:
+    """
+    Bounded LRU of EncodedBody per key (typically data version + normalised
+    arguments). Entries for an older data version are dropped when the first
+    body for a new version is stored.
+    """
+
+    def __init__(self, name: str, max_entries: int = 64):
+        self.name = name
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._version = None
+
+    def get(self, version: str, key: str, build, etag: str) -> EncodedBody:
+        """The cached body for (version, key), built from `build()` on a miss."""
+        with self._lock:
+            body = self._entries.get((version, key))
+            if body is not None:
+                self._entries.move_to_end((version, key))
+                metrics.incr(f"{self.name}.hit")
+                return body
+        metrics.incr(f"{self.name}.miss")
+        body = EncodedBody(build(), etag)
+        with self._lock:
+            if version != self._version:
+                self._entries = OrderedDict((k, v) for k, v in self._entries.items() if k[0] == version)
+                self._version = version
+            self._entries[(version, key)] = body
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return body
@@ -0,0 +1,265 @@
+"""
+Idempotency-Key support for write endpoints.
+
+A client that retries a write sends the same `Idempotency-Key` header. The
+first request runs normally and its response (status and body) is kept for a
+TTL; replays get the stored response without running the handler again, and
+concurrent duplicates wait for the first to finish. Requests without the
+header are not affected.
+
+Keys live in the Supabase `idempotency_keys` table (database/idempotency_keys.sql)
+so a retry that lands on another gunicorn worker is still deduplicated. With
+IDEMPOTENCY_STORE=memory, or while Supabase cannot be reached, keys are kept
+in this process only; that is safe for a single worker but lets a retry on
+another worker run the handler a second time.
+"""
+import os
+import time
+import hashlib
+import functools
+import threading
+from collections import OrderedDict
+from flask import request, jsonify, make_response, Response
+
+from config import SUPABASE_URL, SUPABASE_HEADERS
+from utils import metrics
+from utils.resilience import get_breaker, guarded_request
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+MAX_IDEMPOTENCY_KEYS = int(os.getenv("MAX_IDEMPOTENCY_KEYS", "10000"))
+# How long a duplicate waits for the original request before giving up
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "30"))
+# "supabase" shares keys across workers; "memory" keeps them per process
+IDEMPOTENCY_STORE = os.getenv("IDEMPOTENCY_STORE", "supabase").lower()
+# An in-flight claim older than this is assumed dead and can be taken over
+IDEMPOTENCY_LEASE_SECONDS = int(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "120"))
+_POLL_SECONDS = 0.25
+_PRUNE_INTERVAL_SECONDS = 3600
+
+class _Entry:
+    __slots__ = ("fingerprint", "event", "status", "body", "mimetype", "created_at")
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.event = threading.Event()
+        self.status = None
+        self.body = None
+        self.mimetype = None
+        self.created_at = time.monotonic()
+
+class IdempotencyStore:
+    """Bounded TTL store of in-flight and completed requests, keyed by (endpoint, key)."""
+
+    def __init__(self, ttl_seconds: int = IDEMPOTENCY_TTL_SECONDS, max_keys: int = MAX_IDEMPOTENCY_KEYS):
+        self.ttl_seconds = ttl_seconds
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def begin(self, key, fingerprint: str):
+        """Return (entry, is_owner). The owner must later call `complete` or `abandon`."""
+        with self._lock:
+            self._evict()
+            entry = self._entries.get(key)
+            if entry is not None:
+                return entry, False
+            entry = self._entries[key] = _Entry(fingerprint)
+            return entry, True
+
+    def complete(self, key, entry: _Entry, status: int, body: bytes, mimetype: str):
+        with self._lock:
+            entry.status, entry.body, entry.mimetype = status, body, mimetype
+            entry.event.set()
+
+    def abandon(self, key, entry: _Entry):
+        """Forget a request that failed without a response worth replaying."""
+        with self._lock:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+            entry.event.set()
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._entries:
+            oldest_key, oldest = next(iter(self._entries.items()))
+            if len(self._entries) >= self.max_keys or now - oldest.created_at > self.ttl_seconds:
+                del self._entries[oldest_key]
+                # Anyone still waiting on an evicted in-flight entry retries on its own
+                oldest.event.set()
+            else:
+                break
+
+class StoreUnavailable(Exception):
+    """The shared key store could not be reached."""
+
+class SharedIdempotencyStore:
+    """Keys in the Supabase `idempotency_keys` table, claimed through RPCs."""
+
+    def __init__(self, ttl_seconds: int = IDEMPOTENCY_TTL_SECONDS, lease_seconds: int = IDEMPOTENCY_LEASE_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.lease_seconds = lease_seconds
+        self._last_prune = time.monotonic()
+
+    def _rpc(self, name: str, payload: dict):
+        try:
+            response = guarded_request(
+                get_breaker("supabase"), "POST", f"{SUPABASE_URL}/rest/v1/rpc/{name}",
+                headers=SUPABASE_HEADERS, json=payload, timeout=5
+            )
+        except Exception as e:
+            raise StoreUnavailable(str(e)) from e
+        if response.status_code >= 300:
+            raise StoreUnavailable(f"{name} returned {response.status_code}: {response.text[:200]}")
+        return response.json() if response.content else None
+
+    def claim(self, key, fingerprint: str) -> dict:
+        """Return {"owner": True} or the existing claim; see claim_idempotency_key."""
+        endpoint, idempotency_key = key
+        claim = self._rpc("claim_idempotency_key", {
+            "p_endpoint": endpoint, "p_key": idempotency_key, "p_fingerprint": fingerprint,
+            "p_ttl_seconds": self.ttl_seconds, "p_lease_seconds": self.lease_seconds,
+        })
+        self._prune_if_due()
+        return claim
+
+    def complete(self, key, status: int, body: str, mimetype: str):
+        endpoint, idempotency_key = key
+        self._rpc("complete_idempotency_key", {
+            "p_endpoint": endpoint, "p_key": idempotency_key,
+            "p_status": status, "p_body": body, "p_mimetype": mimetype,
+        })
+
+    def release(self, key):
+        endpoint, idempotency_key = key
+        self._rpc("release_idempotency_key", {"p_endpoint": endpoint, "p_key": idempotency_key})
+
+    def _prune_if_due(self):
+        # Claims clear their own key's expired row; this drops keys never retried
+        if time.monotonic() - self._last_prune < _PRUNE_INTERVAL_SECONDS:
+            return
+        self._last_prune = time.monotonic()
+        try:
+            self._rpc("prune_idempotency_keys", {"p_ttl_seconds": self.ttl_seconds})
+        except StoreUnavailable as e:
+            print(f"Idempotency key prune failed: {e}")
+
+_store = IdempotencyStore()
+_shared_store = SharedIdempotencyStore() if SUPABASE_URL and IDEMPOTENCY_STORE == "supabase" else None
+
+def _replay(status: int, body, mimetype: str):
+    metrics.incr("idempotency.replayed")
+    response = Response(body, status=status, mimetype=mimetype)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def _key_reused():
+    return jsonify({"error": f"{IDEMPOTENCY_HEADER} was already used with a different request"}), 422
+
+def _still_processing():
+    return jsonify({"error": "A request with this Idempotency-Key is still being processed"}), 409
+
+def _run_shared(view, args, kwargs, store_key, fingerprint: str):
+    """Run `view` once across workers. Raises StoreUnavailable before the view runs."""
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        claim = _shared_store.claim(store_key, fingerprint)
+        if claim.get("owner"):
+            break
+        if claim.get("fingerprint") is None:
+            # The other request was released between our insert and read
+            continue
+        if claim["fingerprint"] != fingerprint:
+            return _key_reused()
+        if claim.get("status") is not None:
+            return _replay(claim["status"], claim["body"], claim["mimetype"])
+        metrics.incr("idempotency.waited")
+        if time.monotonic() >= deadline:
+            return _still_processing()
+        time.sleep(_POLL_SECONDS)
+
+    try:
+        response = make_response(view(*args, **kwargs))
+    except Exception:
+        _release_shared(store_key)
+        raise
+
+    body = None
+    if response.status_code < 500 and not response.is_streamed:
+        try:
+            body = response.get_data(as_text=True)
+        except UnicodeDecodeError:
+            body = None
+    if body is None:
+        _release_shared(store_key)
+        return response
+    try:
+        _shared_store.complete(store_key, response.status_code, body, response.mimetype)
+    except StoreUnavailable as e:
+        # The handler already ran; a retry after the lease runs it again
+        print(f"Could not store idempotent response for {store_key[0]}: {e}")
+        metrics.incr("idempotency.store_unavailable")
+    return response
+
+def _release_shared(store_key):
+    try:
+        _shared_store.release(store_key)
+    except StoreUnavailable as e:
+        print(f"Could not release idempotency key for {store_key[0]}: {e}")
+        metrics.incr("idempotency.store_unavailable")
+
+def _run_local(view, args, kwargs, store_key, fingerprint: str):
+    """Run `view` once within this process."""
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+
+    while True:
+        entry, owner = _store.begin(store_key, fingerprint)
+        if owner:
+            break
+        if entry.fingerprint != fingerprint:
+            return _key_reused()
+        metrics.incr("idempotency.waited")
+        if not entry.event.wait(max(0.0, deadline - time.monotonic())):
+            return _still_processing()
+        if entry.status is not None:
+            return _replay(entry.status, entry.body, entry.mimetype)
+        # The original request failed; loop round and run it ourselves
+
+    try:
+        response = make_response(view(*args, **kwargs))
+    except Exception:
+        _store.abandon(store_key, entry)
+        raise
+
+    if response.status_code < 500 and not response.is_streamed:
+        _store.complete(store_key, entry, response.status_code, response.get_data(), response.mimetype)
+    else:
+        _store.abandon(store_key, entry)
+    return response
+
+def idempotent(view):
+    """Make a Flask view safe to retry with an `Idempotency-Key` header.
+
+    Only responses below 500 are stored; a server error or exception releases
+    the key so the client's retry runs the handler again. Binary responses
+    are not stored in the shared table and are released the same way.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view(*args, **kwargs)
+
+        store_key = (request.endpoint, key)
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+
+        if _shared_store is not None:
+            try:
+                return _run_shared(view, args, kwargs, store_key, fingerprint)
+            except StoreUnavailable as e:
+                # Better to dedupe within this worker than to refuse the write
+                print(f"Idempotency store unavailable, using per-process keys: {e}")
+                metrics.incr("idempotency.store_unavailable")
+        return _run_local(view, args, kwargs, store_key, fingerprint)
+
+    return wrapper
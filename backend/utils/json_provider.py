@@ -0,0 +1,67 @@
+"""
+JSON provider for the Flask app that uses orjson when it is installed.
+
+Output matches Flask's default provider for the types our routes return:
+- datetimes and dates are HTTP dates, as Flask formats them
+- Decimals and UUIDs are strings
+- dataclasses become objects
+- keys are sorted when `sort_keys` is on
+Anything orjson can't encode (for example integers wider than 64 bits)
+falls back to the stdlib encoder. Without orjson, the provider is just
+Flask's default.
+"""
+import uuid
+import decimal
+import dataclasses
+from datetime import date
+
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:  # Optional speed-up; the stdlib encoder is used without it
+    orjson = None
+
+def _default(o):
+    if isinstance(o, date):
+        return http_date(o)
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return dataclasses.asdict(o)
+    if hasattr(o, "__html__"):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+class FastJSONProvider(DefaultJSONProvider):
+    """DefaultJSONProvider with orjson doing the encoding and decoding when available."""
+
+    def _options(self, kwargs) -> int:
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if kwargs.pop("sort_keys", self.sort_keys):
+            options |= orjson.OPT_SORT_KEYS
+        if kwargs.pop("indent", None):
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs) -> str:
+        if orjson is None:
+            return super().dumps(obj, **kwargs)
+        options_kwargs = dict(kwargs)
+        options = self._options(options_kwargs)
+        options_kwargs.pop("separators", None)
+        options_kwargs.pop("ensure_ascii", None)
+        if options_kwargs:
+            # Unusual stdlib arguments (cls, default, ...): let the stdlib handle them
+            return super().dumps(obj, **kwargs)
+        try:
+            return orjson.dumps(obj, default=_default, option=options).decode("utf-8")
+        except TypeError:
+            # orjson.JSONEncodeError is a TypeError: e.g. ints beyond 64 bits
+            return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
@@ -0,0 +1,151 @@
+"""
+Precomputed facets over a menu item list for the voice assistant's list intents.
+
+Built once per menu list (the menu snapshot's items):
+- word tokens of each item's name, description and category, with a sorted
+  vocabulary so a query word finds its tokens by bisect prefix search
+- item positions per dietary and display flag, per category and per drink
+  category
+- items sorted by price, searched with bisect for "under X"
+
+The lookups return item names in menu order, like the scans they replace.
+A text query matches only at word starts: "egg" finds "Egg Curry" and
+"eggplant" but not "veggie".
+"""
+import bisect
+import threading
+
+from utils.menu_matcher import normalize_text
+
+_DRINK_WORDS = ('beverage', 'drink', 'coffee', 'tea')
+_COMBO_WORDS = ('combo', 'meal', 'deal')
+
+# Dietary type (as the intent parser names it) -> item flags, any of which qualifies
+DIETARY_FLAGS = {
+    'vegan': ('is_vegan',),
+    'vegetarian': ('is_vegetarian', 'is_veg'),
+    'gluten-free': ('is_gluten_free',),
+}
+
+class MenuFacets:
+    """Facet indexes over one menu list. Treat as read-only once built."""
+
+    def __init__(self, menu_list: list):
+        self.items = menu_list
+        self.names = [item.get('name') for item in menu_list]
+        self.text_fields = []        # (name, description) per item, normalised
+        self.category_fields = []
+        self.token_index = {}        # token -> set of positions, from name and description
+        self.category_token_index = {}
+        self.by_category = {}
+        self.dietary = {dietary_type: [] for dietary_type in DIETARY_FLAGS}
+        self.specials, self.popular, self.healthy, self.drinks, self.combos = [], [], [], [], []
+        priced = []
+        for idx, item in enumerate(menu_list):
+            name = normalize_text(item.get('name'))
+            description = normalize_text(item.get('description'))
+            category = normalize_text(item.get('category_name'))
+            self.text_fields.append((name, description))
+            self.category_fields.append(category)
+            for token in f"{name} {description}".split():
+                self.token_index.setdefault(token, set()).add(idx)
+            for token in category.split():
+                self.category_token_index.setdefault(token, set()).add(idx)
+            self.by_category.setdefault((item.get('category_name') or '').lower(), []).append(idx)
+
+            for dietary_type, flags in DIETARY_FLAGS.items():
+                if any(item.get(flag) for flag in flags):
+                    self.dietary[dietary_type].append(idx)
+            if item.get('is_seasonal') or item.get('is_chef_special') or item.get('is_chef_spl') or item.get('is_new'):
+                self.specials.append(idx)
+            if item.get('is_bestseller') or item.get('is_popular'):
+                self.popular.append(idx)
+            if item.get('is_organic') or item.get('is_healthy') or 'salad' in name:
+                self.healthy.append(idx)
+            raw_category = (item.get('category_name') or '').lower()
+            if any(word in raw_category for word in _DRINK_WORDS):
+                self.drinks.append(idx)
+            if any(word in name for word in _COMBO_WORDS):
+                self.combos.append(idx)
+
+            price = item.get('price', 9999)
+            if price is not None:
+                priced.append((price, idx))
+        priced.sort()
+        self.prices = [price for price, _ in priced]
+        self.by_price = [idx for _, idx in priced]
+        self.vocabulary = sorted(self.token_index)
+        self.category_vocabulary = sorted(self.category_token_index)
+
+    # --- Lookups ---
+
+    def _names(self, positions) -> list:
+        return [self.names[idx] for idx in sorted(positions)]
+
+    @staticmethod
+    def _prefixed(vocabulary: list, index: dict, word: str) -> set:
+        found = set()
+        for position in range(bisect.bisect_left(vocabulary, word), len(vocabulary)):
+            token = vocabulary[position]
+            if not token.startswith(word):
+                break
+            found |= index[token]
+        return found
+
+    def _phrase_candidates(self, vocabulary: list, index: dict, phrase: str) -> set:
+        """Positions with a token starting with each word of `phrase`."""
+        candidates = None
+        for word in phrase.split():
+            postings = self._prefixed(vocabulary, index, word)
+            candidates = postings if candidates is None else candidates & postings
+            if not candidates:
+                return set()
+        return candidates or set()
+
+    def _text_matches(self, phrase: str) -> set:
+        candidates = self._phrase_candidates(self.vocabulary, self.token_index, phrase)
+        return {idx for idx in candidates if any(phrase in field for field in self.text_fields[idx])}
+
+    # --- Intent lookups ---
+
+    def by_ingredient(self, ingredient: str) -> list:
+        """Names of items mentioning `ingredient` in their name or description."""
+        phrase = normalize_text(ingredient)
+        return self._names(self._text_matches(phrase)) if phrase else []
+
+    def by_type(self, specific_type: str) -> list:
+        """Names of items whose name, description or category mentions `specific_type`."""
+        phrase = normalize_text(specific_type)
+        if not phrase:
+            return []
+        in_category = self._phrase_candidates(self.category_vocabulary, self.category_token_index, phrase)
+        in_category = {idx for idx in in_category if phrase in self.category_fields[idx]}
+        return self._names(self._text_matches(phrase) | in_category)
+
+    def by_category_name(self, category_name: str) -> list:
+        return self._names(self.by_category.get((category_name or '').lower(), ()))
+
+    def under_price(self, price_limit) -> list:
+        """Names of items priced at or below `price_limit`."""
+        return self._names(self.by_price[:bisect.bisect_right(self.prices, price_limit)])
+
+    def by_dietary_type(self, dietary_type: str) -> list:
+        return self._names(self.dietary.get(dietary_type, ()))
+
+    def flagged(self, facet: str) -> list:
+        """Names for one of: specials, popular, healthy, drinks, combos."""
+        return self._names(getattr(self, facet))
+
+_facets_lock = threading.Lock()
+_facets = None
+
+def get_menu_facets(menu_list: list) -> MenuFacets:
+    """The facets for `menu_list`, reused for as long as the same list is passed in."""
+    global _facets
+    facets = _facets
+    if facets is not None and facets.items is menu_list:
+        return facets
+    facets = MenuFacets(menu_list)
+    with _facets_lock:
+        _facets = facets
+    return facets
@@ -0,0 +1,219 @@
+"""
+Prebuilt fuzzy matcher over a menu item list.
+
+Building the matcher normalises every name, description and category once
+and creates three indexes:
+- exact normalised name -> item
+- sorted names, for prefix lookups with bisect
+- name token -> items, and name trigram -> items
+A query then touches only its candidates instead of re-normalising the
+whole menu. Edit distance runs only on the few best trigram candidates, and
+that is what gives typo tolerance and "did you mean" suggestions.
+
+`get_menu_matcher(menu_list)` keeps the matcher for the current menu list
+(the menu snapshot's items), so it is rebuilt only when the snapshot changes.
+"""
+import re
+import bisect
+import threading
+
+_NON_ALNUM = re.compile(r"[^a-z0-9 ]+")
+
+def normalize_text(value: str) -> str:
+    return _NON_ALNUM.sub("", (value or "").lower()).strip()
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def edit_distance(a: str, b: str, limit: int = None) -> int:
+    """Levenshtein distance; stops early once it must exceed `limit`."""
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    if limit is not None and len(a) - len(b) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        current = [i]
+        for j, cb in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if limit is not None and min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+class MenuMatcher:
+    """Indexes over one menu list. Treat as read-only once built."""
+
+    # Minimum similarity (1 - distance / length) for a typo-tolerant match
+    FUZZY_THRESHOLD = 0.7
+    # Trigram candidates that get an exact edit-distance score
+    FUZZY_CANDIDATES = 12
+
+    def __init__(self, menu_list: list):
+        self.items = menu_list
+        self.names = []
+        self.descriptions = []
+        self.categories = []
+        self.name_tokens = []
+        self.by_name = {}
+        self.token_index = {}
+        self.trigram_index = {}
+        for idx, item in enumerate(menu_list):
+            name = normalize_text(item.get('name', ''))
+            tokens = set(name.split())
+            self.names.append(name)
+            self.descriptions.append(normalize_text(item.get('description', '')))
+            self.categories.append(normalize_text(item.get('category_name', '')))
+            self.name_tokens.append(tokens)
+            self.by_name.setdefault(name, idx)
+            for token in tokens:
+                self.token_index.setdefault(token, []).append(idx)
+            for gram in _trigrams(name):
+                self.trigram_index.setdefault(gram, set()).add(idx)
+        self.sorted_names = sorted((name, idx) for idx, name in enumerate(self.names))
+
+    # --- Lookups ---
+
+    def _prefixed(self, prefix: str) -> list:
+        start = bisect.bisect_left(self.sorted_names, (prefix, -1))
+        found = []
+        for name, idx in self.sorted_names[start:]:
+            if not name.startswith(prefix):
+                break
+            found.append(idx)
+        return found
+
+    def _containing(self, text: str) -> list:
+        if len(text) < 3:
+            return [idx for idx, name in enumerate(self.names) if text in name]
+        # Every name containing `text` contains all of its inner trigrams
+        grams = [text[i:i + 3] for i in range(len(text) - 2)]
+        candidates = None
+        for gram in grams:
+            postings = self.trigram_index.get(gram)
+            if not postings:
+                return []
+            candidates = set(postings) if candidates is None else candidates & postings
+        return sorted(idx for idx in candidates if text in self.names[idx])
+
+    def _token_overlap(self, tokens: set) -> dict:
+        scores = {}
+        for token in tokens:
+            for idx in self.token_index.get(token, ()):
+                scores[idx] = scores.get(idx, 0) + 1
+        return scores
+
+    def fuzzy(self, query: str, limit: int = 5) -> list:
+        """(item, similarity) pairs for names within typo distance of `query`, best first."""
+        q_norm = normalize_text(query)
+        if not q_norm:
+            return []
+        q_grams = _trigrams(q_norm)
+        shared = {}
+        for gram in q_grams:
+            for idx in self.trigram_index.get(gram, ()):
+                shared[idx] = shared.get(idx, 0) + 1
+        if not shared:
+            return []
+        candidates = sorted(shared, key=lambda idx: (-shared[idx], idx))[:self.FUZZY_CANDIDATES]
+        scored = []
+        for idx in candidates:
+            name = self.names[idx]
+            length = max(len(name), len(q_norm))
+            max_distance = int(length * (1 - self.FUZZY_THRESHOLD))
+            distance = edit_distance(q_norm, name, limit=max_distance)
+            if distance <= max_distance:
+                scored.append((idx, 1 - distance / length))
+        scored.sort(key=lambda pair: (-pair[1], pair[0]))
+        return [(self.items[idx], round(similarity, 3)) for idx, similarity in scored[:limit]]
+
+    # --- Public matching ---
+
+    def best_match(self, query_name: str, fuzzy: bool = False):
+        """
+        Best item for `query_name`: exact name, then prefix, then substring, then
+        the most shared name tokens (earliest item wins ties). With `fuzzy`, a
+        close misspelling is accepted as a last resort. Returns None otherwise.
+        """
+        q_norm = normalize_text(query_name)
+        if not q_norm:
+            return None
+
+        idx = self.by_name.get(q_norm)
+        if idx is not None:
+            return self.items[idx]
+
+        prefixed = self._prefixed(q_norm)
+        if prefixed:
+            return self.items[min(prefixed)]
+
+        containing = self._containing(q_norm)
+        if containing:
+            return self.items[containing[0]]
+
+        scores = self._token_overlap(set(q_norm.split()))
+        if scores:
+            best = min(scores, key=lambda i: (-scores[i], i))
+            return self.items[best]
+
+        if fuzzy:
+            matches = self.fuzzy(q_norm, limit=1)
+            if matches:
+                return matches[0][0]
+        return None
+
+    def similar(self, query: str, max_results: int = 5) -> list:
+        """
+        Names of items related to `query`, best first: substring hits in the
+        name (10), description (5) or category (3), plus 2 per shared name
+        token, with close misspellings of a name filling any remaining slots.
+        """
+        q_norm = normalize_text(query)
+        if not q_norm:
+            return []
+        scores = {idx: 2 * overlap for idx, overlap in self._token_overlap(set(q_norm.split())).items()}
+        for idx in self._containing(q_norm):
+            scores[idx] = scores.get(idx, 0) + 10
+        for idx, description in enumerate(self.descriptions):
+            if q_norm in description:
+                scores[idx] = scores.get(idx, 0) + 5
+        for idx, category in enumerate(self.categories):
+            if q_norm in category:
+                scores[idx] = scores.get(idx, 0) + 3
+
+        ranked = sorted(scores, key=lambda idx: (-scores[idx], idx))[:max_results]
+        names = [self.items[idx]['name'] for idx in ranked]
+        if len(names) < max_results:
+            for item, _ in self.fuzzy(q_norm, limit=max_results):
+                if item['name'] not in names:
+                    names.append(item['name'])
+                if len(names) == max_results:
+                    break
+        return names
+
+    def did_you_mean(self, query: str, limit: int = 3) -> list:
+        """Distinct names of the closest misspelling matches for `query`."""
+        names = []
+        for item, _ in self.fuzzy(query, limit=self.FUZZY_CANDIDATES):
+            if item['name'] not in names:
+                names.append(item['name'])
+            if len(names) == limit:
+                break
+        return names
+
+_matcher_lock = threading.Lock()
+_matcher = None
+
+def get_menu_matcher(menu_list: list) -> MenuMatcher:
+    """The matcher for `menu_list`, reused for as long as the same list is passed in."""
+    global _matcher
+    matcher = _matcher
+    if matcher is not None and matcher.items is menu_list:
+        return matcher
+    matcher = MenuMatcher(menu_list)
+    with _matcher_lock:
+        _matcher = matcher
+    return matcher
@@ -1,13 +1,22 @@
 """
 Menu utility functions for the ByteEat application.
 """
-import requests
-import re
+import os
+import json
+import time
+import hashlib
+import threading
+from utils.resilience import get_breaker, guarded_request
+from utils.singleflight import SingleFlight
+from utils.menu_matcher import get_menu_matcher, normalize_text
+
+_supabase_breaker = get_breaker("supabase")
 
 def get_menu_items(supabase_url: str, supabase_headers: dict):
     """Fetches all menu items from Supabase."""
     try:
-        response = requests.get(
+        response = guarded_request(
+            _supabase_breaker, "GET",
             f"{supabase_url}/rest/v1/menu_items?select=*",
             headers=supabase_headers
         )
@@ -18,9 +27,18 @@ def get_menu_items(supabase_url: str, supabase_headers: dict):
 
 def get_full_menu_with_categories(supabase_url: str, supabase_headers: dict):
     """Fetches all categories and their associated menu items."""
+    all_items, category_names, _ = _fetch_menu_tree(supabase_url, supabase_headers)
+    return all_items, category_names
+
+def _fetch_menu_tree(supabase_url: str, supabase_headers: dict):
+    """Returns (flattened items, category names, category rows without their items).
+
+    On failure the category rows are None, so an empty menu can be told apart from an outage.
+    """
     try:
-        api_url = f"{supabase_url}/rest/v1/categories?select=name,menu_items(*)"
-        response = requests.get(api_url, headers=supabase_headers)
+        # Stable ordering keeps the snapshot version identical across workers
+        api_url = f"{supabase_url}/rest/v1/categories?select=*,menu_items(*)&order=id.asc&menu_items.order=id.asc"
+        response = guarded_request(_supabase_breaker, "GET", api_url, headers=supabase_headers)
         response.raise_for_status()
         
         structured_menu = response.json()
@@ -28,103 +46,108 @@ def get_full_menu_with_categories(supabase_url: str, supabase_headers: dict):
         # Flatten the structure for easier processing by the AI
         all_items = []
         category_names = []
+        category_rows = []
         for category in structured_menu:
             category_name = category.get('name')
             if category_name:
                 category_names.append(category_name)
+            category_rows.append({k: v for k, v in category.items() if k != 'menu_items'})
             for item in category.get('menu_items', []):
                 item['category_name'] = category_name  # Add category name to each item
                 all_items.append(item)
                 
-        return all_items, category_names
+        return all_items, category_names, category_rows
     except Exception as e:
-        return [], []
+        return [], [], None
+
+# --- Menu snapshot cache ---
+# A short-lived, shared copy of the full menu. Reloads are single-flighted so an
+# expiry under load costs one Supabase round-trip, not one per waiting request.
+
+_MENU_SNAPSHOT_TTL_SECONDS = int(os.getenv("MENU_SNAPSHOT_TTL_SECONDS", "60"))
+
+class MenuUnavailableError(RuntimeError):
+    """The menu couldn't be loaded and there is no earlier snapshot to fall back on."""
+
+class MenuSnapshot:
+    """Read-only view of the menu: flattened items, category names and rows, and a content version."""
+    __slots__ = ("items", "categories", "category_rows", "version", "loaded_at")
+
+    def __init__(self, items: list, categories: list, category_rows: list = None):
+        self.items = items
+        self.categories = categories
+        self.category_rows = category_rows or []
+        self.version = _menu_version(items, self.category_rows or categories)
+        self.loaded_at = time.time()
+
+def _menu_version(items: list, categories: list) -> str:
+    """Stable content hash, identical across workers for identical menus."""
+    payload = json.dumps([items, categories], sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha1(payload).hexdigest()[:16]
+
+_menu_snapshot = None
+_menu_generation = 0
+_menu_snapshot_lock = threading.Lock()
+_menu_flight = SingleFlight("menu_snapshot")
+
+def get_menu_snapshot(supabase_url: str, supabase_headers: dict) -> MenuSnapshot:
+    """Returns the cached menu snapshot, reloading it once it is older than the TTL.
+
+    Callers must treat `items` as read-only; they are shared between requests.
+    If a reload fails, the previous snapshot keeps being served; with none to
+    fall back on, MenuUnavailableError is raised.
+    """
+    snapshot = _menu_snapshot
+    if snapshot is not None and time.time() - snapshot.loaded_at < _MENU_SNAPSHOT_TTL_SECONDS:
+        return snapshot
+    return _menu_flight.do("menu", _load_menu_snapshot, supabase_url, supabase_headers)
+
+def _load_menu_snapshot(supabase_url: str, supabase_headers: dict) -> MenuSnapshot:
+    global _menu_snapshot
+    generation = _menu_generation
+    items, categories, category_rows = _fetch_menu_tree(supabase_url, supabase_headers)
+    if category_rows is None:
+        # Upstream failed: keep serving what we had, but never invent an empty menu
+        if _menu_snapshot is None:
+            raise MenuUnavailableError("Could not load the menu from Supabase")
+        return _menu_snapshot
+    snapshot = MenuSnapshot(items, categories, category_rows)
+    with _menu_snapshot_lock:
+        # Don't cache data that was fetched before an invalidation landed
+        if generation == _menu_generation:
+            _menu_snapshot = snapshot
+    return snapshot
+
+def invalidate_menu_snapshot():
+    """Force the next `get_menu_snapshot` call to reload. Call after any menu write."""
+    global _menu_generation
+    with _menu_snapshot_lock:
+        _menu_generation += 1
+        if _menu_snapshot is not None:
+            _menu_snapshot.loaded_at = 0
 
 def _normalize_text(value: str) -> str:
     """Normalize text for fuzzy matching by removing special characters and converting to lowercase."""
-    try:
-        return re.sub(r"[^a-z0-9 ]+", "", (value or "").lower()).strip()
-    except Exception:
-        return (value or "").lower().strip()
+    return normalize_text(value)
 
-def find_best_menu_match(menu_list: list, query_name: str):
+def find_best_menu_match(menu_list: list, query_name: str, fuzzy: bool = False):
     """Return the best matching menu item dict for the given query_name.
     Prefers exact (case-insensitive) match; otherwise tries startswith, contains,
-    and simple token overlap scoring. Returns None if nothing reasonable found.
+    and simple token overlap scoring. With `fuzzy`, a close misspelling is also
+    accepted. Returns None if nothing reasonable found.
     """
     if not query_name:
         return None
-    q_norm = _normalize_text(query_name)
-    if not q_norm:
-        return None
-
-    # 1) Exact (case-insensitive)
-    for item in menu_list:
-        if _normalize_text(item.get('name', '')) == q_norm:
-            return item
-
-    # 2) Startswith
-    starts = [it for it in menu_list if _normalize_text(it.get('name', '')).startswith(q_norm)]
-    if starts:
-        return starts[0]
-
-    # 3) Contains
-    contains = [it for it in menu_list if q_norm in _normalize_text(it.get('name', ''))]
-    if contains:
-        return contains[0]
-
-    # 4) Token overlap (simple score)
-    q_tokens = set(q_norm.split())
-    best = None
-    best_score = 0
-    for it in menu_list:
-        name_tokens = set(_normalize_text(it.get('name', '')).split())
-        score = len(q_tokens.intersection(name_tokens))
-        if score > best_score:
-            best_score = score
-            best = it
-    # Require at least 1 token overlap to avoid bad guesses
-    return best if best_score > 0 else None
+    return get_menu_matcher(menu_list).best_match(query_name, fuzzy=fuzzy)
 
 def find_similar_items(menu_list: list, query: str, max_results: int = 5):
     """Find similar items when no exact matches are found"""
     if not query:
         return []
-    
-    normalized_query = _normalize_text(query)
-    if not normalized_query:
+    return get_menu_matcher(menu_list).similar(query, max_results=max_results)
+
+def suggest_menu_names(menu_list: list, query: str, limit: int = 3):
+    """Names on the menu closest in spelling to `query`, for "did you mean" replies."""
+    if not query:
         return []
-    
-    similar_items = []
-    
-    for item in menu_list:
-        item_name = _normalize_text(item.get('name', ''))
-        item_desc = _normalize_text(item.get('description', ''))
-        item_category = _normalize_text(item.get('category_name', ''))
-        
-        score = 0
-        
-        # Check for partial matches in name
-        if normalized_query in item_name:
-            score += 10
-        
-        # Check for partial matches in description
-        if normalized_query in item_desc:
-            score += 5
-            
-        # Check for partial matches in category
-        if normalized_query in item_category:
-            score += 3
-            
-        # Check for word overlap
-        query_words = set(normalized_query.split())
-        item_words = set(item_name.split())
-        overlap = len(query_words.intersection(item_words))
-        score += overlap * 2
-        
-        if score > 0:
-            similar_items.append((item['name'], score))
-    
-    # Sort by score and return top matches
-    similar_items.sort(key=lambda x: x[1], reverse=True)
-    return [item[0] for item in similar_items[:max_results]]
+    return get_menu_matcher(menu_list).did_you_mean(query, limit=limit)
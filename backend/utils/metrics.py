@@ -0,0 +1,51 @@
+"""
+In-process metrics registry for the ByteEat application.
+
+Counters, gauges and timings are kept in memory per worker and exposed
+through the `/metrics` endpoint.
+"""
+import threading
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_timings = {}
+
+def incr(name: str, value: int = 1):
+    """Increment a counter by `value`."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+def set_gauge(name: str, value):
+    """Set a gauge to its current value."""
+    with _lock:
+        _gauges[name] = value
+
+def observe(name: str, value_ms: float):
+    """Record a timing sample in milliseconds (count, total, max)."""
+    with _lock:
+        stats = _timings.get(name)
+        if stats is None:
+            stats = _timings[name] = {"count": 0, "total_ms": 0.0, "max_ms": 0.0}
+        stats["count"] += 1
+        stats["total_ms"] += value_ms
+        if value_ms > stats["max_ms"]:
+            stats["max_ms"] = value_ms
+
+def get_counter(name: str) -> int:
+    """Return the current value of a counter (0 if never incremented)."""
+    with _lock:
+        return _counters.get(name, 0)
+
+def snapshot() -> dict:
+    """Return a copy of all metrics, with average timings filled in."""
+    with _lock:
+        timings = {}
+        for name, stats in _timings.items():
+            avg = stats["total_ms"] / stats["count"] if stats["count"] else 0.0
+            timings[name] = {**stats, "avg_ms": round(avg, 2)}
+        return {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "timings": timings,
+        }
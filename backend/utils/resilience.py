@@ -0,0 +1,217 @@
+"""
+Resilience utilities for calls to external dependencies (Groq, Pinecone, Supabase).
+
+Each dependency gets a circuit breaker (closed -> open -> half-open). While a
+breaker is open, callers skip the upstream call and use their local fallback
+immediately. A request-scoped deadline bounds the total time a request may
+spend waiting on upstreams: `budget_timeout()` shrinks each downstream timeout
+to whatever is left of it.
+"""
+import os
+import time
+import threading
+import contextvars
+import requests
+
+from utils import metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Numeric encoding of breaker state for the metrics gauges
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "12"))
+
+class CircuitOpenError(RuntimeError):
+    """Raised when a call is short-circuited because its breaker is open."""
+
+class DeadlineExceeded(RuntimeError):
+    """Raised when the request deadline leaves no time for another upstream call."""
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for a single dependency."""
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+        metrics.set_gauge(f"breaker.{name}.state", _STATE_VALUES[CLOSED])
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        # An open breaker becomes half-open once the recovery window has passed
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._transition(HALF_OPEN)
+        return self._state
+
+    def _transition(self, new_state: str):
+        if new_state == self._state:
+            return
+        self._state = new_state
+        if new_state == OPEN:
+            self._opened_at = time.monotonic()
+            metrics.incr(f"breaker.{self.name}.opened")
+        if new_state != HALF_OPEN:
+            self._probe_in_flight = False
+        metrics.set_gauge(f"breaker.{self.name}.state", _STATE_VALUES[new_state])
+
+    def is_open(self) -> bool:
+        """True while calls are being short-circuited (does not consume the half-open probe)."""
+        with self._lock:
+            return self._current_state() == OPEN
+
+    def allow_request(self) -> bool:
+        """Return True if a call may go upstream now.
+
+        In the half-open state only a single probe call is let through; its
+        outcome decides whether the breaker closes or opens again.
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            # A probe that never reported back is given up on after a recovery window
+            probe_stale = time.monotonic() - self._probe_started >= self.recovery_timeout
+            if state == HALF_OPEN and (not self._probe_in_flight or probe_stale):
+                self._probe_in_flight = True
+                self._probe_started = time.monotonic()
+                return True
+        metrics.incr(f"breaker.{self.name}.short_circuited")
+        return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._transition(CLOSED)
+
+    def record_failure(self):
+        metrics.incr(f"breaker.{self.name}.failures")
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._transition(OPEN)
+
+    def call(self, fn, *args, fallback=None, **kwargs):
+        """Run `fn` through the breaker.
+
+        If the breaker is open, or `fn` raises, `fallback()` is returned when
+        given; otherwise CircuitOpenError / the original exception is raised.
+        """
+        if not self.allow_request():
+            if fallback is not None:
+                return fallback()
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        try:
+            result = fn(*args, **kwargs)
+        except DeadlineExceeded:
+            # Running out of our own budget says nothing about the dependency
+            with self._lock:
+                self._probe_in_flight = False
+            if fallback is not None:
+                return fallback()
+            raise
+        except Exception:
+            self.record_failure()
+            if fallback is not None:
+                return fallback()
+            raise
+        self.record_success()
+        return result
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "state": self._current_state(),
+                "consecutive_failures": self._failures,
+                "failure_threshold": self.failure_threshold,
+                "recovery_timeout": self.recovery_timeout,
+            }
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0) -> CircuitBreaker:
+    """Return the shared breaker for a dependency, creating it on first use."""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name, failure_threshold, recovery_timeout)
+        return breaker
+
+def breaker_states() -> dict:
+    """Return the state of every registered breaker, keyed by dependency name."""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {b.name: b.to_dict() for b in breakers}
+
+def is_retryable_status(status_code: int) -> bool:
+    """HTTP statuses that indicate the dependency (not the request) is unhealthy."""
+    return status_code == 429 or status_code >= 500
+
+def guarded_request(breaker: CircuitBreaker, method: str, url: str, timeout: float = 10, **kwargs):
+    """Issue an HTTP request through `breaker` with a deadline-bounded timeout.
+
+    Connection errors and 429/5xx responses count as dependency failures.
+    Raises CircuitOpenError without touching the network while the breaker is open.
+    """
+    timeout = budget_timeout(timeout)
+    if not breaker.allow_request():
+        raise CircuitOpenError(f"{breaker.name} circuit is open")
+    try:
+        response = requests.request(method, url, timeout=timeout, **kwargs)
+    except Exception:
+        breaker.record_failure()
+        raise
+    if is_retryable_status(response.status_code):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return response
+
+# --- Request-scoped deadline ---
+
+_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+def start_deadline(seconds: float = None):
+    """Start the deadline for the current request. Returns a token for `clear_deadline`."""
+    budget = REQUEST_DEADLINE_SECONDS if seconds is None else seconds
+    return _deadline.set(time.monotonic() + budget)
+
+def clear_deadline(token=None):
+    if token is not None:
+        _deadline.reset(token)
+    else:
+        _deadline.set(None)
+
+def remaining_budget():
+    """Seconds left before the request deadline, or None outside a request."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+def budget_timeout(default: float, minimum: float = 0.5) -> float:
+    """Shrink `default` to the time left on the request deadline.
+
+    Raises DeadlineExceeded when less than `minimum` seconds remain, so the
+    caller can go straight to its fallback instead of starting a doomed call.
+    """
+    remaining = remaining_budget()
+    if remaining is None:
+        return default
+    if remaining < minimum:
+        metrics.incr("deadline.exceeded")
+        raise DeadlineExceeded("Request deadline exhausted")
+    return min(default, remaining)
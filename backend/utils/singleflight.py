@@ -0,0 +1,55 @@
+"""
+Request coalescing ("single-flight") for hot upstream fetches.
+
+When many threads ask for the same key at once, only the first runs the
+fetch; the others wait for it and receive the same result (or exception).
+"""
+import threading
+
+from utils import metrics
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Deduplicates concurrent calls per key. Counters are published as
+    `singleflight.<name>.{calls,executed,deduplicated}`."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        """Run `fn(*args, **kwargs)` unless a call for `key` is already in flight,
+        in which case wait for it and return its result."""
+        metrics.incr(f"singleflight.{self.name}.calls")
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            metrics.incr(f"singleflight.{self.name}.deduplicated")
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        metrics.incr(f"singleflight.{self.name}.executed")
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
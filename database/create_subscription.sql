@@ -0,0 +1,63 @@
+-- create_subscription: start a paid subscription in one transaction.
+--
+-- Called from POST /subscriptions through PostgREST
+-- (POST /rest/v1/rpc/create_subscription). Inserts the user_subscriptions row,
+-- its subscription_payments row and the initial 'purchased' credit
+-- transaction together, and returns the new subscription row. Because the
+-- id comes from the insert itself, there's no need to re-read
+-- user_subscriptions to find it.
+-- Credits, duration and price are read from subscription_plans.
+
+-- The purchase payment pays for the period created here, so it is recorded as
+-- already applied; only later payments count toward renewals (see
+-- subscription_renewals.sql, which carries the same one-time migration).
+do $$
+begin
+    if not exists (select 1 from information_schema.columns
+                    where table_schema = current_schema() and table_name = 'subscription_payments'
+                      and column_name = 'applied_at') then
+        alter table subscription_payments add column applied_at timestamptz;
+        update subscription_payments set applied_at = now();
+    end if;
+end
+$$;
+
+create or replace function public.create_subscription(
+    p_user_id uuid,
+    p_plan_id bigint,
+    p_payment_id text,
+    p_payment_order_id text
+)
+returns setof user_subscriptions
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_plan subscription_plans%rowtype;
+    v_subscription user_subscriptions%rowtype;
+begin
+    select * into v_plan from subscription_plans where id = p_plan_id;
+    if not found then
+        raise exception 'Subscription plan not found' using errcode = 'P0002';
+    end if;
+
+    insert into user_subscriptions (user_id, plan_id, start_date, end_date, status,
+                                    remaining_credits, total_credits, auto_renew)
+    values (p_user_id, p_plan_id, current_date, current_date + v_plan.duration_days, 'active',
+            v_plan.credits, v_plan.credits, true)
+    returning * into v_subscription;
+
+    insert into subscription_payments (subscription_id, amount, payment_method, payment_status,
+                                       razorpay_payment_id, razorpay_order_id, applied_at)
+    values (v_subscription.id, v_plan.price, 'razorpay', 'completed', p_payment_id, p_payment_order_id, now());
+
+    insert into credit_transactions (subscription_id, credits_used, transaction_type, description)
+    values (v_subscription.id, 0, 'purchased', 'Subscription purchase: ' || v_plan.name);
+
+    return next v_subscription;
+end;
+$$;
+
+revoke execute on function public.create_subscription(uuid, bigint, text, text) from public, anon, authenticated;
+grant execute on function public.create_subscription(uuid, bigint, text, text) to service_role;
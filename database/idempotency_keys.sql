@@ -0,0 +1,126 @@
+-- Idempotency-Key records shared by every backend worker.
+--
+-- Used by utils/idempotency.py (the @idempotent routes: POST /order,
+-- POST /subscriptions, POST /create-razorpay-order). One row per (endpoint,
+-- key); the primary key makes claiming atomic, so of two workers handling
+-- the same retried request exactly one runs the handler and the other
+-- replays its stored response.
+--
+-- A row with a null status is a request still in flight. If its worker dies
+-- the claim lapses after the lease, and completed responses expire after the
+-- TTL; both are passed in by the caller.
+
+create table if not exists idempotency_keys (
+    endpoint text not null,
+    key text not null,
+    fingerprint text not null,
+    status integer,
+    body text,
+    mimetype text,
+    created_at timestamptz not null default now(),
+    primary key (endpoint, key)
+);
+create index if not exists idempotency_keys_created_at_idx on idempotency_keys (created_at);
+-- Stored responses can hold user data; only the service role reads them
+alter table idempotency_keys enable row level security;
+revoke all on table idempotency_keys from anon, authenticated;
+
+-- claim_idempotency_key: take the key for this request, or report who has it.
+-- Returns {"owner": true}, or {"owner": false, "fingerprint", "status",
+-- "body", "mimetype"} for the existing claim (status null while in flight).
+-- "fingerprint" is null if the other claim was released in the meantime;
+-- the caller should simply try again.
+create or replace function public.claim_idempotency_key(
+    p_endpoint text,
+    p_key text,
+    p_fingerprint text,
+    p_ttl_seconds integer,
+    p_lease_seconds integer
+)
+returns json
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_existing idempotency_keys%rowtype;
+begin
+    -- Expired responses and lapsed in-flight claims can be taken over
+    delete from idempotency_keys
+     where endpoint = p_endpoint
+       and key = p_key
+       and (created_at < now() - make_interval(secs => p_ttl_seconds)
+            or (status is null and created_at < now() - make_interval(secs => p_lease_seconds)));
+
+    insert into idempotency_keys (endpoint, key, fingerprint)
+    values (p_endpoint, p_key, p_fingerprint)
+    on conflict (endpoint, key) do nothing;
+    if found then
+        return json_build_object('owner', true);
+    end if;
+
+    select * into v_existing from idempotency_keys where endpoint = p_endpoint and key = p_key;
+    return json_build_object(
+        'owner', false,
+        'fingerprint', v_existing.fingerprint,
+        'status', v_existing.status,
+        'body', v_existing.body,
+        'mimetype', v_existing.mimetype
+    );
+end;
+$$;
+
+-- complete_idempotency_key: store the response of the claimed request.
+create or replace function public.complete_idempotency_key(
+    p_endpoint text,
+    p_key text,
+    p_status integer,
+    p_body text,
+    p_mimetype text
+)
+returns void
+language sql
+security definer
+set search_path = public
+as $$
+    update idempotency_keys
+       set status = p_status, body = p_body, mimetype = p_mimetype
+     where endpoint = p_endpoint and key = p_key and status is null;
+$$;
+
+-- release_idempotency_key: drop an in-flight claim whose request failed, so
+-- the client's retry runs the handler again.
+create or replace function public.release_idempotency_key(p_endpoint text, p_key text)
+returns void
+language sql
+security definer
+set search_path = public
+as $$
+    delete from idempotency_keys
+     where endpoint = p_endpoint and key = p_key and status is null;
+$$;
+
+-- prune_idempotency_keys: delete records older than p_ttl_seconds.
+create or replace function public.prune_idempotency_keys(p_ttl_seconds integer)
+returns integer
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_deleted integer;
+begin
+    delete from idempotency_keys where created_at < now() - make_interval(secs => p_ttl_seconds);
+    get diagnostics v_deleted = row_count;
+    return v_deleted;
+end;
+$$;
+
+revoke execute on function public.claim_idempotency_key(text, text, text, integer, integer) from public, anon, authenticated;
+grant execute on function public.claim_idempotency_key(text, text, text, integer, integer) to service_role;
+revoke execute on function public.complete_idempotency_key(text, text, integer, text, text) from public, anon, authenticated;
+grant execute on function public.complete_idempotency_key(text, text, integer, text, text) to service_role;
+revoke execute on function public.release_idempotency_key(text, text) from public, anon, authenticated;
+grant execute on function public.release_idempotency_key(text, text) to service_role;
+revoke execute on function public.prune_idempotency_keys(integer) from public, anon, authenticated;
+grant execute on function public.prune_idempotency_keys(integer) to service_role;
@@ -0,0 +1,119 @@
+-- Bulk menu operations.
+--
+-- Used by routes/menu.py (DELETE /categories/<id>, POST /menu/bulk) and
+-- services/menu_import.py (POST /menu/import) so each operation is one
+-- round-trip and one transaction.
+
+-- delete_category: delete a category and all of its menu items together.
+-- Returns {"ok": true, "items_deleted": n} or {"ok": false, "error": "not_found"}.
+create or replace function public.delete_category(p_category_id bigint)
+returns json
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_items_deleted integer;
+begin
+    perform 1 from categories where id = p_category_id for update;
+    if not found then
+        return json_build_object('ok', false, 'error', 'not_found');
+    end if;
+
+    delete from menu_items where category_id = p_category_id;
+    get diagnostics v_items_deleted = row_count;
+
+    delete from categories where id = p_category_id;
+
+    return json_build_object('ok', true, 'items_deleted', v_items_deleted);
+end;
+$$;
+
+-- bulk_update_menu_prices: set a different price on each listed item.
+-- p_prices: [{"id": 1, "price": 120.00}, ...]. Returns the number of rows updated.
+create or replace function public.bulk_update_menu_prices(p_prices jsonb)
+returns integer
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_updated integer;
+begin
+    if exists (
+        select 1 from jsonb_to_recordset(p_prices) as p(id bigint, price numeric)
+         where p.id is null or p.price is null or p.price < 0
+    ) then
+        raise exception 'every entry needs an id and a non-negative price' using errcode = '22023';
+    end if;
+
+    update menu_items m
+       set price = p.price
+      from jsonb_to_recordset(p_prices) as p(id bigint, price numeric)
+     where m.id = p.id;
+
+    get diagnostics v_updated = row_count;
+    return v_updated;
+end;
+$$;
+
+-- bulk_update_menu_items: apply partial updates, each item with its own values.
+-- p_items: [{"id": 1, "price": 120.00}, {"id": 2, "description": "..."}, ...].
+-- Columns an entry leaves out (or sets to null) keep their stored value.
+-- Returns the ids that were updated, so callers can tell which no longer exist.
+create or replace function public.bulk_update_menu_items(p_items jsonb)
+returns json
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_updated json;
+begin
+    if exists (
+        select 1 from jsonb_to_recordset(p_items) as p(id bigint, price numeric)
+         where p.id is null or p.price < 0
+    ) then
+        raise exception 'every entry needs an id, and prices must not be negative' using errcode = '22023';
+    end if;
+
+    with updated as (
+        update menu_items m
+           set name = coalesce(p.name, m.name),
+               description = coalesce(p.description, m.description),
+               price = coalesce(p.price, m.price),
+               image_url = coalesce(p.image_url, m.image_url),
+               category_id = coalesce(p.category_id, m.category_id),
+               is_available = coalesce(p.is_available, m.is_available),
+               is_veg = coalesce(p.is_veg, m.is_veg),
+               is_bestseller = coalesce(p.is_bestseller, m.is_bestseller),
+               is_chef_spl = coalesce(p.is_chef_spl, m.is_chef_spl),
+               is_seasonal = coalesce(p.is_seasonal, m.is_seasonal)
+          from jsonb_to_recordset(p_items) as p(
+              id bigint,
+              name text,
+              description text,
+              price numeric,
+              image_url text,
+              category_id bigint,
+              is_available boolean,
+              is_veg boolean,
+              is_bestseller boolean,
+              is_chef_spl boolean,
+              is_seasonal boolean
+          )
+         where m.id = p.id
+        returning m.id
+    )
+    select coalesce(json_agg(id), '[]'::json) into v_updated from updated;
+
+    return v_updated;
+end;
+$$;
+
+revoke execute on function public.delete_category(bigint) from public, anon, authenticated;
+grant execute on function public.delete_category(bigint) to service_role;
+revoke execute on function public.bulk_update_menu_prices(jsonb) from public, anon, authenticated;
+grant execute on function public.bulk_update_menu_prices(jsonb) to service_role;
+revoke execute on function public.bulk_update_menu_items(jsonb) from public, anon, authenticated;
+grant execute on function public.bulk_update_menu_items(jsonb) to service_role;
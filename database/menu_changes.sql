@@ -0,0 +1,167 @@
+-- Menu change log for delta sync (GET /menu/changes).
+--
+-- Every insert, update and delete on menu_items appends a row here through
+-- a trigger, so every write path (the menu routes, bulk operations, imports,
+-- the Supabase dashboard) is captured the same way. A category rename logs
+-- its items too, because clients show each item with its category name.
+--
+-- The sync cursor clients keep is a transaction horizon, not a row number:
+-- each row records the id of the transaction that wrote it (`txid`), and a
+-- sync hands out the oldest transaction id still running. Sequence values
+-- are taken at insert time but become visible at commit, so a cursor built
+-- from `version` could move past a change that commits later and lose it.
+-- Every transaction below the horizon has finished, so a client resuming
+-- from it can't miss anything. Changes at or above it may be sent again on
+-- the next sync. Clients apply them by item id, so a repeat is harmless.
+
+create table if not exists menu_changes (
+    version bigserial primary key,
+    item_id bigint not null,
+    op text not null check (op in ('upsert', 'delete')),
+    changed_at timestamptz not null default now(),
+    txid xid8 not null default pg_current_xact_id()
+);
+alter table menu_changes add column if not exists txid xid8 not null default pg_current_xact_id();
+create index if not exists menu_changes_txid_idx on menu_changes (txid);
+
+-- Highest transaction id removed by pruning; cursors at or below it must reset
+create table if not exists menu_changes_state (
+    id boolean primary key default true check (id),
+    pruned_through bigint not null
+);
+-- Created at the current transaction, so cursors handed out before the switch
+-- to transaction horizons (old `version` values) all reset once
+insert into menu_changes_state (id, pruned_through)
+values (true, pg_current_xact_id()::text::bigint)
+on conflict (id) do nothing;
+
+create or replace function public.log_menu_item_change()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    if tg_op = 'DELETE' then
+        insert into menu_changes (item_id, op) values (old.id, 'delete');
+        return old;
+    end if;
+    insert into menu_changes (item_id, op) values (new.id, 'upsert');
+    return new;
+end;
+$$;
+
+drop trigger if exists menu_items_change_log on menu_items;
+create trigger menu_items_change_log
+    after insert or update or delete on menu_items
+    for each row execute function public.log_menu_item_change();
+
+create or replace function public.log_category_change()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    if new.name is distinct from old.name then
+        insert into menu_changes (item_id, op)
+        select id, 'upsert' from menu_items where category_id = new.id;
+    end if;
+    return new;
+end;
+$$;
+
+drop trigger if exists categories_change_log on categories;
+create trigger categories_change_log
+    after update on categories
+    for each row execute function public.log_category_change();
+
+-- menu_changes_since: everything a client at cursor p_since needs to catch up.
+--
+-- Returns {"version", "reset", "items": [...], "deleted": [ids]}. `version`
+-- is the cursor to send next time. items are full menu_items rows plus
+-- category_name. When the client has no usable cursor (0, from before the
+-- pruned log, or from the future) or more than p_limit items changed, reset
+-- is true and items is the whole menu.
+create or replace function public.menu_changes_since(p_since bigint, p_limit integer default 500)
+returns json
+language plpgsql
+stable
+security definer
+set search_path = public
+as $$
+declare
+    -- Every transaction below this has committed or aborted
+    v_horizon bigint := pg_snapshot_xmin(pg_current_snapshot())::text::bigint;
+    v_pruned bigint;
+    v_changed integer;
+begin
+    select pruned_through into v_pruned from menu_changes_state;
+
+    if p_since > coalesce(v_pruned, 0) and p_since <= v_horizon then
+        select count(distinct item_id) into v_changed
+          from menu_changes where txid >= p_since::text::xid8;
+
+        if v_changed <= p_limit then
+            return json_build_object(
+                'version', v_horizon,
+                'reset', false,
+                'items', coalesce((
+                    select json_agg(to_jsonb(m) || jsonb_build_object('category_name', c.name) order by m.id)
+                      from menu_items m
+                      left join categories c on c.id = m.category_id
+                     where m.id in (select item_id from menu_changes where txid >= p_since::text::xid8)
+                ), '[]'::json),
+                'deleted', coalesce((
+                    select json_agg(distinct ch.item_id)
+                      from menu_changes ch
+                     where ch.txid >= p_since::text::xid8
+                       and not exists (select 1 from menu_items m where m.id = ch.item_id)
+                ), '[]'::json)
+            );
+        end if;
+    end if;
+
+    return json_build_object(
+        'version', v_horizon,
+        'reset', true,
+        'items', coalesce((
+            select json_agg(to_jsonb(m) || jsonb_build_object('category_name', c.name) order by m.id)
+              from menu_items m
+              left join categories c on c.id = m.category_id
+        ), '[]'::json),
+        'deleted', '[]'::json
+    );
+end;
+$$;
+
+-- prune_menu_changes: drop log entries older than p_keep. Clients whose
+-- cursor predates a pruned entry get a reset on their next sync.
+create or replace function public.prune_menu_changes(p_keep interval default interval '30 days')
+returns integer
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_deleted integer;
+    v_pruned_through bigint;
+begin
+    with pruned as (
+        delete from menu_changes
+         where changed_at < now() - p_keep
+        returning txid
+    )
+    select count(*), max(txid::text::bigint) into v_deleted, v_pruned_through from pruned;
+
+    if v_pruned_through is not null then
+        update menu_changes_state set pruned_through = greatest(pruned_through, v_pruned_through);
+    end if;
+    return v_deleted;
+end;
+$$;
+
+revoke execute on function public.menu_changes_since(bigint, integer) from public, anon, authenticated;
+grant execute on function public.menu_changes_since(bigint, integer) to service_role;
+revoke execute on function public.prune_menu_changes(interval) from public, anon, authenticated;
+grant execute on function public.prune_menu_changes(interval) to service_role;
@@ -0,0 +1,37 @@
+-- Grouped order counts for the dashboard counters.
+--
+-- Used by services/order_counts.py to seed and reconcile its in-memory
+-- counters in one round-trip each, instead of downloading order ids.
+
+-- order_status_counts: number of orders per status.
+create or replace function public.order_status_counts()
+returns table (status text, order_count bigint)
+language sql
+stable
+security definer
+set search_path = public
+as $$
+    select coalesce(o.status, 'unknown'), count(*)
+      from orders o
+     group by 1;
+$$;
+
+-- order_daily_counts: number of orders created per day (UTC) in [p_from, p_to].
+create or replace function public.order_daily_counts(p_from date, p_to date)
+returns table (day date, order_count bigint)
+language sql
+stable
+security definer
+set search_path = public
+as $$
+    select (o.created_at at time zone 'utc')::date, count(*)
+      from orders o
+     where o.created_at >= p_from::timestamp at time zone 'utc'
+       and o.created_at < (p_to + 1)::timestamp at time zone 'utc'
+     group by 1;
+$$;
+
+revoke execute on function public.order_status_counts() from public, anon, authenticated;
+grant execute on function public.order_status_counts() to service_role;
+revoke execute on function public.order_daily_counts(date, date) from public, anon, authenticated;
+grant execute on function public.order_daily_counts(date, date) to service_role;
@@ -0,0 +1,19 @@
+-- Indexes for keyset pagination of order and favorite listings.
+--
+-- Used by utils/pagination.py (GET /orders, /users/<id>/orders,
+-- /users/<id>/favorites). Each page is read with
+--   order by created_at desc, id desc
+--   where (created_at, id) < (cursor created_at, cursor id)
+-- so these indexes turn every page into a single range scan.
+
+create index if not exists orders_created_at_id_idx
+    on orders (created_at desc, id desc);
+
+create index if not exists orders_user_id_created_at_id_idx
+    on orders (user_id, created_at desc, id desc);
+
+create index if not exists orders_status_created_at_id_idx
+    on orders (status, created_at desc, id desc);
+
+create index if not exists favorites_user_id_created_at_id_idx
+    on favorites (user_id, created_at desc, id desc);
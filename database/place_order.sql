@@ -0,0 +1,75 @@
+-- place_order: create an order and all of its items in one transaction.
+--
+-- Called once per checkout from POST /order through PostgREST
+-- (POST /rest/v1/rpc/place_order). Line prices are taken from menu_items,
+-- never from the client, and the order total is computed from them. Any
+-- invalid line aborts the whole call, so no orphan orders are left behind.
+--
+-- p_items: [{"menu_item_id": 12, "quantity": 2}, ...]
+-- Returns the new order id.
+
+create or replace function public.place_order(
+    p_user_id uuid,
+    p_delivery_address text,
+    p_items jsonb,
+    p_pickup_code text default null
+)
+returns bigint
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_order_id bigint;
+    v_lines integer;
+    v_priced integer;
+    v_bad_quantity boolean;
+    v_total numeric;
+begin
+    if p_items is null or jsonb_typeof(p_items) <> 'array' or jsonb_array_length(p_items) = 0 then
+        raise exception 'Order must contain at least one item' using errcode = '22023';
+    end if;
+
+    -- Duplicate lines for the same dish are merged
+    with requested as (
+        select (line->>'menu_item_id')::bigint as menu_item_id,
+               sum((line->>'quantity')::integer) as quantity
+        from jsonb_array_elements(p_items) as line
+        group by 1
+    )
+    select count(*),
+           count(m.id),
+           bool_or(r.quantity is null or r.quantity <= 0),
+           coalesce(sum(m.price * r.quantity), 0)
+      into v_lines, v_priced, v_bad_quantity, v_total
+      from requested r
+      left join menu_items m on m.id = r.menu_item_id and m.is_available;
+
+    if v_bad_quantity then
+        raise exception 'Item quantities must be positive' using errcode = '22023';
+    end if;
+    if v_priced < v_lines then
+        raise exception 'Order contains unknown or unavailable menu items' using errcode = '22023';
+    end if;
+
+    insert into orders (user_id, status, total_amount, delivery_address, pickup_code)
+    values (p_user_id, 'Preparing', v_total, p_delivery_address, p_pickup_code)
+    returning id into v_order_id;
+
+    insert into order_items (order_id, menu_item_id, quantity, price_at_order)
+    select v_order_id, m.id, r.quantity, m.price
+      from (
+          select (line->>'menu_item_id')::bigint as menu_item_id,
+                 sum((line->>'quantity')::integer) as quantity
+          from jsonb_array_elements(p_items) as line
+          group by 1
+      ) r
+      join menu_items m on m.id = r.menu_item_id;
+
+    return v_order_id;
+end;
+$$;
+
+-- The function trusts p_user_id, so only the backend's service role may call it
+revoke execute on function public.place_order(uuid, text, jsonb, text) from public, anon, authenticated;
+grant execute on function public.place_order(uuid, text, jsonb, text) to service_role;
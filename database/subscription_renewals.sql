@@ -0,0 +1,144 @@
+-- Batch renewal / expiry support for user_subscriptions.
+--
+-- Used by services/subscription_renewals.py (scripts/process_subscription_renewals.py).
+
+-- Due subscriptions are found with one range scan: status = 'active' or
+-- 'pending_payment' and end_date < as-of date, paged by (end_date, id).
+create index if not exists user_subscriptions_status_end_date_id_idx
+    on user_subscriptions (status, end_date, id);
+
+-- subscription_payments.applied_at: when a payment was turned into a
+-- subscription period. Payments without it are renewal payments waiting to
+-- be applied. Rows from before this column existed paid for periods that
+-- were already granted, so they are marked applied once, when it is added.
+-- (create_subscription.sql carries the same migration.)
+do $$
+begin
+    if not exists (select 1 from information_schema.columns
+                    where table_schema = current_schema() and table_name = 'subscription_payments'
+                      and column_name = 'applied_at') then
+        alter table subscription_payments add column applied_at timestamptz;
+        update subscription_payments set applied_at = now();
+    end if;
+end
+$$;
+create index if not exists subscription_payments_unapplied_idx
+    on subscription_payments (subscription_id, id)
+    where applied_at is null and payment_status = 'completed';
+
+-- apply_subscription_renewals: apply one chunk of renewals/expiries and write
+-- their credit_transactions rows in the same transaction.
+--
+-- p_changes: [{"id", "expected_status", "expected_end_date", "status",
+--              "start_date", "end_date", "remaining_credits", "total_credits",
+--              "transaction_type", "credits_used", "description",
+--              "expire_if_unpaid"}, ...]
+--
+-- A renewal only starts the new period if the subscription has a completed
+-- payment that hasn't been applied yet; that payment is marked applied in
+-- the same transaction. Without one the subscription becomes
+-- 'pending_payment' (period and credits unchanged, no ledger row), or
+-- 'expired' when expire_if_unpaid is set because the grace period is over.
+--
+-- A row is only changed while it still has the status and end_date the
+-- processor saw, so re-running a chunk (e.g. when resuming) is a no-op for
+-- rows that were already processed. Returns
+-- {"applied", "renewed", "pending_payment", "expired"}.
+
+drop function if exists public.apply_subscription_renewals(jsonb);
+create function public.apply_subscription_renewals(p_changes jsonb)
+returns json
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_result json;
+begin
+    with changes as (
+        select *
+          from jsonb_to_recordset(p_changes) as c(
+              id bigint,
+              expected_status text,
+              expected_end_date date,
+              status text,
+              start_date date,
+              end_date date,
+              remaining_credits integer,
+              total_credits integer,
+              transaction_type text,
+              credits_used integer,
+              description text,
+              expire_if_unpaid boolean
+          )
+    ),
+    payments as (
+        select distinct on (p.subscription_id) p.subscription_id, p.id as payment_id
+          from subscription_payments p
+          join changes c on c.id = p.subscription_id and c.transaction_type = 'renewed'
+         where p.payment_status = 'completed'
+           and p.applied_at is null
+         order by p.subscription_id, p.id
+    ),
+    resolved as (
+        select c.id, c.expected_status, c.expected_end_date, c.start_date, c.end_date,
+               c.remaining_credits, c.total_credits, c.credits_used, p.payment_id,
+               case
+                   when c.transaction_type <> 'renewed' or p.payment_id is not null then c.status
+                   when coalesce(c.expire_if_unpaid, false) then 'expired'
+                   else 'pending_payment'
+               end as status,
+               case
+                   when c.transaction_type <> 'renewed' or p.payment_id is not null then c.transaction_type
+                   when coalesce(c.expire_if_unpaid, false) then 'expired'
+               end as transaction_type,
+               case
+                   when c.transaction_type <> 'renewed' or p.payment_id is not null then c.description
+                   else 'Subscription expired: renewal was not paid'
+               end as description
+          from changes c
+          left join payments p on p.subscription_id = c.id
+    ),
+    applied as (
+        update user_subscriptions s
+           set status = r.status,
+               start_date = case when r.transaction_type = 'renewed' then r.start_date else s.start_date end,
+               end_date = case when r.transaction_type = 'renewed' then r.end_date else s.end_date end,
+               remaining_credits = case when r.transaction_type = 'renewed' then r.remaining_credits else s.remaining_credits end,
+               total_credits = case when r.transaction_type = 'renewed' then r.total_credits else s.total_credits end
+          from resolved r
+         where s.id = r.id
+           and s.status = r.expected_status
+           and s.end_date = r.expected_end_date
+        returning s.id, s.status
+    ),
+    consumed as (
+        update subscription_payments p
+           set applied_at = now()
+          from resolved r
+          join applied a on a.id = r.id
+         where p.id = r.payment_id
+           and r.transaction_type = 'renewed'
+    ),
+    ledger as (
+        insert into credit_transactions (subscription_id, credits_used, transaction_type, description)
+        select r.id, r.credits_used, r.transaction_type, r.description
+          from resolved r
+          join applied a on a.id = r.id
+         where r.transaction_type is not null
+    )
+    select json_build_object(
+               'applied', count(*),
+               'renewed', count(*) filter (where a.status = 'active'),
+               'pending_payment', count(*) filter (where a.status = 'pending_payment'),
+               'expired', count(*) filter (where a.status = 'expired')
+           )
+      into v_result
+      from applied a;
+
+    return v_result;
+end;
+$$;
+
+revoke execute on function public.apply_subscription_renewals(jsonb) from public, anon, authenticated;
+grant execute on function public.apply_subscription_renewals(jsonb) to service_role;
@@ -0,0 +1,95 @@
+"""
+Fixtures for testing the SQL functions in database/ against a real Postgres.
+
+Set TEST_DATABASE_URL to any Postgres you can write to (docker-compose.yml
+here starts one), and install pytest and psycopg2-binary. Without
+TEST_DATABASE_URL the tests are skipped.
+
+Each test runs in one transaction that is rolled back afterwards. The
+minimal tables and the function under test are created in a scratch schema
+inside that transaction, so nothing is left behind. Existing tables in
+`public` are never touched.
+"""
+import os
+import pathlib
+
+import pytest
+
+DATABASE_DIR = pathlib.Path(__file__).resolve().parent.parent
+SCHEMA = "sql_function_tests"
+
+# Just the columns the functions use; mirrors the Supabase tables
+TABLES = f"""
+create schema {SCHEMA};
+set local search_path = {SCHEMA};
+
+create table menu_items (
+    id bigint generated by default as identity primary key,
+    name text not null,
+    price numeric not null,
+    is_available boolean default true
+);
+create table orders (
+    id bigint generated by default as identity primary key,
+    user_id uuid,
+    status text,
+    total_amount numeric,
+    delivery_address text,
+    pickup_code text,
+    created_at timestamptz not null default now()
+);
+create table order_items (
+    id bigint generated by default as identity primary key,
+    order_id bigint not null references orders (id),
+    menu_item_id bigint references menu_items (id),
+    quantity integer not null,
+    price_at_order numeric not null
+);
+"""
+
+# Supabase's API roles, which the grant/revoke statements name
+ROLES = """
+do $$
+begin
+    if not exists (select 1 from pg_roles where rolname = 'anon') then create role anon nologin; end if;
+    if not exists (select 1 from pg_roles where rolname = 'authenticated') then create role authenticated nologin; end if;
+    if not exists (select 1 from pg_roles where rolname = 'service_role') then create role service_role nologin; end if;
+end
+$$;
+"""
+
+def load_function(cursor, filename: str):
+    """Create a function from database/<filename> inside the scratch schema."""
+    sql = (DATABASE_DIR / filename).read_text()
+    sql = sql.replace("search_path = public", f"search_path = {SCHEMA}").replace("public.", f"{SCHEMA}.")
+    cursor.execute(sql)
+
+@pytest.fixture
+def db():
+    """A cursor inside a transaction holding the scratch schema; rolled back after the test."""
+    url = os.getenv("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    psycopg2 = pytest.importorskip("psycopg2")
+    connection = psycopg2.connect(url)
+    try:
+        cursor = connection.cursor()
+        cursor.execute(ROLES)
+        cursor.execute(TABLES)
+        yield cursor
+    finally:
+        connection.rollback()
+        connection.close()
+
+@pytest.fixture
+def savepoint(db):
+    """Run a statement expected to fail without aborting the test's transaction."""
+    def run(sql, params=None):
+        db.execute("savepoint expect_failure")
+        try:
+            db.execute(sql, params)
+        except Exception:
+            db.execute("rollback to savepoint expect_failure")
+            raise
+        db.execute("release savepoint expect_failure")
+    return run
@@ -0,0 +1,85 @@
+"""
+Tests for the idempotency key functions (database/idempotency_keys.sql), run
+against a real Postgres. See conftest.py for how to point them at a database.
+"""
+import pytest
+
+from conftest import load_function
+
+TTL, LEASE = 86400, 120
+
+@pytest.fixture
+def keys(db):
+    load_function(db, "idempotency_keys.sql")
+    return db
+
+def claim(db, key="k1", fingerprint="fp1", endpoint="orders.create_order"):
+    db.execute("select claim_idempotency_key(%s, %s, %s, %s, %s)", (endpoint, key, fingerprint, TTL, LEASE))
+    return db.fetchone()[0]
+
+def complete(db, key="k1", status=201, body='{"id": 7}'):
+    db.execute(
+        "select complete_idempotency_key(%s, %s, %s, %s, %s)",
+        ("orders.create_order", key, status, body, "application/json")
+    )
+
+def age(db, key="k1", seconds=0):
+    db.execute(
+        "update idempotency_keys set created_at = now() - make_interval(secs => %s) where key = %s",
+        (seconds, key)
+    )
+
+def test_first_claim_owns_the_key(keys):
+    assert claim(keys) == {"owner": True}
+
+def test_duplicate_sees_request_in_flight(keys):
+    claim(keys)
+
+    assert claim(keys) == {"owner": False, "fingerprint": "fp1", "status": None, "body": None, "mimetype": None}
+
+def test_duplicate_replays_completed_response(keys):
+    claim(keys)
+    complete(keys)
+
+    result = claim(keys, fingerprint="fp2")
+
+    assert result == {"owner": False, "fingerprint": "fp1", "status": 201,
+                      "body": '{"id": 7}', "mimetype": "application/json"}
+
+def test_keys_are_scoped_by_endpoint(keys):
+    claim(keys)
+
+    assert claim(keys, endpoint="payments.create_razorpay_order") == {"owner": True}
+
+def test_released_key_can_be_claimed_again(keys):
+    claim(keys)
+    keys.execute("select release_idempotency_key(%s, %s)", ("orders.create_order", "k1"))
+
+    assert claim(keys) == {"owner": True}
+
+def test_release_keeps_completed_response(keys):
+    claim(keys)
+    complete(keys)
+    keys.execute("select release_idempotency_key(%s, %s)", ("orders.create_order", "k1"))
+
+    assert claim(keys)["status"] == 201
+
+@pytest.mark.parametrize("completed, seconds", [(False, LEASE + 1), (True, TTL + 1)], ids=["lapsed-lease", "expired"])
+def test_stale_claims_are_taken_over(keys, completed, seconds):
+    claim(keys)
+    if completed:
+        complete(keys)
+    age(keys, seconds=seconds)
+
+    assert claim(keys, fingerprint="fp2") == {"owner": True}
+
+def test_prune_drops_expired_keys_only(keys):
+    claim(keys, key="old")
+    claim(keys, key="new")
+    age(keys, key="old", seconds=TTL + 1)
+
+    keys.execute("select prune_idempotency_keys(%s)", (TTL,))
+
+    assert keys.fetchone()[0] == 1
+    keys.execute("select key from idempotency_keys")
+    assert keys.fetchall() == [("new",)]
@@ -0,0 +1,72 @@
+"""
+Tests for bulk_update_menu_items (database/menu_bulk.sql), run against a real
+Postgres. See conftest.py for how to point them at a database.
+"""
+import json
+from decimal import Decimal
+
+import pytest
+
+from conftest import load_function
+
+@pytest.fixture
+def menu(db):
+    """Two dishes with every column the import can set; returns their ids by name."""
+    db.execute("""
+        alter table menu_items
+            add column description text,
+            add column image_url text,
+            add column category_id bigint,
+            add column is_veg boolean default true,
+            add column is_bestseller boolean default false,
+            add column is_chef_spl boolean default false,
+            add column is_seasonal boolean default false
+    """)
+    load_function(db, "menu_bulk.sql")
+    db.execute("""
+        insert into menu_items (name, description, price, image_url, category_id) values
+            ('Paneer Tikka', 'Charred cottage cheese', 250.00, 'paneer.jpg', 1),
+            ('Masala Dosa', 'Crisp rice crepe', 120.50, 'dosa.jpg', 2)
+        returning name, id
+    """)
+    return dict(db.fetchall())
+
+def bulk_update(db, items):
+    db.execute("select bulk_update_menu_items(%s::jsonb)", (json.dumps(items),))
+    return db.fetchone()[0]
+
+def item(db, item_id):
+    db.execute(
+        "select name, description, price, image_url, category_id, is_available, is_bestseller "
+        "from menu_items where id = %s", (item_id,)
+    )
+    return db.fetchone()
+
+def test_each_item_gets_its_own_values(db, menu):
+    updated = bulk_update(db, [
+        {"id": menu['Paneer Tikka'], "price": 260},
+        {"id": menu['Masala Dosa'], "price": 130, "is_bestseller": True},
+    ])
+
+    assert sorted(updated) == sorted(menu.values())
+    assert item(db, menu['Paneer Tikka'])[2] == Decimal("260")
+    assert item(db, menu['Masala Dosa'])[2] == Decimal("130")
+    assert item(db, menu['Masala Dosa'])[6] is True
+
+def test_columns_left_out_keep_their_values(db, menu):
+    bulk_update(db, [{"id": menu['Paneer Tikka'], "description": "Smoky"}])
+
+    assert item(db, menu['Paneer Tikka']) == (
+        'Paneer Tikka', 'Smoky', Decimal("250.00"), 'paneer.jpg', 1, True, False
+    )
+
+def test_missing_items_are_not_reported_as_updated(db, menu):
+    updated = bulk_update(db, [{"id": 999999, "price": 10}, {"id": menu['Masala Dosa'], "price": 10}])
+
+    assert updated == [menu['Masala Dosa']]
+
+@pytest.mark.parametrize("items", [[{"price": 10}], [{"id": 1, "price": -1}]], ids=["no-id", "negative-price"])
+def test_rejects_invalid_entries(db, menu, savepoint, items):
+    with pytest.raises(Exception, match="every entry needs an id"):
+        savepoint("select bulk_update_menu_items(%s::jsonb)", (json.dumps(items),))
+    assert item(db, menu['Paneer Tikka'])[2] == Decimal("250.00")
@@ -0,0 +1,118 @@
+"""
+Tests for the menu change log (database/menu_changes.sql), run against a real
+Postgres. See conftest.py for how to point them at a database.
+
+The out-of-order commit test needs two concurrent transactions, so these
+tests commit into a scratch schema that is dropped afterwards.
+"""
+import os
+
+import pytest
+
+from conftest import DATABASE_DIR, ROLES, SCHEMA
+
+TABLES = f"""
+create schema {SCHEMA};
+set search_path = {SCHEMA};
+create table categories (id bigint primary key, name text not null);
+create table menu_items (
+    id bigint primary key,
+    name text not null,
+    category_id bigint references categories (id)
+);
+insert into categories values (1, 'Starters');
+"""
+
+@pytest.fixture
+def connect():
+    url = os.getenv("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    psycopg2 = pytest.importorskip("psycopg2")
+    connections = []
+
+    def open_connection(autocommit=True):
+        connection = psycopg2.connect(url)
+        connection.autocommit = autocommit
+        connection.cursor().execute(f"set search_path = {SCHEMA}")
+        connections.append(connection)
+        return connection
+
+    setup = psycopg2.connect(url)
+    setup.autocommit = True
+    cursor = setup.cursor()
+    cursor.execute(f"drop schema if exists {SCHEMA} cascade")
+    cursor.execute(ROLES)
+    cursor.execute(TABLES)
+    sql = (DATABASE_DIR / "menu_changes.sql").read_text()
+    cursor.execute(sql.replace("search_path = public", f"search_path = {SCHEMA}").replace("public.", f"{SCHEMA}."))
+    try:
+        yield open_connection
+    finally:
+        for connection in connections:
+            connection.close()
+        cursor.execute(f"drop schema if exists {SCHEMA} cascade")
+        setup.close()
+
+def changes_since(connection, since):
+    cursor = connection.cursor()
+    cursor.execute("select menu_changes_since(%s)", (since,))
+    return cursor.fetchone()[0]
+
+def write_item(connection, item_id, name):
+    connection.cursor().execute(
+        "insert into menu_items (id, name, category_id) values (%s, %s, 1) "
+        "on conflict (id) do update set name = excluded.name",
+        (item_id, name)
+    )
+
+def test_first_sync_resets_to_full_menu(connect):
+    client = connect()
+    write_item(client, 1, "Paneer Tikka")
+
+    result = changes_since(client, 0)
+    assert result['reset'] is True
+    assert [item['name'] for item in result['items']] == ["Paneer Tikka"]
+    assert result['items'][0]['category_name'] == "Starters"
+
+def test_delta_returns_changed_and_deleted_items(connect):
+    client = connect()
+    write_item(client, 1, "Paneer Tikka")
+    write_item(client, 2, "Masala Dosa")
+    cursor = changes_since(client, 0)['version']
+
+    write_item(client, 1, "Paneer Tikka Roll")
+    client.cursor().execute("delete from menu_items where id = 2")
+    result = changes_since(client, cursor)
+
+    assert result['reset'] is False
+    assert [item['name'] for item in result['items']] == ["Paneer Tikka Roll"]
+    assert result['deleted'] == [2]
+
+def test_change_committing_after_a_later_one_is_not_lost(connect):
+    client = connect()
+    cursor = changes_since(client, 0)['version']
+
+    # A takes its log row first but commits last
+    slow = connect(autocommit=False)
+    write_item(slow, 10, "Slow Dish")
+    fast = connect(autocommit=False)
+    write_item(fast, 11, "Fast Dish")
+    fast.commit()
+
+    first = changes_since(client, cursor)
+    assert [item['name'] for item in first['items']] == ["Fast Dish"]
+
+    slow.commit()
+    second = changes_since(client, first['version'])
+    assert "Slow Dish" in [item['name'] for item in second['items']]
+
+def test_cursor_from_before_pruned_entries_resets(connect):
+    client = connect()
+    write_item(client, 1, "Paneer Tikka")
+    cursor = changes_since(client, 0)['version']
+    write_item(client, 1, "Paneer Tikka Roll")
+
+    client.cursor().execute("select prune_menu_changes(interval '0 seconds')")
+
+    assert changes_since(client, cursor)['reset'] is True
@@ -0,0 +1,113 @@
+"""
+Tests for place_order (database/place_order.sql), run against a real Postgres.
+See conftest.py for how to point them at a database.
+"""
+import json
+import uuid
+from decimal import Decimal
+
+import pytest
+
+from conftest import load_function
+
+USER_ID = str(uuid.uuid4())
+
+@pytest.fixture
+def menu(db):
+    """Three dishes; the last one is unavailable. Returns their ids by name."""
+    load_function(db, "place_order.sql")
+    db.execute("""
+        insert into menu_items (name, price, is_available) values
+            ('Paneer Tikka', 250.00, true),
+            ('Masala Dosa', 120.50, true),
+            ('Seasonal Soup', 90.00, false)
+        returning name, id
+    """)
+    return dict(db.fetchall())
+
+def place_order(db, items, address="12 MG Road", pickup_code=None):
+    db.execute(
+        "select place_order(%s, %s, %s::jsonb, %s)",
+        (USER_ID, address, json.dumps(items), pickup_code)
+    )
+    return db.fetchone()[0]
+
+def order_count(db) -> int:
+    db.execute("select count(*) from orders")
+    return db.fetchone()[0]
+
+def test_creates_order_and_items(db, menu):
+    order_id = place_order(db, [
+        {"menu_item_id": menu['Paneer Tikka'], "quantity": 2},
+        {"menu_item_id": menu['Masala Dosa'], "quantity": 1},
+    ], pickup_code="4821")
+
+    db.execute("select user_id::text, status, delivery_address, pickup_code from orders where id = %s", (order_id,))
+    assert db.fetchone() == (USER_ID, 'Preparing', '12 MG Road', '4821')
+    db.execute("select menu_item_id, quantity from order_items where order_id = %s order by menu_item_id", (order_id,))
+    assert db.fetchall() == sorted([(menu['Paneer Tikka'], 2), (menu['Masala Dosa'], 1)])
+
+def test_prices_come_from_menu_items(db, menu):
+    # A client-supplied price is ignored
+    order_id = place_order(db, [
+        {"menu_item_id": menu['Paneer Tikka'], "quantity": 2, "price": 1},
+        {"menu_item_id": menu['Masala Dosa'], "quantity": 3, "price_at_order": 0},
+    ])
+
+    db.execute("select total_amount from orders where id = %s", (order_id,))
+    assert db.fetchone()[0] == Decimal("861.50")
+    db.execute("select menu_item_id, price_at_order from order_items where order_id = %s", (order_id,))
+    assert dict(db.fetchall()) == {menu['Paneer Tikka']: Decimal("250.00"), menu['Masala Dosa']: Decimal("120.50")}
+
+def test_duplicate_lines_are_merged(db, menu):
+    order_id = place_order(db, [
+        {"menu_item_id": menu['Masala Dosa'], "quantity": 1},
+        {"menu_item_id": menu['Masala Dosa'], "quantity": 2},
+    ])
+
+    db.execute("select quantity from order_items where order_id = %s", (order_id,))
+    assert db.fetchall() == [(3,)]
+
+@pytest.mark.parametrize("items", [
+    [{"menu_item_id": 999999, "quantity": 1}],
+    [{"menu_item_id": "unavailable", "quantity": 1}],
+    [{"menu_item_id": "Paneer Tikka", "quantity": 1}, {"menu_item_id": 999999, "quantity": 1}],
+], ids=["unknown", "unavailable", "one-bad-line"])
+def test_rejects_unknown_or_unavailable_items(db, menu, savepoint, items):
+    ids = {**menu, "unavailable": menu['Seasonal Soup']}
+    items = [{**line, "menu_item_id": ids.get(line["menu_item_id"], line["menu_item_id"])} for line in items]
+
+    with pytest.raises(Exception, match="unknown or unavailable"):
+        savepoint("select place_order(%s, %s, %s::jsonb, null)", (USER_ID, "addr", json.dumps(items)))
+    assert order_count(db) == 0
+
+@pytest.mark.parametrize("quantity", [0, -2, None])
+def test_rejects_non_positive_quantities(db, menu, savepoint, quantity):
+    items = [{"menu_item_id": menu['Paneer Tikka'], "quantity": quantity}]
+
+    with pytest.raises(Exception, match="quantities must be positive"):
+        savepoint("select place_order(%s, %s, %s::jsonb, null)", (USER_ID, "addr", json.dumps(items)))
+    assert order_count(db) == 0
+
+@pytest.mark.parametrize("items", [[], None, {"menu_item_id": 1}])
+def test_rejects_empty_or_malformed_item_lists(db, menu, savepoint, items):
+    with pytest.raises(Exception, match="at least one item"):
+        savepoint("select place_order(%s, %s, %s::jsonb, null)", (USER_ID, "addr", json.dumps(items)))
+    assert order_count(db) == 0
+
+def test_item_insert_failure_leaves_no_order(db, menu, savepoint):
+    # Make the order_items insert fail after the orders row has been written
+    db.execute("""
+        create function fail_item_insert() returns trigger language plpgsql as $$
+        begin
+            raise exception 'order_items insert failed';
+        end;
+        $$;
+        create trigger fail_item_insert before insert on order_items
+            for each row execute function fail_item_insert();
+    """)
+    items = [{"menu_item_id": menu['Paneer Tikka'], "quantity": 1}]
+
+    with pytest.raises(Exception, match="order_items insert failed"):
+        savepoint("select place_order(%s, %s, %s::jsonb, null)", (USER_ID, "addr", json.dumps(items)))
+    assert order_count(db) == 0
@@ -0,0 +1,156 @@
+"""
+Tests for apply_subscription_renewals (database/subscription_renewals.sql),
+run against a real Postgres. See conftest.py for how to point them at a
+database.
+"""
+import json
+from datetime import date
+
+import pytest
+
+from conftest import load_function
+
+TABLES = """
+create table user_subscriptions (
+    id bigint generated by default as identity primary key,
+    plan_id bigint,
+    status text not null,
+    start_date date,
+    end_date date,
+    remaining_credits integer,
+    total_credits integer,
+    auto_renew boolean default true
+);
+create table subscription_payments (
+    id bigint generated by default as identity primary key,
+    subscription_id bigint not null references user_subscriptions (id),
+    amount numeric,
+    payment_method text,
+    payment_status text,
+    razorpay_payment_id text,
+    razorpay_order_id text
+);
+create table credit_transactions (
+    id bigint generated by default as identity primary key,
+    subscription_id bigint not null references user_subscriptions (id),
+    credits_used integer,
+    transaction_type text,
+    description text
+);
+"""
+
+@pytest.fixture
+def subscription(db):
+    """A subscription that ended on 2026-01-31 with 3 of 30 credits left; returns its id."""
+    db.execute(TABLES)
+    load_function(db, "subscription_renewals.sql")
+    db.execute("""
+        insert into user_subscriptions (plan_id, status, start_date, end_date, remaining_credits, total_credits)
+        values (1, 'active', '2026-01-01', '2026-01-31', 3, 30)
+        returning id
+    """)
+    return db.fetchone()[0]
+
+def renewal(subscription_id, expected_status='active', expire_if_unpaid=False):
+    return {
+        'id': subscription_id,
+        'expected_status': expected_status,
+        'expected_end_date': '2026-01-31',
+        'status': 'active',
+        'start_date': '2026-01-31',
+        'end_date': '2026-03-02',
+        'remaining_credits': 30,
+        'total_credits': 30,
+        'transaction_type': 'renewed',
+        'credits_used': 0,
+        'description': 'Subscription renewed: Lunch Plan',
+        'expire_if_unpaid': expire_if_unpaid,
+    }
+
+def apply(db, *changes):
+    db.execute("select apply_subscription_renewals(%s::jsonb)", (json.dumps(list(changes)),))
+    return db.fetchone()[0]
+
+def add_payment(db, subscription_id, status='completed'):
+    db.execute(
+        "insert into subscription_payments (subscription_id, amount, payment_status) values (%s, 499, %s)",
+        (subscription_id, status)
+    )
+
+def state(db, subscription_id):
+    db.execute(
+        "select status, end_date, remaining_credits from user_subscriptions where id = %s",
+        (subscription_id,)
+    )
+    return db.fetchone()
+
+def ledger(db, subscription_id):
+    db.execute(
+        "select transaction_type from credit_transactions where subscription_id = %s order by id",
+        (subscription_id,)
+    )
+    return [row[0] for row in db.fetchall()]
+
+def test_paid_renewal_starts_new_period(db, subscription):
+    add_payment(db, subscription)
+
+    result = apply(db, renewal(subscription))
+
+    assert result == {'applied': 1, 'renewed': 1, 'pending_payment': 0, 'expired': 0}
+    assert state(db, subscription) == ('active', date(2026, 3, 2), 30)
+    assert ledger(db, subscription) == ['renewed']
+    db.execute("select count(*) from subscription_payments where applied_at is null")
+    assert db.fetchone()[0] == 0
+
+@pytest.mark.parametrize("payment", [None, 'failed'], ids=["no-payment", "failed-payment"])
+def test_unpaid_renewal_waits_for_payment(db, subscription, payment):
+    if payment:
+        add_payment(db, subscription, status=payment)
+
+    result = apply(db, renewal(subscription))
+
+    assert result == {'applied': 1, 'renewed': 0, 'pending_payment': 1, 'expired': 0}
+    assert state(db, subscription) == ('pending_payment', date(2026, 1, 31), 3)
+    assert ledger(db, subscription) == []
+
+def test_pending_subscription_renews_once_paid(db, subscription):
+    apply(db, renewal(subscription))
+    add_payment(db, subscription)
+
+    result = apply(db, renewal(subscription, expected_status='pending_payment'))
+
+    assert result['renewed'] == 1
+    assert state(db, subscription) == ('active', date(2026, 3, 2), 30)
+
+def test_unpaid_renewal_expires_after_grace_period(db, subscription):
+    apply(db, renewal(subscription))
+
+    result = apply(db, renewal(subscription, expected_status='pending_payment', expire_if_unpaid=True))
+
+    assert result['expired'] == 1
+    assert state(db, subscription) == ('expired', date(2026, 1, 31), 3)
+    assert ledger(db, subscription) == ['expired']
+
+def test_payment_pays_for_one_period_only(db, subscription):
+    add_payment(db, subscription)
+    apply(db, renewal(subscription))
+
+    # The next period comes due without a new payment
+    change = {**renewal(subscription), 'expected_end_date': '2026-03-02',
+              'start_date': '2026-03-02', 'end_date': '2026-04-01'}
+    result = apply(db, change)
+
+    assert result['pending_payment'] == 1
+    assert state(db, subscription) == ('pending_payment', date(2026, 3, 2), 30)
+
+def test_reapplying_a_chunk_changes_nothing(db, subscription):
+    add_payment(db, subscription)
+    add_payment(db, subscription)
+    apply(db, renewal(subscription))
+
+    result = apply(db, renewal(subscription))
+
+    assert result['applied'] == 0
+    assert ledger(db, subscription) == ['renewed']
+    db.execute("select count(*) from subscription_payments where applied_at is null")
+    assert db.fetchone()[0] == 1
@@ -0,0 +1,53 @@
+-- use_credits: atomically spend subscription credits and record the ledger row.
+--
+-- Called from POST /subscriptions/<id>/use-credits through PostgREST
+-- (POST /rest/v1/rpc/use_credits). The balance check and the decrement are a
+-- single conditional UPDATE, so concurrent calls queue on the row lock and
+-- re-check the balance; a subscription can never be overspent.
+--
+-- Returns {"ok": true, "remaining_credits": n} or
+--         {"ok": false, "error": "not_found" | "insufficient_credits", "remaining_credits": n}
+
+create or replace function public.use_credits(
+    p_subscription_id bigint,
+    p_order_id bigint,
+    p_credits integer
+)
+returns json
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_remaining integer;
+begin
+    if p_credits is null or p_credits <= 0 then
+        raise exception 'credits_used must be positive' using errcode = '22023';
+    end if;
+
+    update user_subscriptions
+       set remaining_credits = remaining_credits - p_credits
+     where id = p_subscription_id
+       and remaining_credits >= p_credits
+    returning remaining_credits into v_remaining;
+
+    if not found then
+        select remaining_credits into v_remaining
+          from user_subscriptions
+         where id = p_subscription_id;
+        if not found then
+            return json_build_object('ok', false, 'error', 'not_found');
+        end if;
+        return json_build_object('ok', false, 'error', 'insufficient_credits', 'remaining_credits', v_remaining);
+    end if;
+
+    insert into credit_transactions (subscription_id, order_id, credits_used, transaction_type, description)
+    values (p_subscription_id, p_order_id, p_credits, 'used',
+            format('Used %s credits for order #%s', p_credits, p_order_id));
+
+    return json_build_object('ok', true, 'remaining_credits', v_remaining);
+end;
+$$;
+
+revoke execute on function public.use_credits(bigint, bigint, integer) from public, anon, authenticated;
+grant execute on function public.use_credits(bigint, bigint, integer) to service_role;